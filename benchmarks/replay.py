@@ -0,0 +1,284 @@
+"""
+Replays recorded data through the rule evaluator to see which rules would fire.
+
+    python -m benchmarks.replay data.ndjson --rules rules.json
+    python -m benchmarks.replay payloads.ndjson --database sqlite:///./alerting.db --adapter flat
+
+Every line of the input is one JSON record: either an IngestionData record,
+evaluated for its user like POST /alert/api/v1/data/ingest, or a captured poll
+payload, evaluated for all users like the poller evaluates a fetched payload.
+Payloads may carry a "timestamp"; otherwise they are spaced --interval seconds
+apart. Cooldowns and windows run on the recorded time, not the wall clock.
+
+Rules come from a JSON file holding a list of rule bodies as accepted by the API
+(a body with an "expression" is a compound rule), or from the active rules of a
+service database. Nothing is delivered or written: the report counts how often
+each rule was violated and notified. The input is read line by line, so memory
+use does not grow with its size.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from models import AlertRuleCreate, AlertRuleModel, CompoundRuleCreate, IngestionData  # noqa: E402
+from services import json_codec  # noqa: E402
+from services.alert_state import ALERT_COOLDOWN_SECONDS, AlertStateTable  # noqa: E402
+from services.compound_rules import CachedCompoundRule, CompoundRuleIndex  # noqa: E402
+from services.evaluation import evaluate_compound, evaluate_metric  # noqa: E402
+from services.poll_sources import PAYLOAD_ADAPTERS, POLL_INTERVAL_SECONDS, realtime_values  # noqa: E402
+from services.rule_index import RuleIndex  # noqa: E402
+from services.windowed_rules import RollingWindows  # noqa: E402
+
+
+class ReplayState(AlertStateTable):
+    """
+    Alert state whose cooldowns run on the time of the record being replayed.
+    Nothing is written back to the database.
+    """
+
+    def __init__(self, cooldown=ALERT_COOLDOWN_SECONDS):
+        super().__init__(cooldown)
+        self.clock = 0.0
+
+    def filter_alerts(self, metric_type, violated_rules, user_id=None, now=None):
+        return super().filter_alerts(metric_type, violated_rules, user_id, self.clock if now is None else now)
+
+
+class RuleStats:
+    __slots__ = ("rule", "violations", "notifications", "first_notified_at", "last_notified_at")
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.violations = 0
+        self.notifications = 0
+        self.first_notified_at = None
+        self.last_notified_at = None
+
+    def as_dict(self):
+        rule = self.rule
+        return {
+            "rule_id": rule.id,
+            "user_id": rule.user_id,
+            "metric_type": rule.metric_type,
+            "condition": rule.condition,
+            "threshold_value": rule.threshold_value,
+            "violations": self.violations,
+            "notifications": self.notifications,
+            "first_notified_at": _iso(self.first_notified_at),
+            "last_notified_at": _iso(self.last_notified_at),
+        }
+
+
+class Replay:
+    """
+    Evaluates records one at a time against its own rule indexes, alert state and
+    rolling windows, keeping only per-rule counters between records.
+    """
+
+    def __init__(self, index, compound, adapter="realtime_data", interval=POLL_INTERVAL_SECONDS, cooldown=ALERT_COOLDOWN_SECONDS):
+        self.index = index
+        self.compound = compound
+        self.adapt = PAYLOAD_ADAPTERS[adapter]
+        self.interval = interval
+        self.state = ReplayState(cooldown)
+        self.windows = RollingWindows()
+        self.stats = {}
+        self.records = 0
+        self.invalid = 0
+        self.points = 0
+        self.evaluation_seconds = 0.0
+        self._clock = None
+
+    def feed(self, line):
+        try:
+            record = json_codec.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("not a JSON object")
+            if "metric_type" in record and "user_id" in record:
+                evaluate = self._data_point(IngestionData.model_validate(record))
+            else:
+                evaluate = self._payload(record)
+        except (ValueError, TypeError, AttributeError):
+            # Malformed JSON, failed validation or a payload of the wrong shape
+            self.invalid += 1
+            return
+        self.records += 1
+
+        alerts = []
+        started = time.perf_counter()
+        violated_rules = evaluate(alerts)
+        self.evaluation_seconds += time.perf_counter() - started
+        for rule in violated_rules:
+            self._stats(rule).violations += 1
+        for rule, _ in alerts:
+            stats = self._stats(rule)
+            stats.notifications += 1
+            if stats.first_notified_at is None:
+                stats.first_notified_at = self.state.clock
+            stats.last_notified_at = self.state.clock
+
+    def report(self):
+        rules = sorted(
+            (stats for stats in self.stats.values() if stats.notifications or stats.violations),
+            key=lambda stats: (-stats.notifications, -stats.violations, stats.rule.id),
+        )
+        return {
+            "records": self.records,
+            "invalid_records": self.invalid,
+            "points": self.points,
+            "evaluation_seconds": round(self.evaluation_seconds, 6),
+            "points_per_second": round(self.points / self.evaluation_seconds, 1) if self.evaluation_seconds else None,
+            "notifications": sum(stats.notifications for stats in rules),
+            "rules": [stats.as_dict() for stats in rules],
+        }
+
+    def _data_point(self, point):
+        timestamp = _timestamp(point.timestamp)
+
+        def evaluate(alerts):
+            self.state.clock = timestamp
+            self.points += 1
+            return evaluate_metric(
+                point.metric_type, point.value, timestamp, alerts, point.user_id,
+                self.index, self.state, self.windows,
+            )
+        return evaluate
+
+    def _payload(self, record):
+        recorded_at = record.pop("timestamp", None)
+        values = realtime_values(self.adapt(record))
+        if recorded_at is not None:
+            timestamp = _timestamp(recorded_at)
+        elif self._clock is None:
+            timestamp = 0.0
+        else:
+            timestamp = self._clock + self.interval
+        self._clock = timestamp
+
+        def evaluate(alerts):
+            self.state.clock = timestamp
+            self.points += len(values)
+            violated_rules = []
+            for metric_type, value in values.items():
+                violated_rules += evaluate_metric(
+                    metric_type, value, timestamp, alerts, None, self.index, self.state, self.windows,
+                )
+            if len(self.compound):
+                violated_rules += evaluate_compound(values, values, alerts, self.compound, self.state)
+            return violated_rules
+        return evaluate
+
+    def _stats(self, rule):
+        stats = self.stats.get(rule.id)
+        if stats is None:
+            stats = self.stats[rule.id] = RuleStats(rule)
+        return stats
+
+
+def _timestamp(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        # Naive timestamps are taken as UTC, like the ingestion endpoint does
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _iso(timestamp):
+    return None if timestamp is None else datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def load_rules_file(path):
+    """
+    Builds the rule indexes from a JSON list of rule bodies, numbered from 1 in
+    file order. Invalid bodies and expressions raise a ValueError.
+    """
+    with open(path, "rb") as f:
+        bodies = json_codec.loads(f.read())
+    index, compound = RuleIndex(), CompoundRuleIndex()
+    rules = []
+    for rule_id, body in enumerate(bodies, start=1):
+        if "expression" in body:
+            rule = CompoundRuleCreate.model_validate(body)
+            row = AlertRuleModel(id=rule_id, is_active=True, **rule.model_dump())
+            compound.add(CachedCompoundRule.from_model(row))
+        else:
+            rule = AlertRuleCreate.model_validate(body)
+            rules.append(AlertRuleModel(id=rule_id, is_active=True, **rule.model_dump()))
+    index.add_many(rules)
+    return index, compound
+
+
+def load_rules_database(url):
+    """
+    Builds the rule indexes from the active rules of a service database.
+    """
+    engine = create_engine(url)
+    db = sessionmaker(bind=engine)()
+    try:
+        index, compound = RuleIndex(), CompoundRuleIndex()
+        index.load(db)
+        compound.load(db)
+    finally:
+        db.close()
+        engine.dispose()
+    return index, compound
+
+
+def replay(lines, replay_run):
+    for line in lines:
+        if line.strip():
+            replay_run.feed(line)
+    return replay_run.report()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded NDJSON data through the rule evaluator.")
+    parser.add_argument("input", help="NDJSON file of data points or poll payloads; - reads stdin.")
+    rules = parser.add_mutually_exclusive_group(required=True)
+    rules.add_argument("--rules", help="JSON file with a list of rule bodies.")
+    rules.add_argument("--database", help="Database URL to read the active rules from, e.g. sqlite:///./alerting.db.")
+    parser.add_argument("--adapter", default="realtime_data", choices=sorted(PAYLOAD_ADAPTERS), help="Shape of the poll payloads.")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL_SECONDS, help="Seconds between payloads without a timestamp.")
+    parser.add_argument("--cooldown", type=float, default=ALERT_COOLDOWN_SECONDS, help="Seconds before a firing rule is notified again.")
+    parser.add_argument("--top", type=int, default=20, help="Rules to print, most notified first.")
+    parser.add_argument("--output", help="Also write the full report as JSON to this file.")
+    args = parser.parse_args(argv)
+
+    index, compound = load_rules_file(args.rules) if args.rules else load_rules_database(args.database)
+    replay_run = Replay(index, compound, args.adapter, args.interval, args.cooldown)
+    if args.input == "-":
+        report = replay(sys.stdin.buffer, replay_run)
+    else:
+        with open(args.input, "rb") as lines:
+            report = replay(lines, replay_run)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print(
+        f"{report['records']} records ({report['invalid_records']} invalid), {report['points']} points, "
+        f"{report['points_per_second']} points/s evaluated, {report['notifications']} notifications"
+    )
+    for rule in report["rules"][:args.top]:
+        print(
+            f"rule {rule['rule_id']:<8} {rule['user_id']:<20} {rule['metric_type']:<24} "
+            f"{rule['notifications']:>8} notified {rule['violations']:>10} violated"
+        )
+    if args.output:
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Offline benchmark suite for the alerting service.
+
+    python -m benchmarks.run --output benchmark_results.json
+
+Everything runs in-process against a throwaway SQLite file: the ASGI app is
+driven through httpx.ASGITransport, Kostal and Fronius are replaced by
+httpx.MockTransport stand-ins and Resend by a stub with a fixed latency.
+Results are written as JSON so runs from different commits can be compared.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Configure the service before any of its modules are imported
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/benchmark.db"
+os.environ.setdefault("RESEND_API_KEY", "benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from main import app  # noqa: E402
+from models import AlertDeliveryJobModel, AlertRuleModel, AlertStateModel  # noqa: E402
+from services.alert_delivery import AlertDeliveryService  # noqa: E402
+from services.alert_state import alert_state  # noqa: E402
+from services.data_poller import PollState, evaluate_source_payload, fetch_data, process_inverter_data  # noqa: E402
+from services.delivery_queue import DeliveryQueue  # noqa: E402
+from services.rule_index import rule_index  # noqa: E402
+
+METRICS = ["battery_capacity", "grid_power", "pv_power", "temperature", "home_consumption"]
+CONDITIONS = ["LESS_THAN", "GREATER_THAN", "EQUALS"]
+
+
+class NullQueue:
+    """Delivery queue stand-in that only counts enqueued alerts."""
+
+    def __init__(self):
+        self.enqueued = 0
+
+    async def enqueue_many(self, alerts):
+        self.enqueued += len(alerts)
+
+
+class StubResend:
+    """Resend SDK stand-in whose sends block for a fixed time, like a network call."""
+
+    def __init__(self, latency):
+        self.calls = 0
+        self.Emails = SimpleNamespace(send=self._send)
+        self.Batch = SimpleNamespace(send=self._send)
+        self._latency = latency
+
+    def _send(self, params):
+        self.calls += 1
+        time.sleep(self._latency)
+        return {"id": f"stub-{self.calls}"}
+
+
+def threshold(rng, condition):
+    # Values are drawn from 0..10000, so roughly 5% of the samples breach any one rule
+    if condition == "LESS_THAN":
+        return float(rng.randint(0, 1000))
+    if condition == "GREATER_THAN":
+        return float(rng.randint(9000, 10000))
+    return float(rng.randint(0, 10000))
+
+
+def reset_database(rule_count, seed=0):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    rows = [
+        {
+            "user_id": f"user{i % 1000}",
+            "metric_type": METRICS[i % len(METRICS)],
+            "threshold_value": threshold(rng, CONDITIONS[i % len(CONDITIONS)]),
+            "condition": CONDITIONS[i % len(CONDITIONS)],
+            "is_active": True,
+            "delivery_channel": "EMAIL",
+        }
+        for i in range(rule_count)
+    ]
+    with engine.begin() as connection:
+        if rows:
+            connection.execute(AlertRuleModel.__table__.insert(), rows)
+    db = SessionLocal()
+    try:
+        rule_index.load(db)
+    finally:
+        db.close()
+    alert_state.clear()
+
+
+def summarize(name, params, latencies, total_seconds):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "name": name,
+        "params": params,
+        "operations": count,
+        "total_seconds": round(total_seconds, 6),
+        "ops_per_second": round(count / total_seconds, 2) if total_seconds else None,
+        "p50_ms": round(statistics.median(latencies) * 1000, 4),
+        "p99_ms": round(latencies[min(int(count * 0.99), count - 1)] * 1000, 4),
+    }
+
+
+async def timed(operation, iterations):
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        op_started = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - op_started)
+    return latencies, time.perf_counter() - started
+
+
+def asgi_client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+
+async def bench_ingest(rule_count, requests):
+    reset_database(rule_count)
+    rng = random.Random(1)
+
+    async with asgi_client() as client:
+        async def ingest(i):
+            response = await client.post("/alert/api/v1/data/ingest", json={
+                "user_id": f"user{i % 1000}",
+                "metric_type": METRICS[i % len(METRICS)],
+                "value": float(rng.randint(0, 10000)),
+                "timestamp": "2025-11-24T10:00:00Z",
+            })
+            response.raise_for_status()
+
+        latencies, total = await timed(ingest, requests)
+    return summarize("ingest_data", {"rules": rule_count}, latencies, total)
+
+
+async def bench_ingest_batch(rule_count, batches, batch_size):
+    reset_database(rule_count)
+    rng = random.Random(2)
+
+    async with asgi_client() as client:
+        async def ingest_batch(i):
+            body = "\n".join(json.dumps({
+                "user_id": f"user{(i * batch_size + j) % 1000}",
+                "metric_type": METRICS[j % len(METRICS)],
+                "value": float(rng.randint(0, 10000)),
+                "timestamp": "2025-11-24T10:00:00Z",
+            }) for j in range(batch_size))
+            response = await client.post(
+                "/alert/api/v1/data/ingest/batch",
+                content=body,
+                headers={"Content-Type": "application/x-ndjson"},
+            )
+            response.raise_for_status()
+
+        latencies, total = await timed(ingest_batch, batches)
+    result = summarize("ingest_data_batch", {"rules": rule_count, "batch_size": batch_size}, latencies, total)
+    result["points_per_second"] = round(batches * batch_size / total, 2)
+    return result
+
+
+def realtime_payload(rng, metric_count):
+    return {"realtime_data": {
+        (METRICS[i] if i < len(METRICS) else f"metric_{i}"): {"value": rng.randint(0, 10000)}
+        for i in range(metric_count)
+    }}
+
+
+async def bench_process_inverter_data(rule_count, payloads, metric_count):
+    reset_database(rule_count)
+    rng = random.Random(3)
+    queue = NullQueue()
+    data = [realtime_payload(rng, metric_count) for _ in range(payloads)]
+
+    async def process(i):
+        await process_inverter_data(data[i], queue)
+
+    latencies, total = await timed(process, payloads)
+    result = summarize("process_inverter_data", {"rules": rule_count, "metrics": metric_count}, latencies, total)
+    result["alerts_enqueued"] = queue.enqueued
+    return result
+
+
+async def bench_poll_cycle(rule_count, cycles):
+    """
+    Fetch and evaluate through local Kostal and Fronius stand-ins. Every other
+    response repeats the previous body to exercise the unchanged-payload path.
+    """
+    reset_database(rule_count)
+    rng = random.Random(4)
+    bodies = [json.dumps(realtime_payload(rng, len(METRICS))).encode() for _ in range(cycles)]
+    current = {"body": bodies[0]}
+
+    def stand_in(request):
+        return httpx.Response(200, content=current["body"])
+
+    states = {"Kostal": PollState(), "Fronius": PollState()}
+    async with httpx.AsyncClient(transport=httpx.MockTransport(stand_in)) as client:
+        async def cycle(i):
+            current["body"] = bodies[i // 2]
+            for name, state in states.items():
+                data = await fetch_data(client, f"http://{name.lower()}-ms/realtimedata", name, state=state)
+                if data:
+                    state.payload = data
+                if data or state.not_modified:
+                    await evaluate_source_payload(state)
+
+        with patch("services.data_poller.delivery_queue", NullQueue()):
+            latencies, total = await timed(cycle, cycles)
+    return summarize("poll_cycle", {"rules": rule_count, "sources": len(states)}, latencies, total)
+
+
+async def bench_rule_crud(operations):
+    reset_database(0)
+
+    async with asgi_client() as client:
+        created = []
+
+        async def create(i):
+            response = await client.post("/alert/api/v1/rules", json={
+                "user_id": f"user{i % 10}",
+                "metric_type": METRICS[i % len(METRICS)],
+                "threshold_value": float(i),
+                "condition": CONDITIONS[i % len(CONDITIONS)],
+                "delivery_channel": "EMAIL",
+            })
+            response.raise_for_status()
+            created.append(response.json()["id"])
+
+        async def read(i):
+            (await client.get(f"/alert/api/v1/rules/user{i % 10}")).raise_for_status()
+
+        async def delete(i):
+            (await client.delete(f"/alert/api/v1/rules/{created[i]}")).raise_for_status()
+
+        results = []
+        for name, operation in (("create", create), ("list", read), ("delete", delete)):
+            latencies, total = await timed(operation, operations)
+            results.append(summarize(f"rule_{name}", {}, latencies, total))
+    return results
+
+
+async def bench_delivery_fanout(alerts, recipients, workers, latency):
+    reset_database(0)
+    db = SessionLocal()
+    try:
+        db.query(AlertDeliveryJobModel).delete()
+        db.query(AlertStateModel).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    stub = StubResend(latency)
+    queue = DeliveryQueue(AlertDeliveryService(), workers=workers, digest_window=0)
+    rules = [
+        SimpleNamespace(
+            id=i, user_id=f"user{i % recipients}@example.com", metric_type="battery_capacity",
+            threshold_value=20.0, condition="LESS_THAN", delivery_channel="EMAIL",
+        )
+        for i in range(alerts)
+    ]
+    with patch("services.alert_delivery.resend", stub):
+        try:
+            started = time.perf_counter()
+            await queue.enqueue_many([(rule, 10.0) for rule in rules])
+            await queue.start()
+            while await queue.pending_count():
+                await asyncio.sleep(0.01)
+            total = time.perf_counter() - started
+        finally:
+            await queue.stop()
+
+    return {
+        "name": "delivery_fanout",
+        "params": {"alerts": alerts, "recipients": recipients, "workers": workers, "send_latency_ms": latency * 1000},
+        "operations": alerts,
+        "total_seconds": round(total, 6),
+        "ops_per_second": round(alerts / total, 2),
+        "resend_calls": stub.calls,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    rule_counts = [int(count) for count in args.rule_counts.split(",")]
+    scale = 0.1 if args.quick else 1.0
+    results = []
+    for rule_count in rule_counts:
+        results.append(await bench_ingest(rule_count, int(2000 * scale)))
+        results.append(await bench_ingest_batch(rule_count, int(20 * scale) or 1, 500))
+        results.append(await bench_process_inverter_data(rule_count, int(2000 * scale), 50))
+        results.append(await bench_poll_cycle(rule_count, int(500 * scale)))
+    results.extend(await bench_rule_crud(int(300 * scale)))
+    results.append(await bench_delivery_fanout(int(1000 * scale), 50, 4, 0.02))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the alerting service benchmarks.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--rule-counts", default="10,1000,100000", help="Comma-separated active rule counts.")
+    parser.add_argument("--quick", action="store_true", help="Run a tenth of the iterations.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for result in results:
+        print(f"{result['name']:<24} {json.dumps(result['params']):<48} {result['ops_per_second']:>12} ops/s")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,81 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 
+import logging
 import os
 
+logger = logging.getLogger("uvicorn.info")
+
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./alerting.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# "production" tunes SQLite for concurrent readers and a steady write load,
+# "default" leaves every pragma at SQLite's own default.
+STORAGE_PROFILE = os.getenv("STORAGE_PROFILE", "production")
+
+STORAGE_PROFILES = {
+    "default": {},
+    "production": {
+        # Readers no longer block on writers (and vice versa)
+        "journal_mode": "WAL",
+        # Durable across application crashes; only an OS crash may lose the last commits
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        # Negative values are KiB: 64 MiB page cache per connection
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+_PRAGMA_OVERRIDES = {
+    "journal_mode": "SQLITE_JOURNAL_MODE",
+    "synchronous": "SQLITE_SYNCHRONOUS",
+    "mmap_size": "SQLITE_MMAP_SIZE",
+    "cache_size": "SQLITE_CACHE_SIZE",
+    "busy_timeout": "SQLITE_BUSY_TIMEOUT_MS",
+}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+
+def storage_pragmas(profile=STORAGE_PROFILE):
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Unknown STORAGE_PROFILE '{profile}'")
+    pragmas = dict(STORAGE_PROFILES[profile])
+    for pragma, variable in _PRAGMA_OVERRIDES.items():
+        if os.getenv(variable):
+            pragmas[pragma] = os.getenv(variable)
+    return pragmas
+
+
+def create_storage_engine(url=SQLALCHEMY_DATABASE_URL, profile=STORAGE_PROFILE):
+    """
+    Creates the engine for url; SQLite connections get the profile's pragmas on connect.
+    """
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+
+    kwargs = {"connect_args": {"check_same_thread": False}}
+    if ":memory:" not in url:
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    sqlite_engine = create_engine(url, **kwargs)
+
+    pragmas = storage_pragmas(profile)
+    if pragmas:
+        @event.listens_for(sqlite_engine, "connect")
+        def apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in pragmas.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+            cursor.close()
+
+    return sqlite_engine
+
+
+engine = create_storage_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -20,3 +87,68 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def run_with_session(fn, *args):
+    """
+    Runs fn(db, *args) with its own session on a worker thread, so blocking
+    SQLite I/O never stalls the event loop.
+    """
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    return await run_in_threadpool(call)
+
+
+# Indexes made redundant by a composite index starting with the same column
+SUPERSEDED_INDEXES = {
+    "alert_rules": ("ix_alert_rules_user_id",),
+}
+
+
+def migrate(bind=None):
+    """
+    Brings an existing database up to the current models: creates missing tables,
+    adds missing columns to existing tables, creates missing indexes and drops the
+    superseded ones. Safe to run on every startup; no data is dropped or rewritten.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column.type.compile(dialect=bind.dialect)}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = "'" + default.replace("'", "''") + "'"
+                    ddl += f" DEFAULT {default}"
+                connection.execute(text(ddl))
+                logger.info(f"Migrated {table.name}: added column {column.name}")
+
+    # New tables come with their indexes; existing ones only get the missing indexes
+    Base.metadata.create_all(bind=bind)
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index["name"] for index in inspect(bind).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=bind)
+                logger.info(f"Migrated {table.name}: created index {index.name}")
+        for name in SUPERSEDED_INDEXES.get(table.name, ()):
+            if name in existing_indexes:
+                with bind.begin() as connection:
+                    connection.execute(text(f'DROP INDEX "{name}"'))
+                logger.info(f"Migrated {table.name}: dropped index {name}")
@@ -1,24 +1,91 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from database import engine, Base
-from routers import alert_rules, ingestion
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from database import migrate, run_with_session
+from routers import alert_rules, dashboard, history, ingestion, metrics
 import asyncio
-from services.data_poller import poll_data_services
+from services.data_poller import create_poll_client, poll_data_services
+from services.poll_sources import load_poll_sources
+from services.alert_history import alert_history
+from services.alert_state import alert_state
+from services.compound_rules import compound_index
+from services.coordination import coordinator
+from services.delivery_queue import delivery_queue
+from services.ingest_pipeline import ingest_pipeline
+from services.json_codec import FastJSONResponse
+from services.log_config import configure_logging, stop_logging
+from services.rule_index import rule_index
+from services.sharded_evaluation import sharded_evaluator
+
+
+def _migrate(db):
+    # Uses the session's engine, so the schema check covers the database actually in use
+    migrate(db.get_bind())
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Checks the schema, warms the rule index and starts the background services
+    before the first request is served. /alert/ready reports ready only after that.
+    Invalid poll source configuration fails startup.
+    """
+    app.state.ready = False
+    # Parsed before anything is started, so nothing is left running when it fails
+    poll_sources = load_poll_sources()
+    configure_logging()
+    await run_with_session(_migrate)
+    await run_with_session(rule_index.load)
+    await run_with_session(compound_index.load)
+    rule_index.warm()
+    await delivery_queue.sender.warm_up()
+
+    await alert_state.start()
+    await alert_history.start()
+    await delivery_queue.start()
+    await coordinator.start()
+    poll_client = create_poll_client()
+    poller = asyncio.create_task(poll_data_services(poll_client, poll_sources))
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        await poll_client.aclose()
+        sharded_evaluator.stop()
+        # Batches still being evaluated store their alerts before the delivery queue stops
+        await ingest_pipeline.stop()
+        await coordinator.stop()
+        await delivery_queue.stop()
+        await alert_history.stop()
+        await alert_state.stop()
+        stop_logging()
 
-Base.metadata.create_all(bind=engine)
 
 app = FastAPI(
     title="VoltCast Notification & Alerting Service",
     description="A microservice for managing alert rules and triggering notifications.",
     version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse,
 )
 
 app.include_router(alert_rules.router)
 app.include_router(ingestion.router)
+app.include_router(metrics.router)
+app.include_router(dashboard.router)
+app.include_router(history.router)
 
-@app.on_event("startup")
-async def startup_event():
-    asyncio.create_task(poll_data_services())
+
+@app.get("/alert/ready")
+def read_ready(request: Request):
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
 
 
 @app.get("/alert/hello")
@@ -27,4 +94,4 @@ def read_root():
 
 @app.get("/alert")
 def read_root():
-    return {"message": "Welcome to the VoltCast Notification & Alerting Service"}
\ No newline at end of file
+    return {"message": "Welcome to the VoltCast Notification & Alerting Service"}
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean
-from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Column, Integer, String, Float, Boolean, Index, text
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import List, Optional, Union
 from datetime import datetime
 from enum import Enum
 
@@ -10,21 +11,143 @@ class Condition(str, Enum):
     GREATER_THAN = "GREATER_THAN"
     EQUALS = "EQUALS"
 
+class Aggregation(str, Enum):
+    # The condition is applied to...
+    VALUE = "VALUE"  # each sample on its own
+    AVG = "AVG"  # the mean over the window
+    MIN = "MIN"  # the smallest value in the window
+    MAX = "MAX"  # the largest value in the window
+    SUSTAINED = "SUSTAINED"  # every value for the whole window
+    RATE_OF_CHANGE = "RATE_OF_CHANGE"  # the change per minute across the window
+
 class DeliveryChannel(str, Enum):
     EMAIL = "EMAIL"
     DASHBOARD = "DASHBOARD"
     SMS = "SMS"
 
+class DeliveryStatus(str, Enum):
+    PENDING = "PENDING"
+    IN_PROGRESS = "IN_PROGRESS"
+    DEAD = "DEAD"
+
 class AlertRuleModel(Base):
     __tablename__ = "alert_rules"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, index=True)
+    # Lookups by user go through ix_alert_rules_user_metric_active, which starts with user_id
+    user_id = Column(String)
     metric_type = Column(String)
     threshold_value = Column(Float)
     condition = Column(String)
     is_active = Column(Boolean, default=True)
     delivery_channel = Column(String)
+    aggregation = Column(String, default=Aggregation.VALUE.value, server_default=Aggregation.VALUE.value)
+    # Window of every aggregation but VALUE
+    window_seconds = Column(Float, nullable=True)
+    # Condition of a compound rule over several metrics; NULL for threshold rules
+    expression = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Per-user lookups, optionally narrowed to one metric
+        Index("ix_alert_rules_user_metric_active", "user_id", "metric_type", "is_active"),
+        # Active rules of one metric, as loaded by the evaluation paths
+        Index("ix_alert_rules_metric_active", "metric_type", sqlite_where=text("is_active = 1")),
+    )
+
+class AlertDeliveryJobModel(Base):
+    """
+    A pending alert notification. Rows are deleted once delivered; jobs that
+    exhaust their attempts stay behind in the DEAD state.
+    """
+    __tablename__ = "alert_delivery_jobs"
+    __table_args__ = (Index("ix_alert_delivery_jobs_status_due", "status", "next_attempt_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_id = Column(Integer)
+    user_id = Column(String)
+    metric_type = Column(String)
+    threshold_value = Column(Float)
+    condition = Column(String)
+    delivery_channel = Column(String)
+    actual_value = Column(Float)
+    status = Column(String, default=DeliveryStatus.PENDING.value)
+    attempts = Column(Integer, default=0)
+    # Unix timestamps; for IN_PROGRESS jobs this is when the claim expires
+    next_attempt_at = Column(Float)
+    created_at = Column(Float)
+    claimed_by = Column(String, nullable=True)
+    last_error = Column(String, nullable=True)
+
+class AlertStateModel(Base):
+    """
+    Notification state of a rule that is currently firing. Resolved rules have no row.
+    """
+    __tablename__ = "alert_states"
+
+    rule_id = Column(Integer, primary_key=True)
+    metric_type = Column(String)
+    user_id = Column(String)
+    # Unix timestamp of the last notification sent for this rule
+    last_sent_at = Column(Float)
+
+class AlertHistoryModel(Base):
+    """
+    One notified alert. Rows are appended in batches and never updated; retention
+    deletes whole buckets, so old history goes with one indexed range delete.
+    """
+    __tablename__ = "alert_history"
+
+    id = Column(Integer, primary_key=True)
+    # fired_at // ALERT_HISTORY_BUCKET_SECONDS
+    bucket = Column(Integer, index=True)
+    fired_at = Column(Float)
+    rule_id = Column(Integer)
+    user_id = Column(String)
+    metric_type = Column(String)
+    actual_value = Column(Float)
+    threshold_value = Column(Float)
+    condition = Column(String)
+    delivery_channel = Column(String)
+
+    __table_args__ = (
+        Index("ix_alert_history_user_fired", "user_id", "fired_at"),
+        Index("ix_alert_history_user_metric_fired", "user_id", "metric_type", "fired_at"),
+    )
+
+class CoordinationLeaseModel(Base):
+    """
+    A named lease held by one worker process until expires_at (unix time), e.g.
+    the right to poll one source. Holders renew it; anyone may take an expired one.
+    """
+    __tablename__ = "coordination_leases"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=True)
+    expires_at = Column(Float)
+
+class DashboardEventModel(Base):
+    """
+    A DASHBOARD alert handed from the worker that delivered it to every worker, so
+    clients connected to any of them receive it. Rows are pruned after a short while.
+    """
+    __tablename__ = "dashboard_events"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String)
+    rule_id = Column(Integer)
+    # The rendered event as JSON
+    payload = Column(String)
+    created_at = Column(Float, index=True)
+
+class RuleVersionModel(Base):
+    """
+    Counter bumped in every transaction that changes alert_rules, so workers can
+    tell when their in-memory rule index is stale.
+    """
+    __tablename__ = "rule_versions"
+
+    name = Column(String, primary_key=True)
+    version = Column(Integer)
 
 class AlertRuleBase(BaseModel):
     user_id: str
@@ -32,6 +155,16 @@ class AlertRuleBase(BaseModel):
     threshold_value: float
     condition: Condition
     delivery_channel: DeliveryChannel
+    aggregation: Aggregation = Aggregation.VALUE
+    window_seconds: Optional[float] = Field(default=None, gt=0)
+
+    @model_validator(mode="after")
+    def check_window(self):
+        if self.aggregation == Aggregation.VALUE:
+            self.window_seconds = None
+        elif self.window_seconds is None:
+            raise ValueError(f"window_seconds is required for {self.aggregation.value} rules")
+        return self
 
 class AlertRuleCreate(AlertRuleBase):
     pass
@@ -42,6 +175,33 @@ class AlertRule(AlertRuleBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+class CompoundRuleCreate(BaseModel):
+    user_id: str
+    # e.g. "battery_soc < 20 AND grid_power > 3000"
+    expression: str = Field(min_length=1, max_length=1000)
+    delivery_channel: DeliveryChannel
+
+class CompoundRule(CompoundRuleCreate):
+    id: int
+    # Referenced metrics, in order of appearance
+    metrics: List[str]
+    is_active: bool
+
+class AlertRuleDeactivate(BaseModel):
+    rule_ids: List[int]
+
+class AlertHistoryEntry(BaseModel):
+    id: int
+    rule_id: int
+    user_id: str
+    metric_type: str
+    actual_value: float
+    # None, and the expression as condition, for compound rules
+    threshold_value: Optional[float] = None
+    condition: Union[Condition, str]
+    delivery_channel: DeliveryChannel
+    fired_at: datetime
+
 class IngestionData(BaseModel):
     user_id: str
     metric_type: str
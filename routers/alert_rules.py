@@ -1,30 +1,172 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from models import AlertRuleCreate, AlertRule, AlertRuleModel
+from models import (
+    AlertRuleCreate, AlertRule, AlertRuleDeactivate, AlertRuleModel, CompoundRule, CompoundRuleCreate, DeliveryChannel,
+)
 from database import get_db
+from services.compound_rules import (
+    COMPOUND_CONDITION, CachedCompoundRule, compile_expression, compound_index, scope_key,
+)
+from services.coordination import coordinator
+from services.json_codec import FastJSONResponse
+from services.rule_index import rule_index
+
+logger = logging.getLogger("uvicorn.info")
 
 router = APIRouter()
 
+RULES_BULK_MAX_ITEMS = int(os.getenv("RULES_BULK_MAX_ITEMS", "1000"))
+RULES_PAGE_MAX_LIMIT = 1000
+# Page size when only after_id is given
+RULES_PAGE_DEFAULT_LIMIT = 100
+
+# The AlertRule fields, read as plain column values for listing rules
+_RULE_COLUMNS = tuple(getattr(AlertRuleModel, field) for field in AlertRule.model_fields)
+
+
+def _check_bulk_size(count):
+    if count > RULES_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Bulk limit of {RULES_BULK_MAX_ITEMS} rules exceeded")
+
 
 @router.post("/alert/api/v1/rules", response_model=AlertRule)
 def create_rule(rule: AlertRuleCreate, db: Session = Depends(get_db)):
     db_rule = AlertRuleModel(**rule.model_dump())
     db.add(db_rule)
+    version = coordinator.bump_rules_version(db)
     db.commit()
     db.refresh(db_rule)
+    rule_index.add(db_rule)
+    coordinator.rules_changed_locally(version)
     return db_rule
 
 
+@router.post("/alert/api/v1/rules/bulk", response_model=List[AlertRule])
+def create_rules(rules: List[AlertRuleCreate], db: Session = Depends(get_db)):
+    """
+    Creates all rules in a single transaction; either every rule is stored or none.
+    """
+    _check_bulk_size(len(rules))
+    db_rules = [AlertRuleModel(**rule.model_dump()) for rule in rules]
+    db.add_all(db_rules)
+    db.flush()
+    # Captured before the commit expires the rows, so no per-row refresh is needed
+    created = [AlertRule.model_validate(db_rule) for db_rule in db_rules]
+    version = coordinator.bump_rules_version(db)
+    db.commit()
+    rule_index.add_many(created)
+    coordinator.rules_changed_locally(version)
+    return created
+
+
+@router.post("/alert/api/v1/rules/compound", response_model=CompoundRule)
+def create_compound_rule(rule: CompoundRuleCreate, db: Session = Depends(get_db)):
+    """
+    Creates a rule over several metrics of one payload. The expression is compiled
+    here, so an invalid one is rejected with a 422 and never stored.
+    """
+    try:
+        compiled = compile_expression(rule.expression)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    db_rule = AlertRuleModel(
+        user_id=rule.user_id,
+        metric_type=scope_key(compiled.metrics),
+        condition=COMPOUND_CONDITION,
+        delivery_channel=rule.delivery_channel.value,
+        expression=rule.expression,
+    )
+    db.add(db_rule)
+    version = coordinator.bump_rules_version(db)
+    db.commit()
+    db.refresh(db_rule)
+    compound_index.add(CachedCompoundRule.from_model(db_rule, compiled))
+    coordinator.rules_changed_locally(version)
+    return _compound_rule(db_rule, compiled.metrics)
+
+
+@router.get("/alert/api/v1/rules/compound/{user_id}", response_model=List[CompoundRule])
+def get_compound_rules_for_user(user_id: str, db: Session = Depends(get_db)):
+    """
+    Lists active compound rules. Their metrics come from the compiled rules in
+    compound_index; a rule not indexed yet is compiled, and skipped like
+    compound_index.load skips it when its expression does not compile.
+    """
+    rules = db.query(AlertRuleModel).filter(
+        AlertRuleModel.user_id == user_id, AlertRuleModel.is_active, AlertRuleModel.expression.isnot(None),
+    ).order_by(AlertRuleModel.id).all()
+    listed = []
+    for rule in rules:
+        cached = compound_index.get(rule.id)
+        if cached is not None and cached.condition == rule.expression:
+            metrics = cached.metrics
+        else:
+            try:
+                metrics = compile_expression(rule.expression).metrics
+            except ValueError as e:
+                logger.error(f"Skipping compound rule {rule.id}: {e}")
+                continue
+        listed.append(_compound_rule(rule, metrics))
+    return listed
+
+
+def _compound_rule(db_rule, metrics):
+    return CompoundRule(
+        id=db_rule.id,
+        user_id=db_rule.user_id,
+        expression=db_rule.expression,
+        delivery_channel=db_rule.delivery_channel,
+        metrics=list(metrics),
+        is_active=db_rule.is_active,
+    )
+
+
 @router.get("/alert/api/v1/rules/{user_id}", response_model=List[AlertRule])
-def get_rules_for_user(user_id: str, db: Session = Depends(get_db)):
-    rules = (
-        db.query(AlertRuleModel)
-        .filter(AlertRuleModel.user_id == user_id, AlertRuleModel.is_active)
-        .all()
+def get_rules_for_user(
+    user_id: str,
+    metric_type: Optional[str] = None,
+    delivery_channel: Optional[DeliveryChannel] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=RULES_PAGE_MAX_LIMIT),
+    db: Session = Depends(get_db),
+):
+    """
+    Lists active threshold rules ordered by id; compound rules are listed
+    separately. Without limit and after_id every rule is returned. Pages are
+    opt-in: when more rules follow a page, the X-Next-After-Id header holds the
+    after_id for the next one.
+
+    Rows are read as plain column tuples and encoded directly, without building
+    ORM objects or validating them against response_model.
+    """
+    query = db.query(*_RULE_COLUMNS).filter(
+        AlertRuleModel.user_id == user_id, AlertRuleModel.is_active, AlertRuleModel.expression.is_(None),
     )
-    return rules
+    if metric_type is not None:
+        query = query.filter(AlertRuleModel.metric_type == metric_type)
+    if delivery_channel is not None:
+        query = query.filter(AlertRuleModel.delivery_channel == delivery_channel.value)
+    if after_id is not None:
+        query = query.filter(AlertRuleModel.id > after_id)
+
+    query = query.order_by(AlertRuleModel.id)
+    if limit is None and after_id is None:
+        rows = query.all()
+        return FastJSONResponse([dict(zip(AlertRule.model_fields.keys(), row)) for row in rows])
+
+    limit = limit or RULES_PAGE_DEFAULT_LIMIT
+    rows = query.limit(limit + 1).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-After-Id"] = str(rows[-1].id)
+    fields = AlertRule.model_fields.keys()
+    return FastJSONResponse([dict(zip(fields, row)) for row in rows], headers=headers)
 
 
 @router.delete("/alert/api/v1/rules/{rule_id}")
@@ -33,5 +175,37 @@ def delete_rule(rule_id: int, db: Session = Depends(get_db)):
     if db_rule is None:
         raise HTTPException(status_code=404, detail="Rule not found")
     db_rule.is_active = False
+    version = coordinator.bump_rules_version(db)
     db.commit()
+    rule_index.remove(rule_id)
+    compound_index.remove(rule_id)
+    coordinator.rules_changed_locally(version)
     return {"message": "Rule deactivated"}
+
+
+@router.post("/alert/api/v1/rules/bulk/deactivate")
+def delete_rules(request: AlertRuleDeactivate, db: Session = Depends(get_db)):
+    """
+    Deactivates the given rules with a single UPDATE. Unknown ids are reported
+    back, and rules that were already inactive are listed separately.
+    """
+    rule_ids = list(dict.fromkeys(request.rule_ids))
+    _check_bulk_size(len(rule_ids))
+    active = {}
+    for rule_id, is_active in db.query(AlertRuleModel.id, AlertRuleModel.is_active).filter(AlertRuleModel.id.in_(rule_ids)):
+        active[rule_id] = is_active
+    found = {rule_id for rule_id, is_active in active.items() if is_active}
+    if found:
+        db.query(AlertRuleModel).filter(AlertRuleModel.id.in_(found)).update(
+            {AlertRuleModel.is_active: False}, synchronize_session=False
+        )
+        version = coordinator.bump_rules_version(db)
+        db.commit()
+        rule_index.remove_many(found)
+        compound_index.remove_many(found)
+        coordinator.rules_changed_locally(version)
+    return {
+        "deactivated": len(found),
+        "already_inactive": [rule_id for rule_id in rule_ids if active.get(rule_id) is False],
+        "not_found": [rule_id for rule_id in rule_ids if rule_id not in active],
+    }
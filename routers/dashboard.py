@@ -0,0 +1,53 @@
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from services import json_codec
+from services.dashboard_stream import dashboard_broker
+
+router = APIRouter()
+
+# Comment lines sent on idle streams so proxies keep the connection open
+DASHBOARD_KEEPALIVE_SECONDS = float(os.getenv("DASHBOARD_KEEPALIVE_SECONDS", "15"))
+
+
+async def sse_events(subscription, keepalive=DASHBOARD_KEEPALIVE_SECONDS):
+    """
+    Formats a subscription as Server-Sent Events: one "alert" event per message,
+    a "dropped" event when messages were lost to a full buffer.
+    """
+    yield "retry: 5000\n\n"
+    reported_dropped = 0
+    while True:
+        messages = await subscription.get(keepalive)
+        if subscription.dropped > reported_dropped:
+            yield f"event: dropped\ndata: {_json({'dropped': subscription.dropped - reported_dropped})}\n\n"
+            reported_dropped = subscription.dropped
+        if not messages:
+            yield ": keepalive\n\n"
+            continue
+        for message in messages:
+            yield f"event: alert\ndata: {_json(message)}\n\n"
+
+
+def _json(obj):
+    return json_codec.dumps(obj).decode("utf-8")
+
+
+@router.get("/alert/api/v1/stream/{user_id}")
+async def stream_alerts(user_id: str):
+    async def events():
+        subscription = dashboard_broker.subscribe(user_id)
+        try:
+            async for event in sse_events(subscription):
+                yield event
+        finally:
+            # Runs when the client disconnects and the response task is cancelled
+            dashboard_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Query
+
+from database import run_with_session
+from models import AlertHistoryEntry
+from services.alert_history import query_history
+
+router = APIRouter()
+
+ALERT_HISTORY_PAGE_MAX_LIMIT = 1000
+
+
+def _to_entry(row):
+    return AlertHistoryEntry(
+        id=row.id,
+        rule_id=row.rule_id,
+        user_id=row.user_id,
+        metric_type=row.metric_type,
+        actual_value=row.actual_value,
+        threshold_value=row.threshold_value,
+        condition=row.condition,
+        delivery_channel=row.delivery_channel,
+        fired_at=datetime.fromtimestamp(row.fired_at, timezone.utc),
+    )
+
+
+@router.get("/alert/api/v1/alerts/{user_id}", response_model=List[AlertHistoryEntry])
+async def get_alert_history(
+    user_id: str,
+    metric_type: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=ALERT_HISTORY_PAGE_MAX_LIMIT),
+):
+    """
+    Lists the user's notified alerts, newest first. Alerts show up here within
+    ALERT_HISTORY_FLUSH_SECONDS of firing.
+    """
+    rows = await run_with_session(
+        query_history,
+        user_id,
+        metric_type,
+        _timestamp(since),
+        _timestamp(until),
+        limit,
+    )
+    return [_to_entry(row) for row in rows]
+
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # Naive times are taken as UTC, like the ingestion timestamps
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
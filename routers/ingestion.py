@@ -1,47 +1,238 @@
-from fastapi import APIRouter, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import timezone
 
-from models import IngestionData, AlertRuleModel, Condition
-from database import get_db
-from services.alert_delivery import AlertDeliveryService
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from models import IngestionData
+from services import json_codec
+from services.admission import Overloaded, ingest_admission, retry_after_header, user_rate_limiter
+from services.delivery_queue import delivery_queue
+from services.evaluation import evaluate_metric, rollback_alerts
+from services.ingest_pipeline import ingest_pipeline
+from services.metrics import INGEST_LATENCY, INGEST_REJECTED, INGEST_REQUESTS, RULE_EVALUATION_LATENCY
+from services.rule_index import rule_index
 
 router = APIRouter()
-alert_delivery_service = AlertDeliveryService()
-
-
-@router.post("/alert/api/v1/data/ingest")
-async def ingest_data(
-    data: IngestionData,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-):
-    rules = (
-        db.query(AlertRuleModel)
-        .filter(
-            AlertRuleModel.user_id == data.user_id,
-            AlertRuleModel.metric_type == data.metric_type,
-            AlertRuleModel.is_active,
-        )
-        .all()
+
+INGEST_BATCH_MAX_ITEMS = int(os.getenv("INGEST_BATCH_MAX_ITEMS", "10000"))
+
+_single_requests = INGEST_REQUESTS.labels("ingest", "ok")
+_single_latency = INGEST_LATENCY.labels("ingest")
+_batch_requests = INGEST_REQUESTS.labels("batch", "ok")
+_batch_latency = INGEST_LATENCY.labels("batch")
+_evaluation_latency = RULE_EVALUATION_LATENCY.labels("ingest")
+
+
+def evaluate_data_point(data: IngestionData, alerts: list):
+    """
+    Returns the rules the data point violates and appends a (rule, value) alert for
+    those that are due a notification (newly firing or past their cooldown).
+    """
+    started = time.perf_counter()
+    violated_rules = evaluate_metric(
+        data.metric_type, data.value, _timestamp(data.timestamp), alerts, data.user_id, rule_index,
     )
+    _evaluation_latency.observe(time.perf_counter() - started)
+    return violated_rules
+
+
+@asynccontextmanager
+async def _counted(endpoint, requests, latency):
+    """
+    Counts the request as ok, rejected (an HTTP error answered to the client) or
+    failed (any other exception). Latency is only observed for ok requests.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except (HTTPException, RequestValidationError):
+        INGEST_REQUESTS.labels(endpoint, "rejected").inc()
+        raise
+    except BaseException:
+        INGEST_REQUESTS.labels(endpoint, "failed").inc()
+        raise
+    requests.inc()
+    latency.observe(time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def _admitted(endpoint):
+    """
+    Holds one of the limited evaluation slots, or fails fast with a 503 when the
+    process is saturated and its wait queue is full.
+    """
+    try:
+        await ingest_admission.acquire()
+    except Overloaded as e:
+        INGEST_REJECTED.labels(endpoint, "overloaded").inc()
+        raise HTTPException(status_code=503, detail=e.reason, headers=retry_after_header(e.retry_after))
+    try:
+        yield
+    finally:
+        ingest_admission.release()
+
+
+def _rate_limit_wait(user_id, endpoint):
+    wait = user_rate_limiter.try_acquire(user_id)
+    if wait:
+        INGEST_REJECTED.labels(endpoint, "rate_limited").inc()
+    return wait
+
+
+def _timestamp(value):
+    if value.tzinfo is None:
+        # Naive timestamps are taken as UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _parse_data_point(body: bytes):
+    """
+    Validates the raw body straight into IngestionData, skipping the intermediate
+    dict FastAPI would build. Errors are reported like FastAPI's own 422 responses.
+    """
+    try:
+        return IngestionData.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        )
 
-    for rule in rules:
-        violated = False
-        if (
-            rule.condition == Condition.GREATER_THAN
-            and data.value > rule.threshold_value
-        ):
-            violated = True
-        elif (
-            rule.condition == Condition.LESS_THAN and data.value < rule.threshold_value
-        ):
-            violated = True
-        elif rule.condition == Condition.EQUALS and data.value == rule.threshold_value:
-            violated = True
-
-        if violated:
-            background_tasks.add_task(
-                alert_delivery_service.send_alert, rule, data.value
-            )
 
+@router.post(
+    "/alert/api/v1/data/ingest",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": IngestionData.model_json_schema()}},
+        }
+    },
+)
+async def ingest_data(request: Request):
+    async with _counted("ingest", _single_requests, _single_latency):
+        data = _parse_data_point(await request.body())
+        wait = _rate_limit_wait(data.user_id, "ingest")
+        if wait:
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded for user {data.user_id}",
+                headers=retry_after_header(wait),
+            )
+        async with _admitted("ingest"):
+            # Evaluated together with the points of concurrent requests
+            await ingest_pipeline.submit((data.metric_type, data.value, _timestamp(data.timestamp), data.user_id))
     return {"message": "Data processed"}
+
+
+@router.post("/alert/api/v1/data/ingest/batch")
+async def ingest_data_batch(request: Request):
+    """
+    Evaluates many IngestionData records in one request.
+
+    The body is either a JSON array or, with an application/x-ndjson content type,
+    one JSON object per line; NDJSON bodies are evaluated while they stream in.
+    Every item gets its own result, so one malformed record does not fail the batch.
+    Reading stops after INGEST_BATCH_MAX_ITEMS items; a single rejected result at
+    the first excess index stands for the rest of the body.
+    """
+    async with _counted("batch", _batch_requests, _batch_latency), _admitted("batch"):
+        results = []
+        alerts = []
+        try:
+            await _evaluate_batch_items(request, results, alerts)
+            await delivery_queue.enqueue_many(alerts)
+        except BaseException:
+            # A failed enqueue or a dropped stream leaves the alerts unqueued
+            rollback_alerts(alerts)
+            raise
+        accepted = sum(1 for result in results if result["status"] == "accepted")
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
+
+async def _evaluate_batch_items(request, results, alerts):
+    """
+    Evaluates the items of the batch body, appending one result per item and the
+    alerts due a notification.
+    """
+    async for index, item, parse_error in _iter_batch_items(request):
+        if index >= INGEST_BATCH_MAX_ITEMS:
+            # The rest of the body is left unread
+            results.append(_rejected(
+                index, f"Batch limit of {INGEST_BATCH_MAX_ITEMS} items exceeded; this and all following items were not evaluated",
+            ))
+            break
+        if parse_error:
+            results.append(_rejected(index, parse_error))
+            continue
+        try:
+            data = IngestionData.model_validate(item)
+        except ValidationError as e:
+            results.append(_rejected(index, _format_validation_error(e)))
+            continue
+        if _rate_limit_wait(data.user_id, "batch"):
+            results.append(_rejected(index, f"Rate limit exceeded for user {data.user_id}"))
+            continue
+
+        violated_rules = evaluate_data_point(data, alerts)
+        results.append({
+            "index": index,
+            "status": "accepted",
+            "violated_rule_ids": [rule.id for rule in violated_rules],
+        })
+
+
+async def _iter_batch_items(request: Request):
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        index = 0
+        async for line in _iter_lines(request.stream()):
+            if not line.strip():
+                continue
+            try:
+                yield index, json_codec.loads(line), None
+            except ValueError as e:
+                yield index, None, f"Invalid JSON: {e}"
+            index += 1
+        return
+
+    try:
+        payload = json_codec.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(payload, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    for index, item in enumerate(payload):
+        yield index, item, None
+
+
+async def _iter_lines(chunks):
+    # Pieces of the unfinished line; each chunk is scanned once, so long lines stay linear
+    pending = []
+    async for chunk in chunks:
+        start = 0
+        end = chunk.find(b"\n")
+        while end != -1:
+            pending.append(chunk[start:end])
+            yield b"".join(pending)
+            pending = []
+            start = end + 1
+            end = chunk.find(b"\n", start)
+        if start < len(chunk):
+            pending.append(chunk[start:])
+    if pending:
+        yield b"".join(pending)
+
+
+def _rejected(index, reason):
+    return {"index": index, "status": "rejected", "reason": reason}
+
+
+def _format_validation_error(error: ValidationError):
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'item'}: {err['msg']}"
+        for err in error.errors()
+    )
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.dashboard_stream import dashboard_broker
+from services.delivery_queue import delivery_queue
+from services.metrics import DASHBOARD_SUBSCRIBERS, DELIVERY_QUEUE_DEPTH, registry
+
+router = APIRouter()
+
+
+@router.get("/alert/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Queue depth lives in the database, so it is sampled per scrape instead of per job
+    DELIVERY_QUEUE_DEPTH.set(await delivery_queue.pending_count())
+    DASHBOARD_SUBSCRIBERS.set(dashboard_broker.subscriber_count())
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,128 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+
+# Requests evaluated at the same time; the rest wait in a bounded queue
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "64"))
+INGEST_MAX_QUEUE = int(os.getenv("INGEST_MAX_QUEUE", "256"))
+INGEST_QUEUE_TIMEOUT_SECONDS = float(os.getenv("INGEST_QUEUE_TIMEOUT_SECONDS", "1"))
+INGEST_RETRY_AFTER_SECONDS = float(os.getenv("INGEST_RETRY_AFTER_SECONDS", "1"))
+# Per user_id token bucket; a rate of 0 disables it
+INGEST_USER_RATE_PER_SECOND = float(os.getenv("INGEST_USER_RATE_PER_SECOND", "0"))
+INGEST_USER_BURST = float(os.getenv("INGEST_USER_BURST", "100"))
+INGEST_USER_BUCKETS_MAX = int(os.getenv("INGEST_USER_BUCKETS_MAX", "100000"))
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed. retry_after is a hint in seconds for the client.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Limits concurrent work to max_concurrent. Up to max_queue callers wait for a slot
+    for at most queue_timeout seconds; anything beyond that is rejected right away,
+    so an overload shows up as fast rejections instead of growing latency.
+    """
+
+    def __init__(
+        self,
+        max_concurrent=INGEST_MAX_CONCURRENCY,
+        max_queue=INGEST_MAX_QUEUE,
+        queue_timeout=INGEST_QUEUE_TIMEOUT_SECONDS,
+        retry_after=INGEST_RETRY_AFTER_SECONDS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = None
+        self._loop = None
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Created per event loop, since a semaphore binds to the loop it first waits on
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+            self.in_flight = 0
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise Overloaded("Too many requests queued", self.retry_after)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded("Timed out waiting for capacity", self.retry_after)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class UserRateLimiter:
+    """
+    Token bucket per user_id: rate tokens per second, at most burst saved up.
+    Buckets of the least recently seen users are forgotten beyond max_users; a
+    forgotten bucket would have refilled anyway unless the user was very active.
+    """
+
+    def __init__(
+        self,
+        rate=INGEST_USER_RATE_PER_SECOND,
+        burst=INGEST_USER_BURST,
+        max_users=INGEST_USER_BUCKETS_MAX,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_users = max_users
+        self._buckets = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def try_acquire(self, user_id, cost=1.0, now=None):
+        """
+        Takes cost tokens from the user's bucket. Returns 0 when allowed, otherwise
+        the seconds until enough tokens are available (nothing is taken then).
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        tokens, updated_at = self._buckets.pop(user_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        wait = 0.0
+        if tokens >= cost:
+            tokens -= cost
+        else:
+            wait = (cost - tokens) / self.rate
+
+        self._buckets[user_id] = (tokens, now)
+        if len(self._buckets) > self.max_users:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def retry_after_header(seconds):
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+ingest_admission = AdmissionController()
+user_rate_limiter = UserRateLimiter()
@@ -1,44 +1,189 @@
 import os
-import resend
+import html
+import asyncio
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from models import AlertRuleModel, DeliveryChannel
+from services.coordination import coordinator
+from services.log_config import sampled
 
 logger = logging.getLogger("uvicorn.info")
 
+# The Resend SDK is synchronous; its calls run here instead of on the event loop
+ALERT_EMAIL_THREADS = int(os.getenv("ALERT_EMAIL_THREADS", "8"))
+_email_executor = ThreadPoolExecutor(max_workers=ALERT_EMAIL_THREADS, thread_name_prefix="alert-email")
+
+ALERT_EMAIL_SENDER = "onboarding@resend.dev"
+
+# The Resend SDK is imported on first use; it is slow to import and only needed for email
+resend = None
+
+
+def _resend_sdk():
+    global resend
+    if resend is None:
+        import resend as sdk
+        resend = sdk
+    return resend
+
+DIGEST_TEMPLATE = """
+    <h1>{count} Alerts Triggered</h1>
+    <table>
+        <tr><th>Metric</th><th>Current Value</th><th>Condition</th><th>Threshold</th></tr>
+        {rows}
+    </table>
+"""
+DIGEST_ROW_TEMPLATE = "<tr><td>{metric}</td><td>{value}</td><td>{condition}</td><td>{threshold}</td></tr>"
+
 class AlertDeliveryService:
     def __init__(self):
         self.api_key = os.environ.get("RESEND_API_KEY")
-        if self.api_key:
-             resend.api_key = self.api_key
-        else:
+        if not self.api_key:
              logger.warning("Warning: RESEND_API_KEY not found in environment.")
 
+    def _sdk(self):
+        sdk = _resend_sdk()
+        sdk.api_key = self.api_key
+        return sdk
+
+    async def warm_up(self):
+        """
+        Imports the Resend SDK off the event loop when emails can be sent, so the
+        first alert does not wait for it.
+        """
+        if self.api_key:
+            await asyncio.get_running_loop().run_in_executor(_email_executor, self._sdk)
+
     async def send_alert(self, rule: AlertRuleModel, actual_value: float):
-        logger.info(f"[ALERT TRIGGERED for User {rule.user_id}]: {rule.metric_type} ({actual_value}) violated rule (Condition: {rule.condition} {rule.threshold_value}) via Channel: {rule.delivery_channel}")
+        try:
+            await self.deliver(rule, actual_value)
+        except Exception as e:
+            logger.error(f"Failed to send email: {e}")
+
+    async def deliver(self, rule: AlertRuleModel, actual_value: float):
+        """
+        Delivers one alert through the rule's channel. Unlike send_alert, transport
+        errors propagate so the delivery queue can retry the job.
+        """
+        self._log_alert(rule, actual_value)
 
         if rule.delivery_channel == DeliveryChannel.EMAIL:
             if not self.api_key:
                 logger.warning("Skipping email alert: No API Key configured.")
                 return
 
-            try:
-                # Use user_id as email if it looks like one, otherwise use a testing email
-                to_email = rule.user_id if "@" in rule.user_id else "delivered@resend.dev"
-                
-                params = {
-                    "from": "onboarding@resend.dev",
-                    "to": [to_email],
-                    "subject": f"Alert Triggered: {rule.metric_type}",
-                    "html": f"""
-                        <h1>Alert Triggered</h1>
-                        <p><strong>Metric:</strong> {rule.metric_type}</p>
-                        <p><strong>Current Value:</strong> {actual_value}</p>
-                        <p><strong>Threshold:</strong> {rule.threshold_value}</p>
-                        <p><strong>Condition:</strong> {rule.condition}</p>
-                    """,
-                }
-
-                email = resend.Emails.send(params)
-                logger.info(f"Email sent successfully: {email}")
-            except Exception as e:
-                logger.error(f"Failed to send email: {e}")
+            email = await self._send(self._sdk().Emails.send, _render_alert_email(self.email_recipient(rule), rule, actual_value))
+            logger.info("Email sent successfully: %s", email, extra=sampled(rule_id=getattr(rule, "rule_id", rule.id)))
+
+        elif rule.delivery_channel == DeliveryChannel.DASHBOARD:
+            # Clients that are not connected simply miss the alert, like a closed dashboard
+            event = _render_dashboard_event(rule, actual_value)
+            await coordinator.publish_dashboard(rule.user_id, event["rule_id"], event)
+
+    async def deliver_batch(self, alerts):
+        """
+        Delivers (rule, actual_value) email alerts as one email per recipient: the usual
+        alert email for a single alert, a digest listing all of them otherwise. Several
+        recipients are sent with a single Resend batch call.
+        """
+        by_recipient = {}
+        for rule, actual_value in alerts:
+            self._log_alert(rule, actual_value)
+            by_recipient.setdefault(self.email_recipient(rule), []).append((rule, actual_value))
+
+        if not self.api_key:
+            logger.warning("Skipping email alert: No API Key configured.")
+            return
+
+        emails = [
+            _render_alert_email(to_email, *recipient_alerts[0])
+            if len(recipient_alerts) == 1
+            else _render_digest_email(to_email, recipient_alerts)
+            for to_email, recipient_alerts in by_recipient.items()
+        ]
+        if len(emails) == 1:
+            result = await self._send(self._sdk().Emails.send, emails[0])
+        else:
+            result = await self._send(self._sdk().Batch.send, emails)
+        logger.info(
+            "Sent %d alert emails for %d alerts: %s", len(emails), len(alerts), result,
+            extra=sampled(emails=len(emails), alerts=len(alerts)),
+        )
+
+    @staticmethod
+    def email_recipient(rule):
+        # Use user_id as email if it looks like one, otherwise use a testing email
+        return rule.user_id if "@" in rule.user_id else "delivered@resend.dev"
+
+    @staticmethod
+    async def _send(send, params):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_email_executor, send, params)
+
+    @staticmethod
+    def _log_alert(rule, actual_value):
+        condition = getattr(rule.condition, "value", rule.condition)
+        channel = getattr(rule.delivery_channel, "value", rule.delivery_channel)
+        logger.info(
+            "[ALERT TRIGGERED for User %s]: %s (%s) violated rule (Condition: %s %s) via Channel: %s",
+            rule.user_id, rule.metric_type, actual_value, condition, rule.threshold_value, channel,
+            extra=sampled(
+                rule_id=getattr(rule, "rule_id", rule.id), user_id=rule.user_id, metric_type=rule.metric_type,
+                value=actual_value, condition=condition, threshold_value=rule.threshold_value, channel=channel,
+            ),
+        )
+
+
+def _condition(rule):
+    # Compound rules carry their expression, which may contain "<" and ">"
+    return html.escape(str(getattr(rule.condition, "value", rule.condition)))
+
+
+def _threshold(rule):
+    return "-" if rule.threshold_value is None else rule.threshold_value
+
+
+def _render_alert_email(to_email, rule, actual_value):
+    return {
+        "from": ALERT_EMAIL_SENDER,
+        "to": [to_email],
+        "subject": f"Alert Triggered: {rule.metric_type}",
+        "html": f"""
+            <h1>Alert Triggered</h1>
+            <p><strong>Metric:</strong> {rule.metric_type}</p>
+            <p><strong>Current Value:</strong> {actual_value}</p>
+            <p><strong>Threshold:</strong> {_threshold(rule)}</p>
+            <p><strong>Condition:</strong> {_condition(rule)}</p>
+        """,
+    }
+
+
+def _render_dashboard_event(rule, actual_value):
+    # Queued delivery jobs carry the rule's id as rule_id, rules as id
+    return {
+        "rule_id": getattr(rule, "rule_id", rule.id),
+        "metric_type": rule.metric_type,
+        "value": actual_value,
+        "threshold_value": rule.threshold_value,
+        "condition": getattr(rule.condition, "value", rule.condition),
+        "triggered_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _render_digest_email(to_email, alerts):
+    rows = "".join(
+        DIGEST_ROW_TEMPLATE.format(
+            metric=html.escape(rule.metric_type),
+            value=actual_value,
+            condition=_condition(rule),
+            threshold=_threshold(rule),
+        )
+        for rule, actual_value in alerts
+    )
+    return {
+        "from": ALERT_EMAIL_SENDER,
+        "to": [to_email],
+        "subject": f"{len(alerts)} Alerts Triggered",
+        "html": DIGEST_TEMPLATE.format(count=len(alerts), rows=rows),
+    }
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+
+from sqlalchemy import insert
+
+from database import run_with_session
+from models import AlertHistoryModel
+
+logger = logging.getLogger("uvicorn.info")
+
+ALERT_HISTORY_FLUSH_SECONDS = float(os.getenv("ALERT_HISTORY_FLUSH_SECONDS", "1"))
+# A flush starts early once this many alerts are buffered
+ALERT_HISTORY_BATCH_SIZE = int(os.getenv("ALERT_HISTORY_BATCH_SIZE", "500"))
+# Upper bound for alerts held in memory while the database is unavailable
+ALERT_HISTORY_MAX_BUFFER = int(os.getenv("ALERT_HISTORY_MAX_BUFFER", "100000"))
+ALERT_HISTORY_BUCKET_SECONDS = int(os.getenv("ALERT_HISTORY_BUCKET_SECONDS", "86400"))
+ALERT_HISTORY_RETENTION_DAYS = float(os.getenv("ALERT_HISTORY_RETENTION_DAYS", "30"))
+
+
+def _append_entries(db, rows):
+    db.execute(insert(AlertHistoryModel), rows)
+    db.commit()
+
+
+def _delete_buckets_before(db, bucket):
+    deleted = db.query(AlertHistoryModel).filter(AlertHistoryModel.bucket < bucket).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def query_history(db, user_id, metric_type=None, since=None, until=None, limit=100):
+    """
+    Returns the user's alerts fired in [since, until), newest first.
+    """
+    query = db.query(AlertHistoryModel).filter(AlertHistoryModel.user_id == user_id)
+    if metric_type is not None:
+        query = query.filter(AlertHistoryModel.metric_type == metric_type)
+    if since is not None:
+        query = query.filter(AlertHistoryModel.fired_at >= since)
+    if until is not None:
+        query = query.filter(AlertHistoryModel.fired_at < until)
+    return query.order_by(AlertHistoryModel.fired_at.desc(), AlertHistoryModel.id.desc()).limit(limit).all()
+
+
+class AlertHistory:
+    """
+    Write-behind log of notified alerts stored in the alert_history table.
+
+    record() only appends to an in-memory buffer, so evaluation never waits for a
+    commit. A background task writes the buffer with one multi-row INSERT per
+    flush and deletes buckets that fell out of the retention window.
+    """
+
+    def __init__(
+        self,
+        flush_interval=ALERT_HISTORY_FLUSH_SECONDS,
+        batch_size=ALERT_HISTORY_BATCH_SIZE,
+        max_buffer=ALERT_HISTORY_MAX_BUFFER,
+        bucket_seconds=ALERT_HISTORY_BUCKET_SECONDS,
+        retention_days=ALERT_HISTORY_RETENTION_DAYS,
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.bucket_seconds = bucket_seconds
+        self.retention_buckets = math.ceil(retention_days * 86400 / bucket_seconds)
+        self._buffer = deque(maxlen=max_buffer)
+        self._wake = None
+        self._flusher = None
+        self._pruned_bucket = None
+
+    def record(self, alerts, now=None):
+        """
+        Buffers (rule, actual_value) pairs notified at now.
+        """
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_seconds)
+        if len(self._buffer) + len(alerts) > self._buffer.maxlen:
+            logger.error("Alert history buffer is full, dropping the oldest entries")
+        for rule, actual_value in alerts:
+            self._buffer.append({
+                "bucket": bucket,
+                "fired_at": now,
+                "rule_id": getattr(rule, "rule_id", rule.id),
+                "user_id": rule.user_id,
+                "metric_type": rule.metric_type,
+                "actual_value": actual_value,
+                "threshold_value": rule.threshold_value,
+                "condition": getattr(rule.condition, "value", rule.condition),
+                "delivery_channel": getattr(rule.delivery_channel, "value", rule.delivery_channel),
+            })
+        if self._wake is not None and len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    def pending(self):
+        return len(self._buffer)
+
+    def clear(self):
+        self._buffer.clear()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        rows = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await run_with_session(_append_entries, rows)
+        except Exception as e:
+            logger.error(f"Failed to persist alert history: {e}")
+            # Keep the failed rows ahead of anything recorded meanwhile
+            self._buffer.extendleft(reversed(rows))
+
+    async def prune(self, now=None):
+        """
+        Deletes the buckets older than the retention window, at most once per bucket.
+        """
+        now = time.time() if now is None else now
+        cutoff = int(now // self.bucket_seconds) - self.retention_buckets
+        if cutoff == self._pruned_bucket:
+            return
+        try:
+            deleted = await run_with_session(_delete_buckets_before, cutoff)
+        except Exception as e:
+            logger.error(f"Failed to prune alert history: {e}")
+            return
+        self._pruned_bucket = cutoff
+        if deleted:
+            logger.info(f"Pruned {deleted} alert history entries")
+
+    async def start(self):
+        if self._flusher is None:
+            self._wake = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+            self._wake = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await self.prune()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+
+alert_history = AlertHistory()
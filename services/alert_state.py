@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+import time
+
+from database import run_with_session
+from models import AlertStateModel
+
+logger = logging.getLogger("uvicorn.info")
+
+# Minimum time between two notifications for a rule that keeps firing; 0 disables the cooldown
+ALERT_COOLDOWN_SECONDS = float(os.getenv("ALERT_COOLDOWN_SECONDS", "3600"))
+ALERT_STATE_FLUSH_SECONDS = float(os.getenv("ALERT_STATE_FLUSH_SECONDS", "5"))
+
+
+def _load_states(db):
+    return [
+        (state.rule_id, state.metric_type, state.user_id, state.last_sent_at)
+        for state in db.query(AlertStateModel).all()
+    ]
+
+
+def _write_states(db, firing, resolved):
+    for rule_id, metric_type, user_id, last_sent_at in firing:
+        db.merge(AlertStateModel(
+            rule_id=rule_id,
+            metric_type=metric_type,
+            user_id=user_id,
+            last_sent_at=last_sent_at,
+        ))
+    if resolved:
+        db.query(AlertStateModel).filter(AlertStateModel.rule_id.in_(resolved)).delete(synchronize_session=False)
+    db.commit()
+
+
+class AlertStateTable:
+    """
+    Tracks which rules are firing so that a breach is notified once on the transition
+    to firing, and again only after the cooldown, instead of on every evaluation.
+
+    Only firing rules are kept: rule_id -> (metric_type, user_id, last_sent_at), plus
+    a metric_type -> user_id -> rule ids view used to detect resolutions.
+    Changes are written behind to the alert_states table by a background task.
+    Not thread-safe; it is only used from the event loop.
+    """
+
+    def __init__(self, cooldown=ALERT_COOLDOWN_SECONDS):
+        self.cooldown = cooldown
+        self._firing = {}
+        self._firing_by_metric = {}
+        self._dirty = set()
+        self._flusher = None
+
+    def filter_alerts(self, metric_type, violated_rules, user_id=None, now=None):
+        """
+        Records the outcome of evaluating one metric, for one user or for all users,
+        and returns the violated rules that should be notified now.
+
+        Firing rules in that scope which are no longer violated become resolved.
+        """
+        now = time.time() if now is None else now
+        notify = []
+        violated_ids = set()
+        for rule in violated_rules:
+            violated_ids.add(rule.id)
+            state = self._firing.get(rule.id)
+            if state is not None and now - state[2] < self.cooldown:
+                continue
+            self._mark_firing(rule.id, rule.metric_type, rule.user_id, now)
+            self._dirty.add(rule.id)
+            notify.append(rule)
+
+        firing_by_user = self._firing_by_metric.get(metric_type)
+        if firing_by_user:
+            scopes = list(firing_by_user.items()) if user_id is None else [(user_id, firing_by_user.get(user_id))]
+            for scope_user, firing_ids in scopes:
+                # Every violated rule is firing by now, so equal sizes mean nothing resolved
+                if firing_ids and len(firing_ids) > len(violated_ids & firing_ids):
+                    for rule_id in firing_ids - violated_ids:
+                        self._resolve(metric_type, scope_user, rule_id)
+        return notify
+
+    async def refresh(self):
+        """
+        Adopts the firing state other workers persisted, e.g. after taking over a
+        poll source from one of them. Rules already firing here keep their newer
+        notification time.
+        """
+        await self.flush()
+        for rule_id, metric_type, user_id, last_sent_at in await run_with_session(_load_states):
+            current = self._firing.get(rule_id)
+            if current is None or current[2] < last_sent_at:
+                self._mark_firing(rule_id, metric_type, user_id, last_sent_at)
+
+    def adopt(self, rule, last_sent_at):
+        """
+        Takes over the notification time another worker recorded for a rule this
+        worker wanted to notify, so its cooldown runs from that notification and
+        the local mark is not written back over it.
+        """
+        self._mark_firing(rule.id, rule.metric_type, rule.user_id, last_sent_at)
+        self._dirty.discard(rule.id)
+
+    def rollback(self, rules):
+        """
+        Forgets that the rules were just notified, for alerts that could not be
+        queued. The rules count as resolved, so the next evaluation that finds them
+        violated notifies them again instead of waiting out the cooldown.
+        """
+        for rule in rules:
+            state = self._firing.get(rule.id)
+            if state is not None:
+                self._resolve(state[0], state[1], rule.id)
+
+    def is_firing(self, rule_id):
+        return rule_id in self._firing
+
+    def load(self, db):
+        self.clear()
+        for rule_id, metric_type, user_id, last_sent_at in _load_states(db):
+            self._mark_firing(rule_id, metric_type, user_id, last_sent_at)
+        logger.info(f"Alert state loaded with {len(self._firing)} firing rules")
+
+    def clear(self):
+        self._firing = {}
+        self._firing_by_metric = {}
+        self._dirty = set()
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        firing = [(rule_id,) + self._firing[rule_id] for rule_id in dirty if rule_id in self._firing]
+        resolved = [rule_id for rule_id in dirty if rule_id not in self._firing]
+        try:
+            await run_with_session(_write_states, firing, resolved)
+        except Exception as e:
+            logger.error(f"Failed to persist alert state: {e}")
+            self._dirty |= dirty
+
+    async def start(self):
+        await run_with_session(self.load)
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(ALERT_STATE_FLUSH_SECONDS)
+            await self.flush()
+
+    def _mark_firing(self, rule_id, metric_type, user_id, last_sent_at):
+        self._firing[rule_id] = (metric_type, user_id, last_sent_at)
+        self._firing_by_metric.setdefault(metric_type, {}).setdefault(user_id, set()).add(rule_id)
+
+    def _resolve(self, metric_type, user_id, rule_id):
+        del self._firing[rule_id]
+        firing_by_user = self._firing_by_metric[metric_type]
+        firing_by_user[user_id].discard(rule_id)
+        if not firing_by_user[user_id]:
+            del firing_by_user[user_id]
+        self._dirty.add(rule_id)
+
+
+alert_state = AlertStateTable()
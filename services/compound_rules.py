@@ -0,0 +1,240 @@
+import ast
+import logging
+import operator
+import re
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from models import AlertRuleModel
+
+logger = logging.getLogger("uvicorn.info")
+
+# Stored in the condition column of compound rules; the expression column holds the condition
+COMPOUND_CONDITION = "EXPRESSION"
+
+_KEYWORDS = re.compile(r"\b(AND|OR|NOT)\b")
+_COMPARISONS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+class CompiledExpression(NamedTuple):
+    metrics: Tuple[str, ...]  # in order of first appearance
+    evaluate: Callable[[dict], bool]
+
+
+def compile_expression(expression):
+    """
+    Compiles a condition such as "battery_soc < 20 AND grid_power > 3000" into a
+    function of a {metric_type: value} snapshot holding every referenced metric.
+
+    Comparisons (<, <=, >, >=, ==, !=) between metrics and numbers can be combined
+    with AND, OR, NOT and parentheses. Anything else raises a ValueError.
+    """
+    source = _KEYWORDS.sub(lambda match: match.group(1).lower(), expression.strip())
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"Invalid expression: {e.msg}") from None
+    except RecursionError:
+        raise ValueError("Invalid expression: nested too deeply") from None
+    metrics = {}
+    evaluate = _condition(tree.body, metrics)
+    if not metrics:
+        raise ValueError("The expression does not reference any metric")
+    return CompiledExpression(tuple(metrics), evaluate)
+
+
+def _condition(node, metrics):
+    if isinstance(node, ast.BoolOp):
+        parts = [_condition(value, metrics) for value in node.values]
+        combine = _both if isinstance(node.op, ast.And) else _either
+        evaluate = parts[0]
+        for part in parts[1:]:
+            evaluate = combine(evaluate, part)
+        return evaluate
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        inner = _condition(node.operand, metrics)
+        return lambda values: not inner(values)
+    if isinstance(node, ast.Compare):
+        # a < b < c is a < b AND b < c
+        operands = [_operand(node.left, metrics)] + [_operand(right, metrics) for right in node.comparators]
+        evaluate = None
+        for position, op in enumerate(node.ops):
+            comparison = _comparison(op, operands[position], operands[position + 1])
+            evaluate = comparison if evaluate is None else _both(evaluate, comparison)
+        return evaluate
+    raise ValueError(f"Expected a comparison, got '{ast.unparse(node)}'")
+
+
+def _operand(node, metrics):
+    # (metric, None) or (None, number)
+    if isinstance(node, ast.Name):
+        metrics.setdefault(node.id, None)
+        return node.id, None
+    sign = 1.0
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        sign = -1.0 if isinstance(node.op, ast.USub) else 1.0
+        node = node.operand
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return None, sign * node.value
+    raise ValueError(f"Expected a metric or a number, got '{ast.unparse(node)}'")
+
+
+def _comparison(op, left, right):
+    compare = _COMPARISONS.get(type(op))
+    if compare is None:
+        raise ValueError(f"Unsupported comparison '{type(op).__name__}'")
+    (left_metric, left_number), (right_metric, right_number) = left, right
+    # Specialized per operand kind, so evaluating does no type dispatch
+    if left_metric is not None and right_metric is not None:
+        return lambda values: compare(values[left_metric], values[right_metric])
+    if left_metric is not None:
+        return lambda values: compare(values[left_metric], right_number)
+    if right_metric is not None:
+        return lambda values: compare(left_number, values[right_metric])
+    raise ValueError("A comparison needs at least one metric")
+
+
+def _both(first, second):
+    return lambda values: first(values) and second(values)
+
+
+def _either(first, second):
+    return lambda values: first(values) or second(values)
+
+
+def scope_key(metrics):
+    """
+    The metric_type of a compound rule: its metrics, sorted and joined with "+".
+    Rules over the same metrics share it, and with it their alert state scope.
+    """
+    return "+".join(sorted(metrics))
+
+
+class CachedCompoundRule(NamedTuple):
+    """
+    Immutable copy of an active compound rule row with its compiled expression.
+    Carries the fields alert state and delivery read from a rule; the expression
+    stands in for the condition.
+    """
+    id: int
+    user_id: str
+    metric_type: str
+    condition: str
+    delivery_channel: str
+    metrics: Tuple[str, ...]
+    evaluate: Callable[[dict], bool]
+    threshold_value: Optional[float] = None
+
+    @classmethod
+    def from_model(cls, rule, compiled=None):
+        compiled = compile_expression(rule.expression) if compiled is None else compiled
+        return cls(
+            id=rule.id,
+            user_id=rule.user_id,
+            metric_type=scope_key(compiled.metrics),
+            condition=rule.expression,
+            delivery_channel=getattr(rule.delivery_channel, "value", rule.delivery_channel),
+            metrics=compiled.metrics,
+            evaluate=compiled.evaluate,
+        )
+
+
+class CompoundRuleIndex:
+    """
+    In-process index of active compound rules, compiled once when they are added.
+
+    Rules are grouped by scope (the set of metrics they reference) and every scope
+    is indexed under each of its metrics, so a payload only reaches the rules that
+    reference a metric it changed. Like RuleIndex, writes replace whole tuples and
+    readers never take a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # ({scope: rules}, {metric_type: scopes}), swapped together
+        self._maps: Tuple[Dict[str, Tuple[CachedCompoundRule, ...]], Dict[str, Tuple[str, ...]]] = ({}, {})
+        self._rules: Dict[int, CachedCompoundRule] = {}
+        self.version = 0
+
+    def load(self, db):
+        """
+        Replaces the index contents with all active compound rules from the database.
+        """
+        rows = db.query(AlertRuleModel).filter(
+            AlertRuleModel.is_active == True, AlertRuleModel.expression.isnot(None),
+        ).all()
+        rules = []
+        for row in rows:
+            try:
+                rules.append(CachedCompoundRule.from_model(row))
+            except ValueError as e:
+                logger.error(f"Skipping compound rule {row.id}: {e}")
+        with self._lock:
+            self._rules = {rule.id: rule for rule in rules}
+            self._rebuild()
+        logger.info(f"Compound rule index loaded with {len(rules)} active rules")
+
+    def add(self, rule):
+        """
+        Inserts or replaces a CachedCompoundRule.
+        """
+        with self._lock:
+            self._rules[rule.id] = rule
+            self._rebuild()
+
+    def get(self, rule_id):
+        return self._rules.get(rule_id)
+
+    def remove_many(self, rule_ids):
+        with self._lock:
+            removed = [self._rules.pop(rule_id) for rule_id in rule_ids if rule_id in self._rules]
+            if removed:
+                self._rebuild()
+
+    def remove(self, rule_id):
+        self.remove_many([rule_id])
+
+    def clear(self):
+        with self._lock:
+            self._rules = {}
+            self._rebuild()
+
+    def scopes_for(self, metric_types):
+        """
+        Returns {scope: rules} of every scope referencing one of the metric types.
+        """
+        scopes, scopes_by_metric = self._maps
+        found = {}
+        for metric_type in metric_types:
+            for scope in scopes_by_metric.get(metric_type, ()):
+                if scope not in found:
+                    found[scope] = scopes[scope]
+        return found
+
+    def __len__(self):
+        return len(self._rules)
+
+    def _rebuild(self):
+        # Rule changes are rare next to lookups, so the maps are rebuilt whole
+        scopes = {}
+        for rule in self._rules.values():
+            scopes.setdefault(rule.metric_type, []).append(rule)
+        scopes_by_metric = {}
+        for scope, rules in scopes.items():
+            for metric_type in rules[0].metrics:
+                scopes_by_metric.setdefault(metric_type, []).append(scope)
+        self._maps = (
+            {scope: tuple(rules) for scope, rules in scopes.items()},
+            {metric: tuple(keys) for metric, keys in scopes_by_metric.items()},
+        )
+        self.version += 1
+
+
+compound_index = CompoundRuleIndex()
@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from database import run_with_session
+from models import CoordinationLeaseModel, DashboardEventModel, RuleVersionModel
+from services import json_codec
+from services.alert_state import alert_state
+from services.compound_rules import compound_index
+from services.dashboard_stream import dashboard_broker
+from services.rule_index import rule_index
+
+logger = logging.getLogger("uvicorn.info")
+
+# "none": a single process does everything. "sqlite": worker processes sharing the
+# database file coordinate through the coordination_leases and rule_versions tables.
+COORDINATION_MODE = os.getenv("COORDINATION_MODE", "none")
+COORDINATION_LEASE_SECONDS = float(os.getenv("COORDINATION_LEASE_SECONDS", "30"))
+COORDINATION_SYNC_SECONDS = float(os.getenv("COORDINATION_SYNC_SECONDS", "2"))
+# 0 lets one worker poll every source; a limit spreads the sources across workers
+COORDINATION_MAX_SOURCES_PER_WORKER = int(os.getenv("COORDINATION_MAX_SOURCES_PER_WORKER", "0"))
+# How often workers pick up DASHBOARD alerts delivered by other workers
+COORDINATION_DASHBOARD_POLL_SECONDS = float(os.getenv("COORDINATION_DASHBOARD_POLL_SECONDS", "0.5"))
+# Relayed DASHBOARD alerts older than this are deleted, at most once per retention
+# period, so pruning adds no steady stream of write transactions
+DASHBOARD_EVENT_RETENTION_SECONDS = 60.0
+
+COORDINATION_MODES = ("none", "sqlite")
+RULES_VERSION_NAME = "alert_rules"
+
+
+def _acquire_leases(db, names, holder, now, ttl, limit=0):
+    """
+    Renews the leases holder already has and takes free or expired ones, up to
+    limit leases in total (0 for no limit). Returns {name: expires_at} of the
+    leases held afterwards.
+    """
+    existing = {
+        name for (name,) in db.query(CoordinationLeaseModel.name).filter(CoordinationLeaseModel.name.in_(names))
+    }
+    missing = [name for name in names if name not in existing]
+    if missing:
+        # Plain inserts work on every database; a worker racing to create the
+        # same leases makes one of them fail, which leaves the rows in place
+        db.add_all([CoordinationLeaseModel(name=name, holder=None, expires_at=0.0) for name in missing])
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+    held = {
+        name
+        for (name,) in db.query(CoordinationLeaseModel.name).filter(
+            CoordinationLeaseModel.name.in_(names),
+            CoordinationLeaseModel.holder == holder,
+            CoordinationLeaseModel.expires_at >= now,
+        )
+    }
+
+    acquired = {}
+    expires_at = now + ttl
+    # Leases already held come first so a limit never drops them for new ones
+    for name in sorted(names, key=lambda name: name not in held):
+        if limit and len(acquired) >= limit:
+            break
+        updated = db.query(CoordinationLeaseModel).filter(
+            CoordinationLeaseModel.name == name,
+            or_(CoordinationLeaseModel.holder == holder, CoordinationLeaseModel.expires_at < now),
+        ).update(
+            {CoordinationLeaseModel.holder: holder, CoordinationLeaseModel.expires_at: expires_at},
+            synchronize_session=False,
+        )
+        if updated:
+            acquired[name] = expires_at
+    db.commit()
+    return acquired
+
+
+def _release_leases(db, names, holder):
+    db.query(CoordinationLeaseModel).filter(
+        CoordinationLeaseModel.name.in_(names),
+        CoordinationLeaseModel.holder == holder,
+    ).update(
+        {CoordinationLeaseModel.holder: None, CoordinationLeaseModel.expires_at: 0.0},
+        synchronize_session=False,
+    )
+    db.commit()
+
+
+def _insert_dashboard_event(db, user_id, rule_id, payload, now):
+    db.add(DashboardEventModel(user_id=user_id, rule_id=rule_id, payload=payload, created_at=now))
+    db.commit()
+
+
+def _read_dashboard_events(db, after_id):
+    return [
+        (row.id, row.user_id, row.rule_id, row.payload)
+        for row in db.query(DashboardEventModel).filter(DashboardEventModel.id > after_id).order_by(DashboardEventModel.id)
+    ]
+
+
+def _last_dashboard_event_id(db):
+    row = db.query(DashboardEventModel.id).order_by(DashboardEventModel.id.desc()).first()
+    return row[0] if row else 0
+
+
+def _prune_dashboard_events(db, before):
+    db.query(DashboardEventModel).filter(DashboardEventModel.created_at < before).delete(synchronize_session=False)
+    db.commit()
+
+
+def read_rules_version(db):
+    row = db.query(RuleVersionModel.version).filter(RuleVersionModel.name == RULES_VERSION_NAME).first()
+    return row[0] if row else 0
+
+
+def bump_rules_version(db):
+    """
+    Increments the rules version inside the caller's transaction and returns the
+    new version. Call it before committing a change to alert_rules.
+    """
+    updated = db.query(RuleVersionModel).filter(RuleVersionModel.name == RULES_VERSION_NAME).update(
+        {RuleVersionModel.version: RuleVersionModel.version + 1},
+        synchronize_session=False,
+    )
+    if not updated:
+        # The first change ever; an UPDATE followed by an INSERT works on every database
+        db.add(RuleVersionModel(name=RULES_VERSION_NAME, version=1))
+        db.flush()
+    return read_rules_version(db)
+
+
+class Coordinator:
+    """
+    Coordinates several worker processes that share the database.
+
+    Singleton work such as polling a source is guarded by a lease: a background task
+    renews the leases this worker holds and takes over expired ones, and the work
+    only runs while holds() is true. A worker taking over a lease first adopts the
+    alert state the others persisted, so it does not notify rules again that they
+    already notified. The same task compares the shared rules version with the one
+    the local rule index was built from and reloads the index when another worker
+    changed the rules.
+
+    DASHBOARD alerts are relayed through the dashboard_events table, so clients
+    receive them whichever worker they are connected to.
+
+    With COORDINATION_MODE=none nothing runs and holds() is always true.
+    """
+
+    def __init__(
+        self,
+        mode=COORDINATION_MODE,
+        lease_seconds=COORDINATION_LEASE_SECONDS,
+        sync_seconds=COORDINATION_SYNC_SECONDS,
+        max_sources=COORDINATION_MAX_SOURCES_PER_WORKER,
+        dashboard_poll_seconds=COORDINATION_DASHBOARD_POLL_SECONDS,
+    ):
+        if mode not in COORDINATION_MODES:
+            raise ValueError(f"Unknown COORDINATION_MODE '{mode}'")
+        self.mode = mode
+        self.lease_seconds = lease_seconds
+        self.sync_seconds = sync_seconds
+        self.max_sources = max_sources
+        self.dashboard_poll_seconds = dashboard_poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wanted = set()
+        self._held = {}
+        self._rules_version = None
+        self._dashboard_after_id = 0
+        self._dashboard_pruned_at = 0.0
+        self._tasks = []
+
+    @property
+    def enabled(self):
+        return self.mode != "none"
+
+    def want(self, name):
+        """
+        Makes this worker compete for the named lease from the next sync on.
+        """
+        self._wanted.add(name)
+
+    def holds(self, name):
+        if not self.enabled:
+            return True
+        # Judged locally against the expiry, so a worker that cannot renew stops in time
+        return self._held.get(name, 0.0) > time.time()
+
+    def bump_rules_version(self, db):
+        """
+        Like bump_rules_version, for a rule change made by this worker. Without
+        coordination no other worker reads the version, so nothing is written and
+        None is returned.
+        """
+        return bump_rules_version(db) if self.enabled else None
+
+    def rules_changed_locally(self, version):
+        """
+        Records a rules version this worker wrote itself. Its rule index already has
+        the change, so the version only triggers a reload if other changes came first.
+        """
+        if version is not None and self._rules_version is not None and version == self._rules_version + 1:
+            self._rules_version = version
+
+    async def publish_dashboard(self, user_id, key, event):
+        """
+        Hands a DASHBOARD alert to the connected clients of user_id: directly when
+        this is the only worker, through the dashboard_events table otherwise.
+        """
+        if not self.enabled:
+            dashboard_broker.publish(user_id, key, event)
+            return
+        await run_with_session(
+            _insert_dashboard_event, user_id, key, json_codec.dumps(event).decode("utf-8"), time.time(),
+        )
+
+    async def start(self):
+        if not self.enabled or self._tasks:
+            return
+        self._rules_version = await run_with_session(read_rules_version)
+        # Only alerts delivered from now on are relayed
+        self._dashboard_after_id = await run_with_session(_last_dashboard_event_id)
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._relay_dashboard())]
+        logger.info(f"Coordination enabled ({self.mode}) as worker {self.worker_id}")
+
+    async def stop(self):
+        if not self._tasks:
+            return
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._held:
+            try:
+                await run_with_session(_release_leases, list(self._held), self.worker_id)
+            except Exception as e:
+                logger.error(f"Failed to release leases: {e}")
+            self._held = {}
+
+    async def renew_leases(self):
+        acquired = await run_with_session(
+            _acquire_leases, sorted(self._wanted), self.worker_id, time.time(), self.lease_seconds, self.max_sources,
+        )
+        taken_over = acquired.keys() - self._held.keys()
+        if taken_over:
+            # The previous holder may have notified rules since this worker last loaded them
+            await alert_state.refresh()
+        for name in taken_over:
+            logger.info(f"Worker {self.worker_id} acquired lease {name}")
+        for name in self._held.keys() - acquired.keys():
+            logger.warning(f"Worker {self.worker_id} lost lease {name}")
+        self._held = acquired
+
+    async def sync_rules(self):
+        version = await run_with_session(read_rules_version)
+        if version != self._rules_version:
+            await run_with_session(rule_index.load)
+            await run_with_session(compound_index.load)
+            self._rules_version = version
+
+    async def relay_dashboard_events(self):
+        for event_id, user_id, rule_id, payload in await run_with_session(_read_dashboard_events, self._dashboard_after_id):
+            dashboard_broker.publish(user_id, rule_id, json_codec.loads(payload))
+            self._dashboard_after_id = event_id
+        now = time.time()
+        if now - self._dashboard_pruned_at >= DASHBOARD_EVENT_RETENTION_SECONDS:
+            self._dashboard_pruned_at = now
+            await run_with_session(_prune_dashboard_events, now - DASHBOARD_EVENT_RETENTION_SECONDS)
+
+    async def _relay_dashboard(self):
+        while True:
+            try:
+                await self.relay_dashboard_events()
+            except Exception as e:
+                logger.error(f"Coordination relay_dashboard_events failed: {e}")
+            await asyncio.sleep(self.dashboard_poll_seconds)
+
+    async def _run(self):
+        while True:
+            for step in (self.renew_leases, self.sync_rules):
+                try:
+                    await step()
+                except Exception as e:
+                    logger.error(f"Coordination {step.__name__} failed: {e}")
+            await asyncio.sleep(self.sync_seconds)
+
+
+coordinator = Coordinator()
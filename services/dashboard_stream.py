@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+from services.metrics import DASHBOARD_MESSAGES_DROPPED
+
+logger = logging.getLogger("uvicorn.info")
+
+# Undelivered messages kept per connected client before the oldest are dropped
+DASHBOARD_SUBSCRIBER_BUFFER = int(os.getenv("DASHBOARD_SUBSCRIBER_BUFFER", "100"))
+
+
+class Subscription:
+    """
+    One connected dashboard client. Pending messages are keyed by rule, so a rule
+    that fires again before the client caught up replaces its older message instead
+    of queueing behind it. When the buffer is full the oldest message is dropped.
+    """
+
+    __slots__ = ("user_id", "dropped", "_pending", "_ready", "_maxlen")
+
+    def __init__(self, user_id, maxlen=DASHBOARD_SUBSCRIBER_BUFFER):
+        self.user_id = user_id
+        self.dropped = 0
+        self._pending = OrderedDict()
+        self._ready = asyncio.Event()
+        self._maxlen = maxlen
+
+    def push(self, key, message):
+        if key in self._pending:
+            self._pending[key] = message
+        else:
+            if len(self._pending) >= self._maxlen:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+                DASHBOARD_MESSAGES_DROPPED.inc()
+            self._pending[key] = message
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """
+        Waits up to timeout seconds for messages and returns every pending one,
+        oldest first. Returns an empty list on timeout.
+        """
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        messages = list(self._pending.values())
+        self._pending.clear()
+        self._ready.clear()
+        return messages
+
+
+class DashboardBroker:
+    """
+    In-process pub/sub from the DASHBOARD delivery channel to connected clients.
+    An idle client costs one Subscription and one waiting task; publishing never
+    blocks on a slow client.
+    """
+
+    def __init__(self, buffer_size=DASHBOARD_SUBSCRIBER_BUFFER):
+        self.buffer_size = buffer_size
+        self._subscribers = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, self.buffer_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self._subscribers.get(subscription.user_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, key, message):
+        """
+        Pushes message to every client of user_id and returns how many received it.
+        """
+        subscribers = self._subscribers.get(user_id, ())
+        for subscription in subscribers:
+            subscription.push(key, message)
+        return len(subscribers)
+
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+dashboard_broker = DashboardBroker()
@@ -1,25 +1,93 @@
 import asyncio
+import hashlib
 import httpx
-import os
 import logging
+import os
+import time
 
 logger = logging.getLogger("uvicorn.info")
 
-from database import SessionLocal
-from models import AlertRuleModel, Condition
-from services.alert_delivery import AlertDeliveryService
+from models import Condition
+from services.coordination import coordinator
+from services.delivery_queue import delivery_queue
+from services import json_codec
+from services.compound_rules import compound_index
+from services.evaluation import evaluate_compound, evaluate_matched, evaluate_metric, rollback_alerts
+from services.log_config import sampled
+from services.metrics import POLL_ERRORS, POLL_FETCH_LATENCY, POLL_RULES_EVALUATED, RULE_EVALUATION_LATENCY
+from services.poll_sources import POLL_MAX_CONNECTIONS, POLL_MAX_KEEPALIVE_CONNECTIONS, load_poll_sources, realtime_values
+from services.rule_index import rule_index
+from services.sharded_evaluation import sharded_evaluator
+
+# Unchanged metrics are still re-evaluated this often, so cooldowns can expire
+POLL_FULL_EVALUATION_SECONDS = float(os.getenv("POLL_FULL_EVALUATION_SECONDS", "300"))
 
-# Default URLs (can be overridden by env vars)
-KOSTAL_REALTIME_URL = os.getenv("KOSTAL_SERVICE_URL", "http://kostal-ms:8082/kostal/realtimedata")  # NOSONAR
-FRONIUS_REALTIME_URL = os.getenv("FRONIUS_SERVICE_URL", "http://fronius-ms:8081/fronius/realtimedata")  # NOSONAR
+_evaluation_latency = RULE_EVALUATION_LATENCY.labels("poll")
 
-async def fetch_data(client, url, service_name):
+class PollState:
+    """
+    What the poller last saw from one source: the response validators and the
+    last evaluated value of every metric.
+    """
+
+    def __init__(self):
+        self.etag = None
+        self.content_hash = None
+        self.not_modified = False
+        self.payload = None
+        self.last_values = {}
+        self.evaluated_at = None
+        self.evaluated_version = None
+
+    def full_evaluation_due(self, now, rules_version):
+        # New or removed rules must see every current value, not just the changed ones
+        return (
+            self.evaluated_at is None
+            or self.evaluated_version != rules_version
+            or now - self.evaluated_at >= POLL_FULL_EVALUATION_SECONDS
+        )
+
+async def fetch_data(client, url, service_name, timeout=None, state=None):
+    """
+    Fetches a source's JSON payload. With a PollState, the request is conditional
+    (If-None-Match) and None is returned with state.not_modified set when the
+    response is a 304 or its body is byte-identical to the previous one. The
+    validators are only kept once the body parsed, so a bad body is fetched again.
+    """
     try:
-        logger.info(f"Polling {service_name} at {url}...")
-        response = await client.get(url)
+        logger.info("Polling %s at %s...", service_name, url, extra=sampled(source=service_name))
+        kwargs = {}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if state is not None:
+            state.not_modified = False
+            if state.etag:
+                kwargs["headers"] = {"If-None-Match": state.etag}
+        fetch_started = time.perf_counter()
+        response = await client.get(url, **kwargs)
+        POLL_FETCH_LATENCY.labels(service_name).observe(time.perf_counter() - fetch_started)
+        if state is not None and response.status_code == 304:
+            logger.info("%s data not modified", service_name, extra=sampled(source=service_name))
+            state.not_modified = True
+            return None
         response.raise_for_status()
-        data = response.json()
-        logger.info(f"Successfully fetched {service_name} data: {str(data)[:200]}...")
+        if state is not None:
+            content_hash = hashlib.blake2b(response.content, digest_size=16).digest()
+            if content_hash == state.content_hash:
+                logger.info("%s data unchanged", service_name, extra=sampled(source=service_name))
+                state.not_modified = True
+                return None
+        data = json_codec.loads(response.content)
+        if state is not None:
+            state.etag = response.headers.get("etag")
+            state.content_hash = content_hash
+        # Sized from the raw body, so the cost does not grow with the payload
+        logger.info(
+            "Successfully fetched %s data (%d bytes)", service_name, len(response.content),
+            extra=sampled(source=service_name, bytes=len(response.content)),
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s data: %r...", service_name, response.content[:200])
         return data
     except httpx.RequestError as e:
         logger.error(f"Network error polling {service_name}: {e}")
@@ -27,6 +95,7 @@ async def fetch_data(client, url, service_name):
         logger.error(f"HTTP error polling {service_name}: {e.response.status_code} - {e.response.text}")
     except Exception as e:
         logger.error(f"Unexpected error polling {service_name}: {e}")
+    POLL_ERRORS.labels(service_name).inc()
     return None
 
 def evaluate_condition(actual_value, threshold, condition):
@@ -41,55 +110,147 @@ def evaluate_condition(actual_value, threshold, condition):
         return actual_value == threshold
     return False
 
-async def process_inverter_data(data, delivery_service):
+async def process_inverter_data(data, queue, last_values=None):
     """
-    Processes the inverter data, checks against alert rules, and triggers alerts if necessary.
+    Processes the inverter data, checks against alert rules, and enqueues alerts if necessary.
+
+    When a last_values dict is given, metrics whose value equals the stored one are
+    skipped and the dict is updated with the new values. Compound rules referencing
+    an evaluated metric are checked against the whole payload. Returns the number
+    of active threshold rules covering the evaluated metrics.
     """
-    realtime_data = data.get("realtime_data", {})
-    if not realtime_data:
-        return
+    values = realtime_values(data)
+    if not values:
+        return 0
 
-    db = SessionLocal()
-    try:
-        for metric_type, metric_info in realtime_data.items():
-            value = metric_info.get("value")
-            if value is None:
+    samples = []
+    for metric_type, actual_value in values.items():
+        if last_values is not None:
+            # Windowed rules need every sample, unchanged ones included
+            if last_values.get(metric_type) == actual_value and not rule_index.window_groups(metric_type):
                 continue
-            
-            # Ensure value is a float for comparison
+            last_values[metric_type] = actual_value
+        samples.append((metric_type, actual_value))
+
+    alerts = []
+    try:
+        now = time.time()
+        if sharded_evaluator.should_shard(len(samples)):
+            # Large payloads match their VALUE rules on the process pool
+            started = time.perf_counter()
+            matched = await sharded_evaluator.match(samples)
+            for (metric_type, actual_value), violated_rules in zip(samples, matched):
+                evaluate_matched(metric_type, actual_value, now, violated_rules, alerts, index=rule_index)
+            elapsed = (time.perf_counter() - started) / len(samples)
+            for _ in samples:
+                _evaluation_latency.observe(elapsed)
+        else:
+            for metric_type, actual_value in samples:
+                started = time.perf_counter()
+                # Rules of all users for this metric type; still-firing rules are only
+                # re-notified once their cooldown has passed
+                evaluate_metric(metric_type, actual_value, now, alerts, index=rule_index)
+                _evaluation_latency.observe(time.perf_counter() - started)
+        if len(compound_index):
+            # Compound rules read the whole snapshot, so unchanged metrics count too
+            evaluate_compound(values, [metric_type for metric_type, _ in samples], alerts, index=compound_index)
+
+        await queue.enqueue_many(alerts)
+    except BaseException:
+        # Nothing was queued: the rules are notified again and the metrics
+        # re-evaluated on the next poll instead of after the cooldown
+        rollback_alerts(alerts)
+        if last_values is not None:
+            for metric_type, _ in samples:
+                last_values.pop(metric_type, None)
+        raise
+    return sum(len(rule_index.rules_for_metric(metric_type)) for metric_type, _ in samples)
+
+async def evaluate_source_payload(state):
+    """
+    Evaluates only the metrics that changed since the last poll. Everything is
+    re-evaluated periodically and whenever the rule set has changed. Returns the
+    number of active rules covering the evaluated metrics.
+    """
+    now = time.monotonic()
+    rules_version = (rule_index.version, compound_index.version)
+    if state.full_evaluation_due(now, rules_version):
+        state.last_values.clear()
+        state.evaluated_at = now
+        state.evaluated_version = rules_version
+    elif state.not_modified:
+        return 0
+    return await process_inverter_data(state.payload, delivery_queue, state.last_values)
+
+async def poll_source(client, source):
+    """
+    Polls one source on its own schedule, so a slow device never delays the others.
+    """
+    state = PollState()
+    rules_evaluated = POLL_RULES_EVALUATED.labels(source.name)
+    lease = f"poll:{source.name}"
+    coordinator.want(lease)
+    while True:
+        if not coordinator.holds(lease):
+            # Another worker polls this source; check again soon in case it goes away
+            await asyncio.sleep(min(source.interval_seconds, coordinator.sync_seconds))
+            continue
+
+        started = time.monotonic()
+        data = await fetch_data(client, source.url, source.name, source.timeout_seconds, state)
+        if data:
             try:
-                actual_value = float(value)
-            except (ValueError, TypeError):
-                continue
+                state.payload = source.adapt(data)
+            except Exception as e:
+                # A body of an unexpected shape is skipped like a failed fetch
+                logger.error(f"Unexpected {source.name} payload: {e}")
+                POLL_ERRORS.labels(source.name).inc()
+                state.payload = data = None
+                # Forget the validators so the same body is not taken as unchanged
+                state.etag = state.content_hash = None
+        if data or (state.not_modified and state.payload):
+            try:
+                rules_evaluated.observe(await evaluate_source_payload(state))
+            except Exception as e:
+                logger.error(f"Failed to process {source.name} data: {e}")
 
-            # Fetch all active rules for this metric type
-            rules = db.query(AlertRuleModel).filter(
-                AlertRuleModel.metric_type == metric_type,
-                AlertRuleModel.is_active == True
-            ).all()
-
-            for rule in rules:
-                if evaluate_condition(actual_value, rule.threshold_value, rule.condition):
-                    await delivery_service.send_alert(rule, actual_value)
-    finally:
-        db.close()
-
-async def poll_data_services():
-    """
-    Constantly queries the Kostal and Fronius services for real-time data.
-    """
-    delivery_service = AlertDeliveryService()
-    async with httpx.AsyncClient() as client:
-        while True:
-            # Fetch data from both services concurrently
-            results = await asyncio.gather(
-                fetch_data(client, KOSTAL_REALTIME_URL, "Kostal"),
-                fetch_data(client, FRONIUS_REALTIME_URL, "Fronius")
-            )
-            
-            for data in results:
-                if data:
-                    await process_inverter_data(data, delivery_service)
-            
-            # Wait for 60 seconds before next poll
-            await asyncio.sleep(60)
+        # Keep the interval between poll starts, not between poll ends
+        await asyncio.sleep(max(source.interval_seconds - (time.monotonic() - started), 0))
+
+async def supervise_poll_source(client, source):
+    """
+    Runs poll_source and restarts it after an unexpected error, so one failing
+    source never stops polling of the others.
+    """
+    while True:
+        try:
+            await poll_source(client, source)
+        except Exception as e:
+            logger.error(f"Polling {source.name} stopped unexpectedly, restarting: {e}")
+            POLL_ERRORS.labels(source.name).inc()
+            await asyncio.sleep(source.interval_seconds)
+
+def create_poll_client():
+    """
+    The HTTP client shared by all poll sources, with a bounded connection pool.
+    """
+    limits = httpx.Limits(
+        max_connections=POLL_MAX_CONNECTIONS,
+        max_keepalive_connections=POLL_MAX_KEEPALIVE_CONNECTIONS,
+    )
+    return httpx.AsyncClient(limits=limits)
+
+async def poll_data_services(client=None, sources=None):
+    """
+    Constantly queries the configured poll sources (Kostal and Fronius by default) for real-time data.
+    Without a client, one is created and closed again when polling stops. Without
+    sources, they are read with load_poll_sources.
+    """
+    if sources is None:
+        sources = load_poll_sources()
+    if client is None:
+        async with create_poll_client() as client:
+            await asyncio.gather(*(supervise_poll_source(client, source) for source in sources))
+        return
+    # Cancelling polling cancels every source task, since none of them ends on its own
+    await asyncio.gather(*(supervise_poll_source(client, source) for source in sources))
@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from database import run_with_session
+from models import AlertDeliveryJobModel, AlertStateModel, DeliveryChannel, DeliveryStatus
+from services.alert_delivery import AlertDeliveryService
+from services.alert_history import alert_history
+from services.alert_state import alert_state
+from services.coordination import coordinator
+from services.metrics import DELIVERIES, DELIVERY_LATENCY
+
+logger = logging.getLogger("uvicorn.info")
+
+ALERT_DELIVERY_WORKERS = int(os.getenv("ALERT_DELIVERY_WORKERS", "4"))
+ALERT_DELIVERY_MAX_ATTEMPTS = int(os.getenv("ALERT_DELIVERY_MAX_ATTEMPTS", "5"))
+ALERT_DELIVERY_RETRY_BASE_SECONDS = float(os.getenv("ALERT_DELIVERY_RETRY_BASE_SECONDS", "5"))
+ALERT_DELIVERY_RETRY_MAX_SECONDS = float(os.getenv("ALERT_DELIVERY_RETRY_MAX_SECONDS", "3600"))
+# A claimed job whose worker died becomes due again after this long
+ALERT_DELIVERY_CLAIM_TIMEOUT_SECONDS = float(os.getenv("ALERT_DELIVERY_CLAIM_TIMEOUT_SECONDS", "120"))
+ALERT_DELIVERY_CLAIM_BATCH = int(os.getenv("ALERT_DELIVERY_CLAIM_BATCH", "500"))
+# Jobs enqueued within this window are grouped into one digest email per recipient
+ALERT_DIGEST_WINDOW_SECONDS = float(os.getenv("ALERT_DIGEST_WINDOW_SECONDS", "2"))
+# Resend accepts at most 100 emails per batch call
+RESEND_BATCH_LIMIT = 100
+
+_DUE_STATUSES = (DeliveryStatus.PENDING.value, DeliveryStatus.IN_PROGRESS.value)
+
+
+def retry_delay(attempts, base=ALERT_DELIVERY_RETRY_BASE_SECONDS, maximum=ALERT_DELIVERY_RETRY_MAX_SECONDS):
+    """
+    Exponential backoff: base, 2 * base, 4 * base, ... capped at maximum.
+    """
+    return min(base * (2 ** (attempts - 1)), maximum)
+
+
+def _claim_cooldowns(db, alerts, now, cooldown):
+    """
+    Splits the alerts into those whose rule no worker notified within the cooldown
+    and (rule, last_sent_at) of the others, and marks the former as notified in
+    alert_states, inside the caller's transaction. Workers sharing the database
+    thereby notify a rule once per cooldown between them, whichever of them
+    evaluated it.
+    """
+    claimed, suppressed = [], []
+    for rule, actual_value in alerts:
+        updated = db.query(AlertStateModel).filter(
+            AlertStateModel.rule_id == rule.id,
+            AlertStateModel.last_sent_at <= now - cooldown,
+        ).update({AlertStateModel.last_sent_at: now}, synchronize_session=False)
+        if not updated:
+            row = db.query(AlertStateModel.last_sent_at).filter(AlertStateModel.rule_id == rule.id).first()
+            if row is not None:
+                # Another worker notified the rule within the cooldown
+                suppressed.append((rule, row[0]))
+                continue
+            db.add(AlertStateModel(rule_id=rule.id, metric_type=rule.metric_type, user_id=rule.user_id, last_sent_at=now))
+            db.flush()
+        claimed.append((rule, actual_value))
+    return claimed, suppressed
+
+
+def _insert_jobs(db, alerts, now, cooldown=None):
+    """
+    Stores a job per alert. Returns the alerts that were queued and the
+    (rule, last_sent_at) of those left out because, with a cooldown, another
+    worker already notified their rule.
+    """
+    suppressed = []
+    if cooldown is not None:
+        alerts, suppressed = _claim_cooldowns(db, alerts, now, cooldown)
+    db.add_all([
+        AlertDeliveryJobModel(
+            rule_id=rule.id,
+            user_id=rule.user_id,
+            metric_type=rule.metric_type,
+            threshold_value=rule.threshold_value,
+            condition=getattr(rule.condition, "value", rule.condition),
+            delivery_channel=getattr(rule.delivery_channel, "value", rule.delivery_channel),
+            actual_value=actual_value,
+            status=DeliveryStatus.PENDING.value,
+            attempts=0,
+            next_attempt_at=now,
+            created_at=now,
+        )
+        for rule, actual_value in alerts
+    ])
+    db.commit()
+    return alerts, suppressed
+
+
+def _oldest_due_email(db, now):
+    job = (
+        db.query(AlertDeliveryJobModel.created_at)
+        .filter(
+            AlertDeliveryJobModel.status.in_(_DUE_STATUSES),
+            AlertDeliveryJobModel.next_attempt_at <= now,
+            AlertDeliveryJobModel.delivery_channel == DeliveryChannel.EMAIL.value,
+        )
+        .order_by(AlertDeliveryJobModel.created_at)
+        .first()
+    )
+    return job[0] if job else None
+
+
+def _claim_due_jobs(db, limit, now, claim_timeout, digest_window=0):
+    """
+    Atomically marks up to `limit` due jobs as IN_PROGRESS for this caller.
+
+    Email jobs are held back until the oldest of them is digest_window old, so a
+    burst of alerts is claimed, and digested, together. Other channels are not held.
+
+    The claim token makes this safe when several processes share the database:
+    only rows still unclaimed at UPDATE time are returned to the claimer.
+    """
+    query = db.query(AlertDeliveryJobModel.id).filter(
+        AlertDeliveryJobModel.status.in_(_DUE_STATUSES),
+        AlertDeliveryJobModel.next_attempt_at <= now,
+    )
+    if digest_window > 0:
+        oldest = _oldest_due_email(db, now)
+        if oldest is not None and oldest > now - digest_window:
+            query = query.filter(AlertDeliveryJobModel.delivery_channel != DeliveryChannel.EMAIL.value)
+    ids = [
+        job_id
+        for (job_id,) in query
+        .order_by(AlertDeliveryJobModel.next_attempt_at, AlertDeliveryJobModel.id)
+        .limit(limit)
+    ]
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    db.query(AlertDeliveryJobModel).filter(
+        AlertDeliveryJobModel.id.in_(ids),
+        AlertDeliveryJobModel.status.in_(_DUE_STATUSES),
+        AlertDeliveryJobModel.next_attempt_at <= now,
+    ).update(
+        {
+            AlertDeliveryJobModel.status: DeliveryStatus.IN_PROGRESS.value,
+            AlertDeliveryJobModel.claimed_by: token,
+            AlertDeliveryJobModel.next_attempt_at: now + claim_timeout,
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return (
+        db.query(AlertDeliveryJobModel)
+        .filter(AlertDeliveryJobModel.claimed_by == token)
+        .order_by(AlertDeliveryJobModel.id)
+        .all()
+    )
+
+
+def _next_due_at(db, now, digest_window=0):
+    """
+    When _claim_due_jobs next has something to claim: the next retry, or the end
+    of the digest window of email jobs held back now.
+    """
+    job = (
+        db.query(AlertDeliveryJobModel.next_attempt_at)
+        .filter(
+            AlertDeliveryJobModel.status.in_(_DUE_STATUSES),
+            AlertDeliveryJobModel.next_attempt_at > now,
+        )
+        .order_by(AlertDeliveryJobModel.next_attempt_at)
+        .first()
+    )
+    candidates = [job[0]] if job else []
+    oldest = _oldest_due_email(db, now)
+    if oldest is not None:
+        candidates.append(oldest + digest_window)
+    return min(candidates, default=None)
+
+
+# The claim token in these filters keeps a claimant whose claim expired, and whose
+# jobs were claimed again by someone else, from completing or failing them
+
+def _complete_jobs(db, job_ids, token):
+    db.query(AlertDeliveryJobModel).filter(
+        AlertDeliveryJobModel.id.in_(job_ids),
+        AlertDeliveryJobModel.claimed_by == token,
+    ).delete(synchronize_session=False)
+    db.commit()
+
+
+def _fail_jobs(db, failures, error, token):
+    for job_id, attempts, next_attempt_at in failures:
+        values = {
+            AlertDeliveryJobModel.attempts: attempts,
+            AlertDeliveryJobModel.last_error: error[:500],
+            AlertDeliveryJobModel.claimed_by: None,
+        }
+        if next_attempt_at is None:
+            values[AlertDeliveryJobModel.status] = DeliveryStatus.DEAD.value
+        else:
+            values[AlertDeliveryJobModel.status] = DeliveryStatus.PENDING.value
+            values[AlertDeliveryJobModel.next_attempt_at] = next_attempt_at
+        db.query(AlertDeliveryJobModel).filter(
+            AlertDeliveryJobModel.id == job_id,
+            AlertDeliveryJobModel.claimed_by == token,
+        ).update(values, synchronize_session=False)
+    db.commit()
+
+
+def _count_pending(db):
+    return db.query(AlertDeliveryJobModel).filter(AlertDeliveryJobModel.status.in_(_DUE_STATUSES)).count()
+
+
+class DeliveryQueue:
+    """
+    Durable alert delivery queue stored in the alert_delivery_jobs table.
+
+    Evaluation code only enqueues jobs. A dispatcher task claims the due jobs and
+    splits them into delivery units: email jobs, claimed once the oldest of them is
+    digest_window seconds old so a burst shares its digests, become one batch call
+    carrying a digest per recipient; other channels are claimed right away and
+    delivered one job at a time. A bounded pool of worker tasks sends the units
+    through the sender (an AlertDeliveryService). A failed unit is retried with
+    exponential backoff and its jobs move to the DEAD state after max_attempts.
+    """
+
+    def __init__(
+        self,
+        sender,
+        workers=ALERT_DELIVERY_WORKERS,
+        max_attempts=ALERT_DELIVERY_MAX_ATTEMPTS,
+        claim_timeout=ALERT_DELIVERY_CLAIM_TIMEOUT_SECONDS,
+        digest_window=ALERT_DIGEST_WINDOW_SECONDS,
+        claim_batch=ALERT_DELIVERY_CLAIM_BATCH,
+    ):
+        self.sender = sender
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.digest_window = digest_window
+        self.claim_batch = claim_batch
+        self._wake = None
+        self._units = None
+        self._tasks = []
+
+    async def enqueue(self, rule, actual_value):
+        await self.enqueue_many([(rule, actual_value)])
+
+    async def enqueue_many(self, alerts):
+        """
+        Persists (rule, actual_value) pairs in a single transaction and records
+        them in the alert history. With coordination, the cooldown is checked
+        against the alert state shared by all workers in the same transaction.
+        """
+        if not alerts:
+            return
+        now = time.time()
+        cooldown = alert_state.cooldown if coordinator.enabled else None
+        queued, suppressed = await run_with_session(_insert_jobs, alerts, now, cooldown)
+        for rule, last_sent_at in suppressed:
+            alert_state.adopt(rule, last_sent_at)
+        # Only alerts that were actually queued make it into the history
+        alert_history.record(queued, now)
+        self._notify()
+
+    async def pending_count(self):
+        return await run_with_session(_count_pending)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._units = asyncio.Queue(maxsize=self.workers)
+        self._wake = asyncio.Event()
+        self._wake.set()
+        self._tasks = [asyncio.create_task(self._dispatch())]
+        self._tasks += [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Alert delivery queue started with {self.workers} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wake = None
+        self._units = None
+
+    def split_units(self, jobs):
+        """
+        Groups claimed jobs into delivery units: batches of email jobs covering at most
+        RESEND_BATCH_LIMIT recipients, and single jobs for every other channel.
+        """
+        units = []
+        by_recipient = {}
+        for job in jobs:
+            if job.delivery_channel == DeliveryChannel.EMAIL:
+                by_recipient.setdefault(self.sender.email_recipient(job), []).append(job)
+            else:
+                units.append([job])
+
+        recipients = list(by_recipient.values())
+        for start in range(0, len(recipients), RESEND_BATCH_LIMIT):
+            units.append([job for group in recipients[start:start + RESEND_BATCH_LIMIT] for job in group])
+        return units
+
+    def _notify(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _dispatch(self):
+        while True:
+            try:
+                jobs = await run_with_session(
+                    _claim_due_jobs, self.claim_batch, time.time(), self.claim_timeout, self.digest_window
+                )
+            except Exception as e:
+                logger.error(f"Failed to claim alert delivery jobs: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if jobs:
+                for unit in self.split_units(jobs):
+                    await self._units.put(unit)
+                continue
+
+            # Nothing is due: sleep until the next retry, the end of a digest window
+            # or until new jobs are enqueued
+            self._wake.clear()
+            try:
+                next_due_at = await run_with_session(_next_due_at, time.time(), self.digest_window)
+            except Exception as e:
+                logger.error(f"Failed to read alert delivery queue: {e}")
+                next_due_at = time.time() + self.claim_timeout
+            timeout = None if next_due_at is None else max(next_due_at - time.time(), 0.0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            unit = await self._units.get()
+            try:
+                await self._deliver(unit)
+            except Exception as e:
+                # Keeps the worker alive; the jobs become due again once their claim expires
+                logger.error(f"Failed to deliver {len(unit)} alert delivery jobs: {e}")
+            finally:
+                self._units.task_done()
+
+    async def _deliver(self, unit):
+        channel = unit[0].delivery_channel
+        # Every job of a unit comes from the same claim
+        token = unit[0].claimed_by
+        started = time.perf_counter()
+        try:
+            if channel == DeliveryChannel.EMAIL:
+                await self.sender.deliver_batch([(job, job.actual_value) for job in unit])
+            else:
+                await self.sender.deliver(unit[0], unit[0].actual_value)
+        except Exception as e:
+            DELIVERY_LATENCY.labels(channel).observe(time.perf_counter() - started)
+            DELIVERIES.labels(channel, "failure").inc(len(unit))
+            failures = []
+            for job in unit:
+                attempts = job.attempts + 1
+                if attempts >= self.max_attempts:
+                    logger.error(f"Alert delivery job {job.id} failed permanently after {attempts} attempts: {e}")
+                    failures.append((job.id, attempts, None))
+                else:
+                    logger.warning(f"Alert delivery job {job.id} failed (attempt {attempts}), retrying: {e}")
+                    failures.append((job.id, attempts, time.time() + retry_delay(attempts)))
+            await run_with_session(_fail_jobs, failures, str(e), token)
+            self._notify()
+            return
+
+        DELIVERY_LATENCY.labels(channel).observe(time.perf_counter() - started)
+        DELIVERIES.labels(channel, "success").inc(len(unit))
+        await run_with_session(_complete_jobs, [job.id for job in unit], token)
+
+
+delivery_queue = DeliveryQueue(AlertDeliveryService())
@@ -0,0 +1,120 @@
+from services.alert_state import alert_state
+from services.compound_rules import compound_index
+from services.rule_index import rule_index
+from services.windowed_rules import rolling_windows
+
+
+def _evaluate(metric_type, value, timestamp, user_id, violated_rules, window_groups, alerts, state, windows):
+    windowed = windows.match(metric_type, value, timestamp, window_groups, user_id)
+    if not windowed:
+        notify = state.filter_alerts(metric_type, violated_rules, user_id)
+        alerts.extend((rule, value) for rule in notify)
+        return violated_rules
+
+    aggregates = {rule.id: aggregate for rule, aggregate in windowed}
+    violated_rules = violated_rules + [rule for rule, _ in windowed]
+    notify = state.filter_alerts(metric_type, violated_rules, user_id)
+    alerts.extend((rule, aggregates.get(rule.id, value)) for rule in notify)
+    return violated_rules
+
+
+def rollback_alerts(alerts, state=None):
+    """
+    Undoes the notification marks of (rule, value) alerts that were evaluated but
+    never queued, e.g. because enqueue_many failed.
+    """
+    state = alert_state if state is None else state
+    state.rollback([rule for rule, _ in alerts])
+
+
+def evaluate_metric(metric_type, value, timestamp, alerts, user_id=None, index=None, state=None, windows=None):
+    """
+    Evaluates one sample against the VALUE and windowed rules of one user, or of all
+    users when user_id is None. Appends a (rule, value) alert for each rule due a
+    notification and returns every violated rule.
+
+    Windowed rules are notified with their aggregate (the average, the rate, ...)
+    instead of the raw sample.
+    """
+    index = rule_index if index is None else index
+    state = alert_state if state is None else state
+    windows = rolling_windows if windows is None else windows
+    windows.sync(index)
+    return _evaluate(
+        metric_type, value, timestamp, user_id,
+        index.match(metric_type, value, user_id), index.window_groups(metric_type, user_id),
+        alerts, state, windows,
+    )
+
+
+def evaluate_matched(metric_type, value, timestamp, violated_rules, alerts, user_id=None, index=None, state=None, windows=None):
+    """
+    Like evaluate_metric for a sample whose VALUE rules were already matched
+    elsewhere, e.g. in another process; windowed rules and alert state are still
+    handled here.
+    """
+    index = rule_index if index is None else index
+    state = alert_state if state is None else state
+    windows = rolling_windows if windows is None else windows
+    windows.sync(index)
+    return _evaluate(
+        metric_type, value, timestamp, user_id, violated_rules, index.window_groups(metric_type, user_id),
+        alerts, state, windows,
+    )
+
+
+def evaluate_points(points, alerts, index=None, state=None, windows=None):
+    """
+    Evaluates a batch of (metric_type, value, timestamp, user_id) points like
+    evaluate_metric and returns the violated rules of each point, in input order.
+
+    Points of the same metric and user share one rule lookup and are evaluated in
+    arrival order, so rolling windows and alert state see them as they came in.
+    """
+    index = rule_index if index is None else index
+    state = alert_state if state is None else state
+    windows = rolling_windows if windows is None else windows
+    windows.sync(index)
+
+    groups = {}
+    for position, (metric_type, _, _, user_id) in enumerate(points):
+        groups.setdefault((metric_type, user_id), []).append(position)
+
+    results = [None] * len(points)
+    for (metric_type, user_id), positions in groups.items():
+        compiled = index.compiled(metric_type, user_id)
+        if compiled is None:
+            # Nothing to match; resolving the metric's state once covers every point
+            state.filter_alerts(metric_type, [], user_id)
+            for position in positions:
+                results[position] = []
+            continue
+        matcher, window_groups = compiled
+        for position in positions:
+            _, value, timestamp, _ = points[position]
+            results[position] = _evaluate(
+                metric_type, value, timestamp, user_id, matcher.match(value), window_groups, alerts, state, windows,
+            )
+    return results
+
+
+def evaluate_compound(values, changed_metrics, alerts, index=None, state=None):
+    """
+    Evaluates the compound rules that reference any of changed_metrics against one
+    {metric_type: value} snapshot, for all users. Rules whose metrics are not all in
+    the snapshot are left alone. Appends a (rule, value) alert for each rule due a
+    notification, with the value of the rule's first metric, and returns every
+    violated rule.
+    """
+    index = compound_index if index is None else index
+    state = alert_state if state is None else state
+    violated_rules = []
+    for scope, rules in index.scopes_for(changed_metrics).items():
+        # Every rule of a scope references the same metrics
+        if not all(metric in values for metric in rules[0].metrics):
+            continue
+        violated = [rule for rule in rules if rule.evaluate(values)]
+        notify = state.filter_alerts(scope, violated, None)
+        alerts.extend((rule, values[rule.metrics[0]]) for rule in notify)
+        violated_rules.extend(violated)
+    return violated_rules
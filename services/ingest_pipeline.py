@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import time
+
+from services.delivery_queue import delivery_queue
+from services.evaluation import evaluate_points, rollback_alerts
+from services.metrics import INGEST_MICROBATCH_SIZE, RULE_EVALUATION_LATENCY
+from services.rule_index import rule_index
+
+logger = logging.getLogger("uvicorn.info")
+
+# How long a data point may wait for others to share its evaluation; 0 evaluates
+# every point on its own
+INGEST_MICROBATCH_WINDOW_MS = float(os.getenv("INGEST_MICROBATCH_WINDOW_MS", "2"))
+INGEST_MICROBATCH_MAX_SIZE = int(os.getenv("INGEST_MICROBATCH_MAX_SIZE", "256"))
+
+_evaluation_latency = RULE_EVALUATION_LATENCY.labels("ingest")
+
+
+class MicroBatcher:
+    """
+    Groups data points submitted by concurrent ingest requests and evaluates them
+    together once window_ms passed since the first one arrived, or as soon as
+    max_size points are waiting. While no batch is being processed, points are
+    evaluated on the next event loop turn instead, so a lone request never waits
+    for the window.
+
+    A batch looks up the rules of each metric and user once, evaluates all its
+    points in one pass and stores their alerts in a single delivery queue
+    transaction. Every submitter then gets the violated rules of its own point,
+    or the batch's error if storing the alerts failed.
+    """
+
+    def __init__(self, window_ms=INGEST_MICROBATCH_WINDOW_MS, max_size=INGEST_MICROBATCH_MAX_SIZE, index=None):
+        self.window = window_ms / 1000
+        self.max_size = max(max_size, 1)
+        self.index = rule_index if index is None else index
+        self._pending = []  # (point, future)
+        self._timer = None
+        self._loop = None
+        self._processing = 0
+        # Running batches; the loop only keeps weak references to its tasks
+        self._tasks = set()
+
+    @property
+    def enabled(self):
+        return self.window > 0 and self.max_size > 1
+
+    async def submit(self, point):
+        """
+        Evaluates a (metric_type, value, timestamp, user_id) point and returns the
+        rules it violates once its batch is evaluated and the alerts are queued.
+        """
+        if not self.enabled:
+            return (await self._process([point]))[0]
+
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Pending futures and the timer belong to the loop they were made on
+            self._pending, self._timer, self._loop, self._tasks = [], None, loop, set()
+        future = loop.create_future()
+        self._pending.append((point, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window if self._processing else 0, self._flush)
+        return await future
+
+    def pending(self):
+        return len(self._pending)
+
+    async def stop(self):
+        """
+        Evaluates the points still waiting for their window and waits for every
+        running batch, so no submitter is left without a result.
+        """
+        if self._loop is not asyncio.get_running_loop():
+            return
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # Batches are evaluated in the order they were flushed, since tasks start FIFO
+            task = self._loop.create_task(self._resolve(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, batch):
+        self._processing += 1
+        try:
+            results = await self._process([point for point, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to evaluate a batch of {len(batch)} data points: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._processing -= 1
+        for (_, future), violated_rules in zip(batch, results):
+            # A submitter whose request was cancelled no longer waits for its result
+            if not future.done():
+                future.set_result(violated_rules)
+
+    async def _process(self, points):
+        started = time.perf_counter()
+        alerts = []
+        try:
+            results = evaluate_points(points, alerts, self.index)
+            elapsed = (time.perf_counter() - started) / len(points)
+            for _ in points:
+                _evaluation_latency.observe(elapsed)
+            INGEST_MICROBATCH_SIZE.observe(len(points))
+            await delivery_queue.enqueue_many(alerts)
+        except BaseException:
+            rollback_alerts(alerts)
+            raise
+        return results
+
+
+ingest_pipeline = MicroBatcher()
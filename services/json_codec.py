@@ -0,0 +1,38 @@
+import json
+
+from fastapi.responses import JSONResponse
+
+# orjson is used when installed; everything falls back to the standard library otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """
+    Decodes JSON from bytes or str. Invalid JSON raises a ValueError either way.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, default=None):
+    """
+    Encodes obj as compact UTF-8 JSON bytes. default, if given, converts objects
+    the codec cannot encode itself.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=default)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with the fast codec. Content passed to it directly must
+    be made of plain JSON types; routes returning models are encoded by FastAPI first.
+    """
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,189 @@
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from services import json_codec
+
+# "sync" writes log lines on the calling thread; "async" hands records to a
+# background thread, which formats and writes them
+LOG_MODE = os.getenv("LOG_MODE", "sync")
+# "text" keeps the uvicorn line format; "json" writes one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Share of the repetitive poll and alert lines that are kept; 0 drops them all
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))
+# Records waiting for the background thread; further records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+LOG_MODES = ("sync", "async")
+LOG_FORMATS = ("text", "json")
+SERVICE_LOGGER = "uvicorn.info"
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "sampled"}
+
+
+def sampled(**fields):
+    """
+    extra= for a repetitive line that LOG_SAMPLE_RATE may thin out. The fields
+    become structured fields of JSON log lines.
+    """
+    return {"sampled": True, **fields}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps one in every 1/rate records logged with extra=sampled(...), counted per
+    message template, so each kind of repetitive line is thinned out evenly.
+    Other records always pass.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counts = {}
+
+    def filter(self, record):
+        if self.every == 1 or not getattr(record, "sampled", False):
+            return True
+        if self.every == 0:
+            return False
+        count = self._counts.get(record.msg, 0)
+        self._counts[record.msg] = count + 1
+        return count % self.every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, logger and message, plus every field
+    passed through extra=.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json_codec.dumps(entry, default=str).decode("utf-8")
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Puts records on the queue as they are, so their messages are formatted on the
+    listener thread instead of the caller's. Log arguments must therefore not be
+    mutated after the call. A full queue drops the record instead of blocking.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Waits for room instead of failing when stop() meets a full queue
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+# Handlers, propagate flag and level of each configured logger before configure_logging
+_saved = {}
+
+
+def _effective_handlers(logger):
+    # The handlers a record of this logger would reach through propagation
+    while logger is not None:
+        if logger.handlers:
+            return list(logger.handlers)
+        if not logger.propagate:
+            break
+        logger = logger.parent
+    return []
+
+
+def configure_logging(
+    mode=LOG_MODE,
+    log_format=LOG_FORMAT,
+    sample_rate=LOG_SAMPLE_RATE,
+    queue_size=LOG_QUEUE_SIZE,
+    name=SERVICE_LOGGER,
+):
+    """
+    Applies the logging settings to the service logger. With the defaults only
+    sampling is added; the handlers uvicorn set up are left alone. Calling it
+    again replaces the previous configuration.
+    """
+    global _listener
+    if mode not in LOG_MODES:
+        raise ValueError(f"Unknown LOG_MODE '{mode}'")
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown LOG_FORMAT '{log_format}'")
+    stop_logging(name)
+    logger = logging.getLogger(name)
+
+    logger.addFilter(SamplingFilter(sample_rate))
+    if mode == "sync" and log_format == "text":
+        return
+
+    if log_format == "json":
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        handlers = [handler]
+    else:
+        handlers = _effective_handlers(logger)
+        if not handlers:
+            handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+            handlers = [handler]
+
+    if mode == "async":
+        log_queue = queue.Queue(queue_size)
+        _listener = _Listener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        handlers = [DeferredQueueHandler(log_queue)]
+
+    _saved[name] = (logger.handlers, logger.propagate, logger.level)
+    logger.handlers = handlers
+    logger.propagate = False
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+
+
+def _restore(logger):
+    for existing in [f for f in logger.filters if isinstance(f, SamplingFilter)]:
+        logger.removeFilter(existing)
+    saved = _saved.pop(logger.name, None)
+    if saved is not None:
+        logger.handlers, logger.propagate, level = saved
+        logger.setLevel(level)
+
+
+def stop_logging(name=SERVICE_LOGGER):
+    """
+    Stops the background thread after it has written every queued record and
+    gives the logger back its previous handlers.
+    """
+    global _listener
+    # Handlers first, so nothing is queued after the thread drained the queue
+    _restore(logging.getLogger(name))
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,200 @@
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # The last slot is the +Inf bucket
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _Metric(ABC):
+    """
+    A metric family. labels() returns a child that callers may keep and reuse;
+    updating a child is a plain attribute increment with no locking or formatting,
+    so a rare lost update under thread contention is accepted.
+    """
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """
+        Returns a new child holding the values of one label combination.
+        """
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_text(values)} {_number(child.value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{self._label_text(values, [('le', _number(bound))])} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_text(values)} {_number(child.sum)}")
+        lines.append(f"{self.name}_count{self._label_text(values)} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NaN"
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if not value.is_integer():
+            return repr(value)
+    return str(int(value))
+
+
+registry = MetricsRegistry()
+
+INGEST_REQUESTS = registry.counter(
+    "alerting_ingest_requests_total", "Ingestion requests by outcome: ok, rejected or failed.", ["endpoint", "status"])
+INGEST_LATENCY = registry.histogram(
+    "alerting_ingest_request_seconds", "Handling time of successful ingestion requests.", ["endpoint"])
+RULE_EVALUATION_LATENCY = registry.histogram(
+    "alerting_rule_evaluation_seconds", "Rule matching time per data point.", ["path"])
+INGEST_MICROBATCH_SIZE = registry.histogram(
+    "alerting_ingest_microbatch_size", "Data points evaluated together by the ingest pipeline.",
+    buckets=COUNT_BUCKETS)
+POLL_RULES_EVALUATED = registry.histogram(
+    "alerting_poll_rules_evaluated", "Active rules covering the metrics evaluated in one poll.", ["source"],
+    buckets=COUNT_BUCKETS)
+POLL_FETCH_LATENCY = registry.histogram(
+    "alerting_poll_fetch_seconds", "Time to fetch a poll source.", ["source"])
+POLL_ERRORS = registry.counter(
+    "alerting_poll_errors_total", "Failed poll fetches.", ["source"])
+DELIVERY_LATENCY = registry.histogram(
+    "alerting_delivery_seconds", "Time to deliver one unit of alerts.", ["channel"])
+DELIVERIES = registry.counter(
+    "alerting_deliveries_total", "Delivered alerts by outcome.", ["channel", "outcome"])
+DELIVERY_QUEUE_DEPTH = registry.gauge(
+    "alerting_delivery_queue_depth", "Alerts waiting in the delivery queue.")
+DASHBOARD_SUBSCRIBERS = registry.gauge(
+    "alerting_dashboard_subscribers", "Connected dashboard stream clients.")
+DASHBOARD_MESSAGES_DROPPED = registry.counter(
+    "alerting_dashboard_messages_dropped_total", "Dashboard messages dropped for slow clients.")
+INGEST_REJECTED = registry.counter(
+    "alerting_ingest_rejected_total", "Ingestion requests or items shed by admission control.", ["endpoint", "reason"])
@@ -0,0 +1,94 @@
+import json
+import os
+from typing import List
+
+from pydantic import BaseModel, Field
+
+# Default URLs (can be overridden by env vars)
+KOSTAL_REALTIME_URL = os.getenv("KOSTAL_SERVICE_URL", "http://kostal-ms:8082/kostal/realtimedata")  # NOSONAR
+FRONIUS_REALTIME_URL = os.getenv("FRONIUS_SERVICE_URL", "http://fronius-ms:8081/fronius/realtimedata")  # NOSONAR
+POLL_INTERVAL_SECONDS = float(os.getenv("POLL_INTERVAL_SECONDS", "60"))
+POLL_TIMEOUT_SECONDS = float(os.getenv("POLL_TIMEOUT_SECONDS", "10"))
+
+# Connection pool shared by every poll source
+POLL_MAX_CONNECTIONS = int(os.getenv("POLL_MAX_CONNECTIONS", "100"))
+POLL_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("POLL_MAX_KEEPALIVE_CONNECTIONS", "50"))
+
+PAYLOAD_ADAPTERS = {}
+
+
+def payload_adapter(name):
+    """
+    Registers a function that turns a source's raw JSON payload into the
+    {"realtime_data": {metric: {"value": ...}}} shape evaluated by the poller.
+    """
+    def register(adapter):
+        PAYLOAD_ADAPTERS[name] = adapter
+        return adapter
+    return register
+
+
+@payload_adapter("realtime_data")
+def adapt_realtime_data(payload):
+    # Kostal and Fronius services already answer in the evaluated shape
+    return payload
+
+
+@payload_adapter("flat")
+def adapt_flat(payload):
+    # {"battery_capacity": 70, ...}
+    return {"realtime_data": {metric: {"value": value} for metric, value in payload.items()}}
+
+
+def realtime_values(data):
+    """
+    Returns {metric_type: value} of the payload's realtime_data, leaving out
+    metrics without a numeric value.
+    """
+    values = {}
+    for metric_type, metric_info in data.get("realtime_data", {}).items():
+        value = metric_info.get("value")
+        if value is None:
+            continue
+
+        # Ensure value is a float for comparison
+        try:
+            values[metric_type] = float(value)
+        except (ValueError, TypeError):
+            continue
+    return values
+
+
+class PollSource(BaseModel):
+    name: str
+    url: str
+    interval_seconds: float = Field(default=POLL_INTERVAL_SECONDS, gt=0)
+    timeout_seconds: float = Field(default=POLL_TIMEOUT_SECONDS, gt=0)
+    adapter: str = "realtime_data"
+
+    def adapt(self, payload):
+        return PAYLOAD_ADAPTERS[self.adapter](payload)
+
+
+def load_poll_sources() -> List[PollSource]:
+    """
+    Reads the poll sources from the JSON list in POLL_SOURCES, or the JSON file named
+    by POLL_SOURCES_FILE. Without either, Kostal and Fronius are polled.
+    """
+    raw = os.getenv("POLL_SOURCES")
+    path = os.getenv("POLL_SOURCES_FILE")
+    if raw is None and path:
+        with open(path) as f:
+            raw = f.read()
+
+    if raw is None:
+        return [
+            PollSource(name="Kostal", url=KOSTAL_REALTIME_URL),
+            PollSource(name="Fronius", url=FRONIUS_REALTIME_URL),
+        ]
+
+    sources = [PollSource.model_validate(entry) for entry in json.loads(raw)]
+    for source in sources:
+        if source.adapter not in PAYLOAD_ADAPTERS:
+            raise ValueError(f"Unknown payload adapter '{source.adapter}' for poll source {source.name}")
+    return sources
@@ -0,0 +1,233 @@
+import threading
+import logging
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from models import AlertRuleModel, Aggregation
+from services.rule_matcher import ThresholdMatcher
+from services.windowed_rules import compile_window_groups
+
+logger = logging.getLogger("uvicorn.info")
+
+
+class CachedRule(NamedTuple):
+    """
+    Immutable, session-independent copy of an active AlertRuleModel row.
+    """
+    id: int
+    user_id: str
+    metric_type: str
+    threshold_value: float
+    condition: str
+    delivery_channel: str
+    aggregation: str = Aggregation.VALUE.value
+    window_seconds: Optional[float] = None
+
+    @classmethod
+    def from_model(cls, rule):
+        return cls(
+            id=rule.id,
+            user_id=rule.user_id,
+            metric_type=rule.metric_type,
+            threshold_value=rule.threshold_value,
+            condition=_plain(rule.condition),
+            delivery_channel=_plain(rule.delivery_channel),
+            # Rows written before windowed rules existed may lack both fields
+            aggregation=_plain(getattr(rule, "aggregation", None)) or Aggregation.VALUE.value,
+            window_seconds=getattr(rule, "window_seconds", None),
+        )
+
+
+def _plain(value):
+    # Enum members coming from Pydantic are stored as their raw string value
+    return getattr(value, "value", value)
+
+
+def _replace_without(buckets, key, rule_ids):
+    bucket = tuple(rule for rule in buckets.get(key, ()) if rule.id not in rule_ids)
+    if bucket:
+        buckets[key] = bucket
+    else:
+        buckets.pop(key, None)
+
+
+class RuleIndex:
+    """
+    In-process index of active alert rules keyed by (metric_type, user_id).
+
+    Readers never take a lock: every write replaces the affected bucket with a
+    new tuple, so a reader always sees either the old or the new bucket. Matchers
+    are compiled lazily per bucket and reused for as long as that bucket is current.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_key: Dict[Tuple[str, str], Tuple[CachedRule, ...]] = {}
+        self._by_metric: Dict[str, Tuple[CachedRule, ...]] = {}
+        self._keys_by_id: Dict[int, Tuple[str, str]] = {}
+        self._matchers = {}
+        # Bumped on every change so callers can tell whether their cached results are stale
+        self.version = 0
+
+    def load(self, db):
+        """
+        Replaces the index contents with all active threshold rules from the
+        database. Compound rules live in the CompoundRuleIndex.
+        """
+        rules = db.query(AlertRuleModel).filter(
+            AlertRuleModel.is_active == True, AlertRuleModel.expression.is_(None),
+        ).all()
+        self.replace_all(CachedRule.from_model(rule) for rule in rules)
+
+    def replace_all(self, rules):
+        """
+        Replaces the index contents with the given CachedRules, e.g. a snapshot().
+        """
+        by_key = {}
+        keys_by_id = {}
+        for cached in rules:
+            key = (cached.metric_type, cached.user_id)
+            by_key.setdefault(key, []).append(cached)
+            keys_by_id[cached.id] = key
+
+        with self._lock:
+            self._by_key = {key: tuple(bucket) for key, bucket in by_key.items()}
+            self._keys_by_id = keys_by_id
+            self._by_metric = self._group_by_metric(self._by_key)
+            self._matchers = {}
+            self.version += 1
+        logger.info(f"Rule index loaded with {len(keys_by_id)} active rules")
+
+    def add(self, rule):
+        """
+        Inserts or replaces a single rule. Inactive rules are removed instead.
+        """
+        self.add_many([rule])
+
+    def add_many(self, rules):
+        """
+        Inserts or replaces several rules under one lock acquisition, so every
+        affected bucket is rebuilt once. Inactive rules are removed instead.
+        """
+        with self._lock:
+            added = {}
+            for rule in rules:
+                added.pop(rule.id, None)
+                if rule.is_active:
+                    added[rule.id] = CachedRule.from_model(rule)
+            self._discard([rule.id for rule in rules])
+
+            by_key, by_metric = {}, {}
+            for cached in added.values():
+                key = (cached.metric_type, cached.user_id)
+                by_key.setdefault(key, []).append(cached)
+                by_metric.setdefault(key[0], []).append(cached)
+                self._keys_by_id[cached.id] = key
+            for key, bucket in by_key.items():
+                self._by_key[key] = self._by_key.get(key, ()) + tuple(bucket)
+            for metric_type, bucket in by_metric.items():
+                self._by_metric[metric_type] = self._by_metric.get(metric_type, ()) + tuple(bucket)
+            self.version += 1
+
+    def remove(self, rule_id):
+        self.remove_many([rule_id])
+
+    def remove_many(self, rule_ids):
+        with self._lock:
+            self._discard(rule_ids)
+            self.version += 1
+
+    def clear(self):
+        with self._lock:
+            self._by_key = {}
+            self._by_metric = {}
+            self._keys_by_id = {}
+            self._matchers = {}
+            self.version += 1
+
+    def rules_for(self, metric_type, user_id):
+        return self._by_key.get((metric_type, user_id), ())
+
+    def rules_for_metric(self, metric_type):
+        return self._by_metric.get(metric_type, ())
+
+    def match(self, metric_type, value, user_id=None):
+        """
+        Returns the active VALUE rules violated by the value, for one user or for all
+        users. Windowed rules are matched by RollingWindows using window_groups().
+        """
+        compiled = self.compiled(metric_type, user_id)
+        return compiled[0].match(value) if compiled else []
+
+    def window_groups(self, metric_type, user_id=None):
+        """
+        Returns the compiled windowed rules for one user or for all users, as
+        expected by RollingWindows.match.
+        """
+        compiled = self.compiled(metric_type, user_id)
+        return compiled[1] if compiled else ()
+
+    def compiled(self, metric_type, user_id=None):
+        """
+        Returns (ThresholdMatcher of the VALUE rules, window groups) for one user or
+        for all users, or None when no rule covers the metric. Callers evaluating
+        many values of the same metric look this up once.
+        """
+        if user_id is None:
+            key, bucket = metric_type, self._by_metric.get(metric_type)
+        else:
+            key = (metric_type, user_id)
+            bucket = self._by_key.get(key)
+        if not bucket:
+            return None
+
+        cached = self._matchers.get(key)
+        if cached is None or cached[0] is not bucket:
+            value_rules = [rule for rule in bucket if rule.aggregation == Aggregation.VALUE]
+            cached = (bucket, ThresholdMatcher(value_rules), compile_window_groups(bucket))
+            self._matchers[key] = cached
+        return cached[1:]
+
+    def snapshot(self):
+        """
+        Returns (version, rules): every indexed rule as a picklable CachedRule, for
+        building the same index in another process.
+        """
+        version = self.version
+        return version, [rule for bucket in list(self._by_key.values()) for rule in bucket]
+
+    def warm(self):
+        """
+        Compiles the matchers of every metric and user up front, so the first data
+        points after a load do not pay for it.
+        """
+        for metric_type in list(self._by_metric):
+            self.compiled(metric_type)
+        for metric_type, user_id in list(self._by_key):
+            self.compiled(metric_type, user_id)
+
+    def __len__(self):
+        return len(self._keys_by_id)
+
+    def _discard(self, rule_ids):
+        by_key, by_metric = {}, {}
+        for rule_id in rule_ids:
+            key = self._keys_by_id.pop(rule_id, None)
+            if key is not None:
+                by_key.setdefault(key, set()).add(rule_id)
+                by_metric.setdefault(key[0], set()).add(rule_id)
+        for key, ids in by_key.items():
+            _replace_without(self._by_key, key, ids)
+            self._matchers.pop(key, None)
+        for metric_type, ids in by_metric.items():
+            _replace_without(self._by_metric, metric_type, ids)
+            self._matchers.pop(metric_type, None)
+
+    @staticmethod
+    def _group_by_metric(by_key):
+        by_metric = {}
+        for (metric_type, _), rules in by_key.items():
+            by_metric.setdefault(metric_type, []).extend(rules)
+        return {metric: tuple(rules) for metric, rules in by_metric.items()}
+
+
+rule_index = RuleIndex()
@@ -0,0 +1,47 @@
+from bisect import bisect_left, bisect_right
+
+from models import Condition
+
+
+class ThresholdMatcher:
+    """
+    Matches a value against a group of single-metric rules without looping over them.
+
+    GREATER_THAN and LESS_THAN rules are kept sorted by threshold, so every violated
+    rule of either kind is a contiguous slice found with one binary search. EQUALS
+    rules are bucketed by threshold in a dict. Rules with any other condition never
+    match, the same as evaluate_condition.
+    """
+
+    __slots__ = ("_gt_thresholds", "_gt_rules", "_lt_thresholds", "_lt_rules", "_eq_rules")
+
+    def __init__(self, rules):
+        greater = sorted(
+            (rule for rule in rules if rule.condition == Condition.GREATER_THAN),
+            key=lambda rule: rule.threshold_value,
+        )
+        less = sorted(
+            (rule for rule in rules if rule.condition == Condition.LESS_THAN),
+            key=lambda rule: rule.threshold_value,
+        )
+        self._gt_thresholds = [rule.threshold_value for rule in greater]
+        self._gt_rules = tuple(greater)
+        self._lt_thresholds = [rule.threshold_value for rule in less]
+        self._lt_rules = tuple(less)
+
+        self._eq_rules = {}
+        for rule in rules:
+            if rule.condition == Condition.EQUALS:
+                self._eq_rules.setdefault(rule.threshold_value, []).append(rule)
+
+    def match(self, value):
+        """
+        Returns every rule violated by the value.
+        """
+        # value > threshold for every threshold strictly below the value
+        violated = list(self._gt_rules[:bisect_left(self._gt_thresholds, value)])
+        # value < threshold for every threshold strictly above the value
+        violated.extend(self._lt_rules[bisect_right(self._lt_thresholds, value):])
+        if self._eq_rules:
+            violated.extend(self._eq_rules.get(value, ()))
+        return violated
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+
+from models import Aggregation
+from services.rule_index import RuleIndex, rule_index
+
+logger = logging.getLogger("uvicorn.info")
+
+# Worker processes matching large poll payloads; 0 keeps all evaluation in-process
+POLL_EVALUATION_PROCESSES = int(os.getenv("POLL_EVALUATION_PROCESSES", "0"))
+# Payloads with fewer metrics to evaluate stay on the in-process path
+POLL_EVALUATION_SHARD_MIN_METRICS = int(os.getenv("POLL_EVALUATION_SHARD_MIN_METRICS", "500"))
+
+# The rule snapshot of a worker process and the index version it was taken at
+_snapshot = None
+_snapshot_version = None
+
+
+def _load_snapshot(version, rules):
+    global _snapshot, _snapshot_version
+    snapshot = RuleIndex()
+    snapshot.replace_all(rules)
+    snapshot.warm()
+    _snapshot, _snapshot_version = snapshot, version
+
+
+def _match_shard(version, samples, rules=None):
+    if version != _snapshot_version:
+        if rules is None:
+            # Stale snapshot: the caller sends the shard again with the pickled rules
+            return None
+        _load_snapshot(version, pickle.loads(rules))
+    # Rule ids are far cheaper to send back than the rules themselves
+    return [[rule.id for rule in _snapshot.match(metric_type, value)] for metric_type, value in samples]
+
+
+class ShardedEvaluator:
+    """
+    Matches the VALUE rules of large poll payloads on a process pool.
+
+    The pool is started once and every worker holds a snapshot of the rule index.
+    Each shard carries the index version it was matched for; a worker whose
+    snapshot is older answers None and gets the shard again together with the
+    pickled rules, so rule changes are picked up by the next payload without
+    restarting the workers. The samples of a payload are split into one
+    shard per process, each metric going to exactly one shard, and the violated
+    rules come back in sample order. Windowed rules and alert state stay in the
+    event loop process, which sees every sample.
+    """
+
+    def __init__(self, processes=POLL_EVALUATION_PROCESSES, min_metrics=POLL_EVALUATION_SHARD_MIN_METRICS, index=None):
+        self.processes = processes
+        self.min_metrics = min_metrics
+        self.index = rule_index if index is None else index
+        self._pool = None
+        self._current = None  # (version, pickled rules, rules by id)
+        self._lock = None
+        self._loop = None
+
+    def should_shard(self, metric_count):
+        return self.processes > 0 and metric_count >= self.min_metrics
+
+    async def match(self, samples):
+        """
+        Returns the violated VALUE rules of all users for each (metric_type, value)
+        sample, in the order of the samples.
+        """
+        pool, (version, rules, rules_by_id) = await self._current_workers()
+        loop = asyncio.get_running_loop()
+        shards = [samples[offset::self.processes] for offset in range(self.processes)]
+        # pool.apply blocks until its shard is done, so it waits on a thread
+        results = await asyncio.gather(*(
+            loop.run_in_executor(None, self._apply, pool, version, rules, shard) for shard in shards if shard
+        ))
+
+        matched = [None] * len(samples)
+        for offset, shard_result in enumerate(results):
+            matched[offset::self.processes] = [
+                [rules_by_id[rule_id] for rule_id in rule_ids] for rule_ids in shard_result
+            ]
+        return matched
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            self._current = None
+
+    async def _current_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            if self._current is None or self.index.version != self._current[0]:
+                self._current = await loop.run_in_executor(None, self._take_snapshot)
+            if self._pool is None:
+                version, rules, rules_by_id = self._current
+                # Starting the workers sends each of them the snapshot, which takes a while
+                self._pool = await loop.run_in_executor(None, self._start_pool, version, rules)
+                logger.info(f"Started {self.processes} evaluation processes with {len(rules_by_id)} rules")
+            return self._pool, self._current
+
+    def _take_snapshot(self):
+        version, rules = self.index.snapshot()
+        value_rules = [rule for rule in rules if rule.aggregation == Aggregation.VALUE]
+        # Pickled once per version instead of once per worker and shard
+        return version, pickle.dumps(value_rules), {rule.id: rule for rule in value_rules}
+
+    def _start_pool(self, version, rules):
+        # spawn instead of fork: the parent runs an event loop and worker threads
+        return multiprocessing.get_context("spawn").Pool(
+            self.processes, initializer=_load_snapshot, initargs=(version, pickle.loads(rules)),
+        )
+
+    @staticmethod
+    def _apply(pool, version, rules, shard):
+        matched = pool.apply(_match_shard, (version, shard))
+        if matched is None:
+            matched = pool.apply(_match_shard, (version, shard, rules))
+        return matched
+
+
+sharded_evaluator = ShardedEvaluator()
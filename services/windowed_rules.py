@@ -0,0 +1,193 @@
+import os
+from collections import deque
+
+from models import Aggregation, Condition
+from services.rule_matcher import ThresholdMatcher
+
+# Upper bound for the samples one window holds, whatever the sample rate
+WINDOW_MAX_SAMPLES = int(os.getenv("WINDOW_MAX_SAMPLES", "4096"))
+
+
+class RollingWindow:
+    """
+    The samples of one metric over the last `seconds`, with O(1) amortized updates.
+
+    Besides the samples it keeps a running sum and two monotonic deques whose heads
+    are the window's minimum and maximum, so no aggregate ever rescans the window.
+    The newest sample at or before the window start is kept as well: it was still
+    the current value when the window began, which is what SUSTAINED needs.
+    """
+
+    __slots__ = ("seconds", "max_samples", "_samples", "_sum", "_mins", "_maxs", "_seq")
+
+    def __init__(self, seconds, max_samples=WINDOW_MAX_SAMPLES):
+        self.seconds = seconds
+        self.max_samples = max_samples
+        self._samples = deque()  # (seq, timestamp, value)
+        self._mins = deque()  # (seq, value), values increasing
+        self._maxs = deque()  # (seq, value), values decreasing
+        self._sum = 0.0
+        self._seq = 0
+
+    def add(self, timestamp, value):
+        samples = self._samples
+        if samples and timestamp < samples[-1][1]:
+            # Late samples count as current instead of rewriting the past
+            timestamp = samples[-1][1]
+        self._seq += 1
+        samples.append((self._seq, timestamp, value))
+        self._sum += value
+
+        mins, maxs = self._mins, self._maxs
+        while mins and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((self._seq, value))
+        while maxs and maxs[-1][1] <= value:
+            maxs.pop()
+        maxs.append((self._seq, value))
+
+        start = timestamp - self.seconds
+        while len(samples) > 1 and (samples[1][1] <= start or len(samples) > self.max_samples):
+            self._evict()
+
+    def _evict(self):
+        seq, _, value = self._samples.popleft()
+        self._sum -= value
+        if self._mins[0][0] == seq:
+            self._mins.popleft()
+        if self._maxs[0][0] == seq:
+            self._maxs.popleft()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def covered(self):
+        # True once the samples reach back to the start of the window
+        samples = self._samples
+        return bool(samples) and samples[0][1] <= samples[-1][1] - self.seconds
+
+    def average(self):
+        return self._sum / len(self._samples) if self._samples else None
+
+    def minimum(self):
+        return self._mins[0][1] if self._mins else None
+
+    def maximum(self):
+        return self._maxs[0][1] if self._maxs else None
+
+    def rate_per_minute(self):
+        samples = self._samples
+        if len(samples) < 2 or samples[-1][1] == samples[0][1]:
+            return None
+        return (samples[-1][2] - samples[0][2]) / (samples[-1][1] - samples[0][1]) * 60
+
+    def sustained_minimum(self):
+        return self.minimum() if self.covered() else None
+
+    def sustained_maximum(self):
+        return self.maximum() if self.covered() else None
+
+    def sustained_constant(self):
+        if not self.covered() or self.minimum() != self.maximum():
+            return None
+        return self.minimum()
+
+
+_AGGREGATES = {
+    Aggregation.AVG.value: RollingWindow.average,
+    Aggregation.MIN.value: RollingWindow.minimum,
+    Aggregation.MAX.value: RollingWindow.maximum,
+    Aggregation.RATE_OF_CHANGE.value: RollingWindow.rate_per_minute,
+}
+
+
+def _aggregate(rule):
+    """
+    The RollingWindow method whose result is compared against the rule's threshold.
+
+    "Sustained above t" is "the window minimum is above t", so SUSTAINED rules reuse
+    the minimum/maximum of the window instead of tracking streaks per rule.
+    """
+    if rule.aggregation == Aggregation.SUSTAINED:
+        if rule.condition == Condition.GREATER_THAN:
+            return RollingWindow.sustained_minimum
+        if rule.condition == Condition.LESS_THAN:
+            return RollingWindow.sustained_maximum
+        return RollingWindow.sustained_constant
+    return _AGGREGATES[getattr(rule.aggregation, "value", rule.aggregation)]
+
+
+def compile_window_groups(rules):
+    """
+    Groups windowed rules by window length and aggregate, each group with a
+    ThresholdMatcher: ((window_seconds, ((aggregate, matcher), ...)), ...).
+    """
+    groups = {}
+    for rule in rules:
+        if rule.aggregation == Aggregation.VALUE:
+            continue
+        groups.setdefault(rule.window_seconds, {}).setdefault(_aggregate(rule), []).append(rule)
+    return tuple(
+        (seconds, tuple((aggregate, ThresholdMatcher(group)) for aggregate, group in by_aggregate.items()))
+        for seconds, by_aggregate in groups.items()
+    )
+
+
+class RollingWindows:
+    """
+    Rolling windows per (user_id, metric_type, window length). The poller evaluates
+    samples for all users at once and uses user_id None, so polled and ingested
+    samples of the same metric fill separate windows and are never aggregated
+    together. Not thread-safe; it is only used from the event loop.
+    """
+
+    def __init__(self, max_samples=WINDOW_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._windows = {}
+        self._index_version = None
+
+    def sync(self, index):
+        """
+        Drops the windows no windowed rule of the index needs any more, once per
+        index version, so removed rules and users do not keep their samples.
+        """
+        if index.version == self._index_version:
+            return
+        self._index_version = index.version
+        for key, windows in list(self._windows.items()):
+            user_id, metric_type = key
+            needed = {seconds for seconds, _ in index.window_groups(metric_type, user_id)}
+            for seconds in [seconds for seconds in windows if seconds not in needed]:
+                del windows[seconds]
+            if not windows:
+                del self._windows[key]
+
+    def match(self, metric_type, value, timestamp, groups, user_id=None):
+        """
+        Adds the sample to every window the groups need and returns the violated
+        windowed rules as (rule, aggregate value) pairs.
+        """
+        if not groups:
+            return []
+        windows = self._windows.get((user_id, metric_type))
+        if windows is None:
+            windows = self._windows[(user_id, metric_type)] = {}
+
+        violated = []
+        for seconds, aggregates in groups:
+            window = windows.get(seconds)
+            if window is None:
+                window = windows[seconds] = RollingWindow(seconds, self.max_samples)
+            window.add(timestamp, value)
+            for aggregate, matcher in aggregates:
+                aggregate_value = aggregate(window)
+                if aggregate_value is not None:
+                    violated.extend((rule, aggregate_value) for rule in matcher.match(aggregate_value))
+        return violated
+
+    def clear(self):
+        self._windows = {}
+        self._index_version = None
+
+
+rolling_windows = RollingWindows()
@@ -1,31 +1,64 @@
 import pytest
+from unittest.mock import patch
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 from fastapi.testclient import TestClient
 import sys
 import os
+import tempfile
+from types import SimpleNamespace
 
 # Add the project root directory to the python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
 from database import Base, get_db
+from models import AlertRuleModel
+from services.alert_history import alert_history
+from services.alert_state import alert_state
+from services.compound_rules import CachedCompoundRule, compound_index
+from services.rule_index import CachedRule, rule_index
+from services.windowed_rules import rolling_windows
 
-# Use in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Use a throwaway SQLite file for testing. Background workers open their own
+# sessions concurrently with request handlers, which a single shared in-memory
+# connection cannot isolate.
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{tempfile.mkdtemp()}/test_alerting.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def make_rule(rule_id, *, user_id="user1", metric_type="temperature", threshold=30.0, condition="GREATER_THAN",
+              aggregation="VALUE", window_seconds=None, expression=None, row=False, is_active=True):
+    """
+    Builds a rule for tests: a CachedRule by default, an AlertRuleModel row with
+    row=True, or a CachedCompoundRule when an expression is given.
+    """
+    if expression is not None:
+        return CachedCompoundRule.from_model(
+            SimpleNamespace(id=rule_id, user_id=user_id, expression=expression, delivery_channel="EMAIL"),
+        )
+    if row:
+        return AlertRuleModel(
+            id=rule_id, user_id=user_id, metric_type=metric_type, threshold_value=threshold, condition=condition,
+            delivery_channel="EMAIL", aggregation=aggregation, window_seconds=window_seconds, is_active=is_active,
+        )
+    return CachedRule(rule_id, user_id, metric_type, threshold, condition, "EMAIL", aggregation, window_seconds)
+
+
 @pytest.fixture(scope="function")
 def db_session():
     # Create tables
     Base.metadata.create_all(bind=engine)
+    rule_index.clear()
+    compound_index.clear()
+    alert_state.clear()
+    alert_history.clear()
+    rolling_windows.clear()
     db = TestingSessionLocal()
     try:
         yield db
@@ -35,7 +68,13 @@ def db_session():
         Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture(scope="function")
-def client(db_session):
+def session_local(db_session):
+    # Code that opens its own sessions (startup, delivery queue) uses the test database
+    with patch("database.SessionLocal", TestingSessionLocal):
+        yield TestingSessionLocal
+
+@pytest.fixture(scope="function")
+def client(db_session, session_local):
     def override_get_db():
         try:
             yield db_session
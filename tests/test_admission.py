@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from services.admission import AdmissionController, Overloaded, UserRateLimiter
+
+
+@pytest.mark.asyncio
+async def test_admission_queues_then_sheds():
+    admission = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5, retry_after=2)
+    await admission.acquire()
+
+    queued = asyncio.create_task(admission.acquire())
+    await asyncio.sleep(0)
+    assert admission.waiting == 1
+
+    with pytest.raises(Overloaded) as shed:
+        await admission.acquire()
+    assert shed.value.retry_after == 2
+
+    admission.release()
+    await queued
+    assert (admission.in_flight, admission.waiting) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_admission_wait_times_out():
+    admission = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout=0.01)
+    await admission.acquire()
+
+    with pytest.raises(Overloaded):
+        await admission.acquire()
+    assert admission.waiting == 0
+
+    admission.release()
+    await admission.acquire()
+
+
+def test_token_bucket_allows_burst_then_refills():
+    limiter = UserRateLimiter(rate=2, burst=3)
+
+    assert [limiter.try_acquire("user1", now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.try_acquire("user1", now=0.0) == pytest.approx(0.5)
+    # Other tenants have their own bucket
+    assert limiter.try_acquire("user2", now=0.0) == 0.0
+    assert limiter.try_acquire("user1", now=0.5) == 0.0
+
+
+def test_token_bucket_disabled_and_bounded():
+    assert UserRateLimiter(rate=0).try_acquire("user1") == 0.0
+
+    limiter = UserRateLimiter(rate=1, burst=1, max_users=2)
+    for user in ("user1", "user2", "user3"):
+        limiter.try_acquire(user, now=0.0)
+    # user1 was forgotten and starts with a full bucket again
+    assert limiter.try_acquire("user1", now=0.0) == 0.0
+    assert limiter.try_acquire("user3", now=0.0) == pytest.approx(1.0)
+
+
+def test_ingest_rate_limited_user_gets_429(client):
+    data = {"user_id": "user1", "metric_type": "temperature", "value": 1.0, "timestamp": "2025-11-24T10:00:00Z"}
+
+    with patch("routers.ingestion.user_rate_limiter", UserRateLimiter(rate=0.5, burst=1)):
+        assert client.post("/alert/api/v1/data/ingest", json=data).status_code == 200
+        response = client.post("/alert/api/v1/data/ingest", json=data)
+        batch = client.post("/alert/api/v1/data/ingest/batch", json=[data]).json()
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert batch["results"][0]["status"] == "rejected"
+
+
+def test_ingest_overloaded_gets_503(client):
+    data = {"user_id": "user1", "metric_type": "temperature", "value": 1.0, "timestamp": "2025-11-24T10:00:00Z"}
+
+    async def overloaded():
+        raise Overloaded("Too many requests queued", 1)
+
+    with patch("routers.ingestion.ingest_admission.acquire", overloaded):
+        response = client.post("/alert/api/v1/data/ingest", json=data)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
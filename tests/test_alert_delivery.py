@@ -1,5 +1,7 @@
 import pytest
 import os
+import asyncio
+import time
 from unittest.mock import patch, MagicMock
 from services.alert_delivery import AlertDeliveryService
 from models import AlertRuleModel, Condition, DeliveryChannel
@@ -30,6 +32,16 @@ def test_init_no_key_logs_warning():
         assert service.api_key is None        
 
 
+@pytest.mark.asyncio
+async def test_warm_up_loads_sdk_only_with_api_key(mock_resend):
+    with patch.dict(os.environ, {}, clear=True):
+        await AlertDeliveryService().warm_up()
+    assert not isinstance(mock_resend.api_key, str)
+
+    with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
+        await AlertDeliveryService().warm_up()
+    assert mock_resend.api_key == "test_key"
+
 @pytest.mark.asyncio
 async def test_send_alert_email_success(mock_resend, alert_rule):
     with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
@@ -44,6 +56,24 @@ async def test_send_alert_email_success(mock_resend, alert_rule):
     assert call_args["to"] == ["test@example.com"]
     assert "Alert Triggered" in call_args["subject"]
     assert "35.0" in call_args["html"]
+
+@pytest.mark.asyncio
+async def test_send_alert_escapes_compound_expression(mock_resend):
+    with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
+        service = AlertDeliveryService()
+    rule = AlertRuleModel(
+        user_id="test@example.com",
+        metric_type="battery_soc+grid_power",
+        condition="battery_soc < 20 AND grid_power > 3000",
+        threshold_value=None,
+        delivery_channel=DeliveryChannel.EMAIL
+    )
+
+    await service.send_alert(rule, 15.0)
+
+    html = mock_resend.Emails.send.call_args[0][0]["html"]
+    assert "battery_soc &lt; 20 AND grid_power &gt; 3000" in html
+    assert "<strong>Threshold:</strong> -" in html
     
 @pytest.mark.asyncio
 async def test_send_alert_skips_if_no_api_key(mock_resend, alert_rule):
@@ -62,6 +92,16 @@ async def test_send_alert_handles_exception(mock_resend, alert_rule):
     mock_resend.Emails.send.side_effect = Exception("API Error")
     
     await service.send_alert(alert_rule, 35.0)
+
+@pytest.mark.asyncio
+async def test_deliver_propagates_exception(mock_resend, alert_rule):
+    with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
+        service = AlertDeliveryService()
+
+    mock_resend.Emails.send.side_effect = Exception("API Error")
+
+    with pytest.raises(Exception, match="API Error"):
+        await service.deliver(alert_rule, 35.0)
     
 @pytest.mark.asyncio
 async def test_send_alert_non_email_channel(mock_resend):
@@ -79,3 +119,59 @@ async def test_send_alert_non_email_channel(mock_resend):
     await service.send_alert(rule, 95.0)
     
     mock_resend.Emails.send.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_send_alert_does_not_block_event_loop(mock_resend, alert_rule):
+    with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
+        service = AlertDeliveryService()
+
+    mock_resend.Emails.send.side_effect = lambda params: time.sleep(0.2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker_task = asyncio.create_task(ticker())
+    await service.send_alert(alert_rule, 35.0)
+    ticker_task.cancel()
+
+    mock_resend.Emails.send.assert_called_once()
+    assert ticks >= 5
+
+@pytest.mark.asyncio
+async def test_deliver_batch_sends_one_digest_per_recipient(mock_resend, alert_rule):
+    with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
+        service = AlertDeliveryService()
+
+    other_rule = AlertRuleModel(
+        user_id="other@example.com",
+        metric_type="grid_power",
+        condition=Condition.GREATER_THAN,
+        threshold_value=3000.0,
+        delivery_channel=DeliveryChannel.EMAIL
+    )
+
+    await service.deliver_batch([(alert_rule, 35.0), (alert_rule, 36.0), (other_rule, 3500.0)])
+
+    mock_resend.Emails.send.assert_not_called()
+    mock_resend.Batch.send.assert_called_once()
+    digest, single = mock_resend.Batch.send.call_args[0][0]
+    assert digest["to"] == ["test@example.com"]
+    assert digest["subject"] == "2 Alerts Triggered"
+    assert "35.0" in digest["html"] and "36.0" in digest["html"]
+    assert single["to"] == ["other@example.com"]
+    assert single["subject"] == "Alert Triggered: grid_power"
+
+@pytest.mark.asyncio
+async def test_deliver_batch_single_recipient_uses_single_send(mock_resend, alert_rule):
+    with patch.dict(os.environ, {"RESEND_API_KEY": "test_key"}):
+        service = AlertDeliveryService()
+
+    await service.deliver_batch([(alert_rule, 35.0), (alert_rule, 36.0)])
+
+    mock_resend.Batch.send.assert_not_called()
+    mock_resend.Emails.send.assert_called_once()
+    assert mock_resend.Emails.send.call_args[0][0]["subject"] == "2 Alerts Triggered"
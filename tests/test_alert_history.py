@@ -0,0 +1,75 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from conftest import make_rule
+from models import AlertHistoryModel
+from services.alert_history import AlertHistory
+
+DAY = 86400
+
+
+@pytest.mark.asyncio
+async def test_record_buffers_until_flush(db_session, session_local):
+    history = AlertHistory()
+
+    history.record([(make_rule(1), 35.0), (make_rule(2), 40.0)], now=10 * DAY + 5)
+
+    assert db_session.query(AlertHistoryModel).count() == 0
+    await history.flush()
+
+    rows = db_session.query(AlertHistoryModel).order_by(AlertHistoryModel.rule_id).all()
+    assert [(row.rule_id, row.actual_value, row.bucket) for row in rows] == [(1, 35.0, 10), (2, 40.0, 10)]
+    assert history.pending() == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_entries():
+    history = AlertHistory()
+    history.record([(make_rule(1), 35.0)])
+
+    with patch("services.alert_history.run_with_session", AsyncMock(side_effect=Exception("database is locked"))):
+        await history.flush()
+
+    assert history.pending() == 1
+
+
+@pytest.mark.asyncio
+async def test_prune_deletes_buckets_outside_retention(db_session, session_local):
+    history = AlertHistory(retention_days=2)
+    history.record([(make_rule(1), 1.0)], now=1 * DAY)
+    history.record([(make_rule(2), 2.0)], now=3 * DAY)
+    history.record([(make_rule(3), 3.0)], now=5 * DAY)
+    await history.flush()
+
+    await history.prune(now=5 * DAY + 1)
+
+    assert [row.rule_id for row in db_session.query(AlertHistoryModel).all()] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_history_api_filters_by_metric_and_time(client):
+    # Recent enough to survive the retention window applied by the running app
+    base = (int(time.time()) // 3600 - 3) * 3600
+    history = AlertHistory()
+    history.record([(make_rule(1), 35.0)], now=base)
+    history.record([(make_rule(2, metric_type="grid_power"), 9000.0)], now=base + 3600)
+    history.record([(make_rule(3), 36.0)], now=base + 7200)
+    history.record([(make_rule(4, user_id="user2"), 37.0)], now=base + 7200)
+    await history.flush()
+
+    response = client.get("/alert/api/v1/alerts/user1")
+    assert [entry["rule_id"] for entry in response.json()] == [3, 2, 1]
+
+    start = datetime.fromtimestamp(base, timezone.utc)
+    response = client.get("/alert/api/v1/alerts/user1", params={
+        "metric_type": "temperature",
+        "since": start.isoformat(),
+        "until": (start + timedelta(hours=2)).isoformat(),
+    })
+    data = response.json()
+    assert [entry["rule_id"] for entry in data] == [1]
+    assert datetime.fromisoformat(data[0]["fired_at"].replace("Z", "+00:00")) == start
+    assert data[0]["condition"] == "GREATER_THAN"
@@ -1,4 +1,17 @@
+from unittest.mock import patch
+
 from models import Condition, DeliveryChannel
+from services.rule_index import rule_index
+
+
+def rule_payload(i, user_id="user1", metric_type="temperature", channel="EMAIL"):
+    return {
+        "user_id": user_id,
+        "metric_type": metric_type,
+        "threshold_value": float(i),
+        "condition": "GREATER_THAN",
+        "delivery_channel": channel,
+    }
 
 def test_create_rule(client):
     response = client.post(
@@ -37,6 +50,14 @@ def test_get_rules_for_user(client):
     assert len(data) == 1
     assert data[0]["user_id"] == "user1"
 
+def test_listed_rules_match_the_created_ones(client):
+    created = client.post("/alert/api/v1/rules/bulk", json=[
+        rule_payload(1),
+        {**rule_payload(2), "aggregation": "AVG", "window_seconds": 60.0},
+    ]).json()
+
+    assert client.get("/alert/api/v1/rules/user1").json() == created
+
 def test_delete_rule(client):
     # Create a rule first
     create_response = client.post(
@@ -60,3 +81,74 @@ def test_delete_rule(client):
     get_response = client.get("/alert/api/v1/rules/user1")
     assert get_response.status_code == 200
     assert len(get_response.json()) == 0
+
+def test_bulk_create_rules(client):
+    response = client.post("/alert/api/v1/rules/bulk", json=[rule_payload(i) for i in range(5)])
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 5
+    assert all(rule["is_active"] for rule in data)
+    assert len({rule["id"] for rule in data}) == 5
+    assert sorted(rule.id for rule in rule_index.rules_for("temperature", "user1")) == sorted(rule["id"] for rule in data)
+
+def test_bulk_create_is_all_or_nothing(client):
+    payload = [rule_payload(1), {**rule_payload(2), "condition": "SOMETIMES"}]
+
+    response = client.post("/alert/api/v1/rules/bulk", json=payload)
+
+    assert response.status_code == 422
+    assert client.get("/alert/api/v1/rules/user1").json() == []
+
+def test_bulk_deactivate_rules(client):
+    ids = [rule["id"] for rule in client.post("/alert/api/v1/rules/bulk", json=[rule_payload(i) for i in range(3)]).json()]
+
+    response = client.post("/alert/api/v1/rules/bulk/deactivate", json={"rule_ids": ids[:2] + [9999]})
+
+    assert response.status_code == 200
+    assert response.json() == {"deactivated": 2, "already_inactive": [], "not_found": [9999]}
+    assert [rule["id"] for rule in client.get("/alert/api/v1/rules/user1").json()] == [ids[2]]
+    assert [rule.id for rule in rule_index.rules_for("temperature", "user1")] == [ids[2]]
+
+def test_bulk_deactivate_reports_inactive_rules_separately(client):
+    ids = [rule["id"] for rule in client.post("/alert/api/v1/rules/bulk", json=[rule_payload(i) for i in range(2)]).json()]
+    client.delete(f"/alert/api/v1/rules/{ids[0]}")
+
+    response = client.post("/alert/api/v1/rules/bulk/deactivate", json={"rule_ids": ids})
+
+    assert response.json() == {"deactivated": 1, "already_inactive": [ids[0]], "not_found": []}
+
+def test_get_rules_paginates_with_keyset_cursor(client):
+    ids = [rule["id"] for rule in client.post("/alert/api/v1/rules/bulk", json=[rule_payload(i) for i in range(5)]).json()]
+
+    first = client.get("/alert/api/v1/rules/user1", params={"limit": 2})
+    second = client.get("/alert/api/v1/rules/user1", params={"limit": 2, "after_id": first.headers["X-Next-After-Id"]})
+    last = client.get("/alert/api/v1/rules/user1", params={"limit": 2, "after_id": second.headers["X-Next-After-Id"]})
+
+    assert [rule["id"] for rule in first.json()] == ids[:2]
+    assert [rule["id"] for rule in second.json()] == ids[2:4]
+    assert [rule["id"] for rule in last.json()] == ids[4:]
+    assert "X-Next-After-Id" not in last.headers
+
+def test_get_rules_without_limit_returns_every_rule(client):
+    with patch("routers.alert_rules.RULES_PAGE_DEFAULT_LIMIT", 2):
+        ids = [rule["id"] for rule in client.post("/alert/api/v1/rules/bulk", json=[rule_payload(i) for i in range(3)]).json()]
+
+        response = client.get("/alert/api/v1/rules/user1")
+        paged = client.get("/alert/api/v1/rules/user1", params={"after_id": 0})
+
+    assert [rule["id"] for rule in response.json()] == ids
+    assert "X-Next-After-Id" not in response.headers
+    assert [rule["id"] for rule in paged.json()] == ids[:2]
+    assert paged.headers["X-Next-After-Id"] == str(ids[1])
+
+def test_get_rules_filters_by_metric_and_channel(client):
+    client.post("/alert/api/v1/rules/bulk", json=[
+        rule_payload(1),
+        rule_payload(2, metric_type="grid_power"),
+        rule_payload(3, metric_type="grid_power", channel="SMS"),
+    ])
+
+    response = client.get("/alert/api/v1/rules/user1", params={"metric_type": "grid_power", "delivery_channel": "SMS"})
+
+    assert [rule["threshold_value"] for rule in response.json()] == [3.0]
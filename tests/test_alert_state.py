@@ -0,0 +1,76 @@
+import pytest
+
+from conftest import make_rule
+from models import AlertStateModel
+from services.alert_state import AlertStateTable
+
+
+def test_notifies_on_transition_and_after_cooldown():
+    state = AlertStateTable(cooldown=600)
+    rule = make_rule(1, metric_type="battery_capacity")
+
+    assert state.filter_alerts("battery_capacity", [rule], now=0) == [rule]
+    assert state.filter_alerts("battery_capacity", [rule], now=60) == []
+    assert state.filter_alerts("battery_capacity", [rule], now=599) == []
+    assert state.filter_alerts("battery_capacity", [rule], now=600) == [rule]
+    assert state.is_firing(1)
+
+
+def test_resolution_rearms_rule():
+    state = AlertStateTable(cooldown=600)
+    rule = make_rule(1, metric_type="battery_capacity")
+
+    state.filter_alerts("battery_capacity", [rule], now=0)
+    state.filter_alerts("battery_capacity", [], now=60)
+    assert not state.is_firing(1)
+    assert state.filter_alerts("battery_capacity", [rule], now=120) == [rule]
+
+
+def test_user_scoped_evaluation_only_resolves_that_user():
+    state = AlertStateTable(cooldown=600)
+    rules = [make_rule(1, user_id="user1", metric_type="battery_capacity"),
+             make_rule(2, user_id="user2", metric_type="battery_capacity")]
+    state.filter_alerts("battery_capacity", rules, now=0)
+
+    state.filter_alerts("battery_capacity", [], user_id="user1", now=10)
+    assert not state.is_firing(1)
+    assert state.is_firing(2)
+
+    state.filter_alerts("grid_power", [], now=10)
+    assert state.is_firing(2)
+
+
+def test_zero_cooldown_notifies_every_breach():
+    state = AlertStateTable(cooldown=0)
+    rule = make_rule(1, metric_type="battery_capacity")
+    assert state.filter_alerts("battery_capacity", [rule], now=0) == [rule]
+    assert state.filter_alerts("battery_capacity", [rule], now=0) == [rule]
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(session_local, db_session):
+    state = AlertStateTable(cooldown=600)
+    rules = [make_rule(1, metric_type="battery_capacity"), make_rule(2, metric_type="battery_capacity")]
+    state.filter_alerts("battery_capacity", rules, now=100)
+    state.filter_alerts("battery_capacity", [make_rule(1, metric_type="battery_capacity")], now=110)
+    await state.flush()
+
+    rows = db_session.query(AlertStateModel).all()
+    assert [(row.rule_id, row.last_sent_at) for row in rows] == [(1, 100)]
+
+    restarted = AlertStateTable(cooldown=600)
+    restarted.load(db_session)
+    assert restarted.is_firing(1)
+    assert restarted.filter_alerts("battery_capacity", [make_rule(1, metric_type="battery_capacity")], now=200) == []
+
+
+def test_rollback_renotifies_on_next_evaluation():
+    state = AlertStateTable(cooldown=600)
+    rule = make_rule(1, metric_type="battery_capacity")
+    assert state.filter_alerts("battery_capacity", [rule], now=0) == [rule]
+
+    state.rollback([rule])
+
+    assert not state.is_firing(1)
+    assert state.filter_alerts("battery_capacity", [rule], now=1) == [rule]
+
@@ -0,0 +1,181 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from conftest import make_rule
+from models import AlertRuleModel
+from services.alert_state import AlertStateTable
+from services.compound_rules import CompoundRuleIndex, compile_expression, compound_index
+from services.data_poller import process_inverter_data
+from services.evaluation import evaluate_compound
+from services.rule_index import rule_index
+
+
+def compound_payload(expression, user_id="user1"):
+    return {"user_id": user_id, "expression": expression, "delivery_channel": "EMAIL"}
+
+
+def test_compile_expression_combines_comparisons():
+    compiled = compile_expression("battery_soc < 20 AND (grid_power > 3000 OR NOT pv_power >= 100)")
+
+    assert compiled.metrics == ("battery_soc", "grid_power", "pv_power")
+    assert compiled.evaluate({"battery_soc": 10, "grid_power": 4000, "pv_power": 500})
+    assert compiled.evaluate({"battery_soc": 10, "grid_power": 0, "pv_power": 50})
+    assert not compiled.evaluate({"battery_soc": 10, "grid_power": 0, "pv_power": 500})
+    assert not compiled.evaluate({"battery_soc": 30, "grid_power": 4000, "pv_power": 50})
+
+
+def test_compile_expression_compares_metrics_and_chains():
+    assert compile_expression("consumption > pv_power").evaluate({"consumption": 5, "pv_power": 3})
+    between = compile_expression("-5 < temperature <= 40").evaluate
+    assert between({"temperature": -4.5})
+    assert between({"temperature": 40})
+    assert not between({"temperature": -5})
+    assert compile_expression("1000 != grid_power").evaluate({"grid_power": 999})
+
+
+@pytest.mark.parametrize("expression", [
+    "",
+    "battery_soc",
+    "battery_soc + 1 > 20",
+    "1 < 2",
+    "battery_soc < True",
+    "battery_soc in 3",
+    "__import__('os').system('true') > 0",
+    "battery_soc < 20 AND",
+])
+def test_compile_expression_rejects_anything_else(expression):
+    with pytest.raises(ValueError):
+        compile_expression(expression)
+
+
+def test_rule_scope_is_the_sorted_metric_set():
+    rule = make_rule(1, expression="grid_power > 3000 and battery_soc < 20")
+
+    assert rule.metric_type == "battery_soc+grid_power"
+    assert rule.condition == "grid_power > 3000 and battery_soc < 20"
+    assert rule.threshold_value is None
+
+
+def test_index_returns_only_scopes_referencing_the_metrics():
+    index = CompoundRuleIndex()
+    low_battery = make_rule(1, expression="battery_soc < 20 and grid_power > 3000")
+    same_scope = make_rule(2, expression="grid_power > 5000 or battery_soc < 5")
+    hot = make_rule(3, expression="temperature > 60 and pv_power > 100")
+    for rule in (low_battery, same_scope, hot):
+        index.add(rule)
+
+    assert index.scopes_for(["grid_power"]) == {"battery_soc+grid_power": (low_battery, same_scope)}
+    assert index.scopes_for(["consumption"]) == {}
+    assert set(index.scopes_for(["battery_soc", "pv_power"])) == {"battery_soc+grid_power", "pv_power+temperature"}
+
+    index.remove_many([1, 2])
+    assert index.scopes_for(["grid_power"]) == {}
+    assert len(index) == 1
+
+
+def test_evaluate_compound_notifies_and_resolves_per_scope():
+    index = CompoundRuleIndex()
+    state = AlertStateTable(cooldown=600)
+    rule = make_rule(1, expression="battery_soc < 20 and grid_power > 3000")
+    index.add(rule)
+
+    alerts = []
+    violated = evaluate_compound({"battery_soc": 10.0, "grid_power": 4000.0}, ["grid_power"], alerts, index, state)
+    assert violated == [rule]
+    assert alerts == [(rule, 10.0)]
+    assert state.is_firing(1)
+
+    alerts = []
+    evaluate_compound({"battery_soc": 50.0, "grid_power": 4000.0}, ["battery_soc"], alerts, index, state)
+    assert alerts == []
+    assert not state.is_firing(1)
+
+
+def test_evaluate_compound_skips_rules_missing_a_metric():
+    index = CompoundRuleIndex()
+    state = AlertStateTable(cooldown=600)
+    index.add(make_rule(1, expression="battery_soc < 20 and grid_power > 3000"))
+
+    alerts = []
+    assert evaluate_compound({"battery_soc": 10.0}, ["battery_soc"], alerts, index, state) == []
+    assert alerts == []
+
+
+@pytest.mark.asyncio
+async def test_poll_payload_evaluates_compound_rules_on_the_whole_snapshot():
+    index = CompoundRuleIndex()
+    rule = make_rule(1, expression="battery_capacity < 20 and grid_power > 3000")
+    index.add(rule)
+    queue = AsyncMock()
+    last_values = {"grid_power": 4000.0}
+    data = {"realtime_data": {"battery_capacity": {"value": 15}, "grid_power": {"value": 4000}}}
+
+    with patch("services.data_poller.compound_index", index), \
+         patch("services.evaluation.alert_state", AlertStateTable(cooldown=600)):
+        await process_inverter_data(data, queue, last_values)
+
+    # grid_power was unchanged, but the changed battery_capacity triggers the rule
+    queue.enqueue_many.assert_called_once_with([(rule, 15.0)])
+
+
+def test_create_compound_rule(client):
+    response = client.post(
+        "/alert/api/v1/rules/compound", json=compound_payload("battery_soc < 20 AND grid_power > 3000"),
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["metrics"] == ["battery_soc", "grid_power"]
+    assert data["expression"] == "battery_soc < 20 AND grid_power > 3000"
+    assert data["is_active"] is True
+    assert set(compound_index.scopes_for(["battery_soc"])) == {"battery_soc+grid_power"}
+    # Compound rules never reach the threshold rule index or listing
+    assert len(rule_index) == 0
+    assert client.get("/alert/api/v1/rules/user1").json() == []
+
+
+def test_create_compound_rule_rejects_invalid_expression(client):
+    response = client.post("/alert/api/v1/rules/compound", json=compound_payload("battery_soc + 1"))
+
+    assert response.status_code == 422
+    assert len(compound_index) == 0
+
+
+def test_list_and_delete_compound_rules(client):
+    created = client.post("/alert/api/v1/rules/compound", json=compound_payload("pv_power > consumption")).json()
+    client.post("/alert/api/v1/rules/compound", json=compound_payload("pv_power > 0", user_id="user2"))
+
+    listed = client.get("/alert/api/v1/rules/compound/user1").json()
+    assert listed == [created]
+
+    assert client.delete(f"/alert/api/v1/rules/{created['id']}").status_code == 200
+    assert client.get("/alert/api/v1/rules/compound/user1").json() == []
+    assert len(compound_index) == 1
+
+
+def test_list_compound_rules_uses_index_and_skips_invalid_expressions(client, db_session):
+    created = client.post("/alert/api/v1/rules/compound", json=compound_payload("pv_power > consumption")).json()
+    db_session.add(AlertRuleModel(
+        user_id="user1", metric_type="pv_power", condition="EXPRESSION",
+        delivery_channel="EMAIL", expression="pv_power +",
+    ))
+    db_session.commit()
+
+    with patch("routers.alert_rules.compile_expression", wraps=compile_expression) as mock_compile:
+        response = client.get("/alert/api/v1/rules/compound/user1")
+
+    assert response.status_code == 200
+    assert response.json() == [created]
+    # Only the rule missing from the index was compiled
+    assert mock_compile.call_count == 1
+
+
+def test_compound_index_loads_active_rules(client, db_session):
+    created = client.post("/alert/api/v1/rules/compound", json=compound_payload("pv_power > consumption")).json()
+    compound_index.clear()
+
+    compound_index.load(db_session)
+    rule_index.load(db_session)
+
+    assert [rule.id for rule in compound_index.scopes_for(["consumption"])["consumption+pv_power"]] == [created["id"]]
+    assert len(rule_index) == 0
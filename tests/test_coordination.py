@@ -0,0 +1,163 @@
+import pytest
+from unittest.mock import patch
+
+from models import AlertRuleModel, AlertStateModel, CoordinationLeaseModel
+from services.coordination import (
+    DASHBOARD_EVENT_RETENTION_SECONDS,
+    Coordinator,
+    coordinator as default_coordinator,
+    _acquire_leases,
+    _release_leases,
+    bump_rules_version,
+    read_rules_version,
+)
+from services.alert_state import alert_state
+from services.dashboard_stream import dashboard_broker
+from services.rule_index import rule_index
+
+SOURCES = ["poll:Fronius", "poll:Kostal"]
+
+
+def test_lease_is_exclusive_until_it_expires(db_session):
+    assert _acquire_leases(db_session, SOURCES, "worker-a", now=100.0, ttl=30.0) == {
+        "poll:Fronius": 130.0, "poll:Kostal": 130.0,
+    }
+    assert _acquire_leases(db_session, SOURCES, "worker-b", now=110.0, ttl=30.0) == {}
+
+    # worker-a renews one lease and lets the other run out
+    _acquire_leases(db_session, ["poll:Kostal"], "worker-a", now=125.0, ttl=30.0)
+    assert _acquire_leases(db_session, SOURCES, "worker-b", now=131.0, ttl=30.0) == {"poll:Fronius": 161.0}
+
+
+def test_source_limit_spreads_leases_across_workers(db_session):
+    assert list(_acquire_leases(db_session, SOURCES, "worker-a", now=100.0, ttl=30.0, limit=1)) == ["poll:Fronius"]
+    assert list(_acquire_leases(db_session, SOURCES, "worker-b", now=100.0, ttl=30.0, limit=1)) == ["poll:Kostal"]
+    # Renewing keeps the lease already held instead of trading it for another
+    assert list(_acquire_leases(db_session, SOURCES, "worker-a", now=110.0, ttl=30.0, limit=1)) == ["poll:Fronius"]
+
+
+def test_released_lease_is_free_immediately(db_session):
+    _acquire_leases(db_session, SOURCES, "worker-a", now=100.0, ttl=30.0)
+    _release_leases(db_session, SOURCES, "worker-a")
+
+    assert db_session.query(CoordinationLeaseModel).filter(CoordinationLeaseModel.holder.isnot(None)).count() == 0
+    assert len(_acquire_leases(db_session, SOURCES, "worker-b", now=101.0, ttl=30.0)) == 2
+
+
+def test_rules_version_counts_changes(db_session):
+    assert read_rules_version(db_session) == 0
+    assert bump_rules_version(db_session) == 1
+    assert bump_rules_version(db_session) == 2
+    db_session.commit()
+    assert read_rules_version(db_session) == 2
+
+
+def test_rule_changes_bump_the_shared_version(client, db_session):
+    rule = {
+        "user_id": "user1",
+        "metric_type": "temperature",
+        "threshold_value": 30.0,
+        "condition": "GREATER_THAN",
+        "delivery_channel": "EMAIL",
+    }
+    client.post("/alert/api/v1/rules", json=rule)
+    # Without coordination no other worker reads the version
+    assert read_rules_version(db_session) == 0
+
+    with patch.object(default_coordinator, "mode", "sqlite"):
+        client.post("/alert/api/v1/rules", json=rule)
+        client.post("/alert/api/v1/rules", json=rule)
+
+    assert read_rules_version(db_session) == 2
+
+
+@pytest.mark.asyncio
+async def test_sync_reloads_rules_changed_by_another_worker(db_session, session_local):
+    coordinator = Coordinator(mode="sqlite")
+    await coordinator.sync_rules()
+    assert len(rule_index) == 0
+
+    # Another worker adds a rule
+    db_session.add(AlertRuleModel(
+        user_id="user1", metric_type="temperature", threshold_value=30.0,
+        condition="GREATER_THAN", delivery_channel="EMAIL", is_active=True,
+    ))
+    bump_rules_version(db_session)
+    db_session.commit()
+
+    await coordinator.sync_rules()
+    assert len(rule_index) == 1
+
+
+@pytest.mark.asyncio
+async def test_own_rule_changes_do_not_trigger_a_reload(db_session, session_local):
+    coordinator = Coordinator(mode="sqlite")
+    await coordinator.sync_rules()
+    version = bump_rules_version(db_session)
+    db_session.commit()
+
+    coordinator.rules_changed_locally(version)
+    loaded = rule_index.version
+    await coordinator.sync_rules()
+
+    assert rule_index.version == loaded
+
+
+@pytest.mark.asyncio
+async def test_worker_only_holds_the_leases_it_won(session_local, db_session):
+    first, second = Coordinator(mode="sqlite"), Coordinator(mode="sqlite")
+    for coordinator in (first, second):
+        coordinator.want("poll:Kostal")
+
+    await first.renew_leases()
+    await second.renew_leases()
+
+    assert first.holds("poll:Kostal")
+    assert not second.holds("poll:Kostal")
+    assert Coordinator(mode="none").holds("poll:Kostal")
+    with pytest.raises(ValueError):
+        Coordinator(mode="redis")
+
+
+@pytest.mark.asyncio
+async def test_lease_takeover_adopts_persisted_alert_state(session_local, db_session):
+    # The previous holder notified rule 7 before it went away
+    db_session.add(AlertStateModel(rule_id=7, metric_type="battery_capacity", user_id="user1", last_sent_at=100.0))
+    db_session.commit()
+    coordinator = Coordinator(mode="sqlite")
+    coordinator.want("poll:Kostal")
+
+    await coordinator.renew_leases()
+
+    assert alert_state.is_firing(7)
+
+
+@pytest.mark.asyncio
+async def test_dashboard_alerts_reach_clients_of_other_workers(session_local, db_session):
+    delivering, serving = Coordinator(mode="sqlite"), Coordinator(mode="sqlite")
+    subscription = dashboard_broker.subscribe("user1")
+    try:
+        await delivering.publish_dashboard("user1", 3, {"rule_id": 3, "value": 12.5})
+        assert await subscription.get(timeout=0) == []
+
+        await serving.relay_dashboard_events()
+        assert await subscription.get(timeout=0) == [{"rule_id": 3, "value": 12.5}]
+
+        # Every event is relayed once
+        await serving.relay_dashboard_events()
+        assert await subscription.get(timeout=0) == []
+    finally:
+        dashboard_broker.unsubscribe(subscription)
+
+
+@pytest.mark.asyncio
+async def test_relayed_dashboard_events_are_pruned_once_per_retention_period(session_local, db_session):
+    serving = Coordinator(mode="sqlite")
+    with patch("services.coordination._prune_dashboard_events") as mock_prune:
+        await serving.relay_dashboard_events()
+        await serving.relay_dashboard_events()
+        assert mock_prune.call_count == 1
+
+        serving._dashboard_pruned_at -= DASHBOARD_EVENT_RETENTION_SECONDS
+        await serving.relay_dashboard_events()
+        assert mock_prune.call_count == 2
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from models import AlertRuleModel, Condition, DeliveryChannel
+from routers.dashboard import sse_events
+from services.alert_delivery import AlertDeliveryService
+from services.dashboard_stream import DashboardBroker, dashboard_broker
+
+
+@pytest.mark.asyncio
+async def test_publish_reaches_every_client_of_the_user():
+    broker = DashboardBroker()
+    first, second = broker.subscribe("user1"), broker.subscribe("user1")
+    other = broker.subscribe("user2")
+
+    assert broker.publish("user1", 1, {"rule_id": 1}) == 2
+
+    assert await first.get(0) == [{"rule_id": 1}]
+    assert await second.get(0) == [{"rule_id": 1}]
+    assert await other.get(0) == []
+    assert broker.subscriber_count() == 3
+
+
+@pytest.mark.asyncio
+async def test_slow_client_gets_coalesced_and_bounded_messages():
+    broker = DashboardBroker(buffer_size=2)
+    subscription = broker.subscribe("user1")
+
+    broker.publish("user1", 1, {"rule_id": 1, "value": 10})
+    broker.publish("user1", 1, {"rule_id": 1, "value": 11})  # replaces the pending message of rule 1
+    broker.publish("user1", 2, {"rule_id": 2, "value": 20})
+    broker.publish("user1", 3, {"rule_id": 3, "value": 30})  # buffer full: rule 1 is dropped
+
+    assert await subscription.get(0) == [{"rule_id": 2, "value": 20}, {"rule_id": 3, "value": 30}]
+    assert subscription.dropped == 1
+
+
+def test_unsubscribe_forgets_idle_users():
+    broker = DashboardBroker()
+    subscription = broker.subscribe("user1")
+
+    broker.unsubscribe(subscription)
+    broker.unsubscribe(subscription)
+
+    assert broker.subscriber_count() == 0
+    assert broker.publish("user1", 1, {}) == 0
+
+
+@pytest.mark.asyncio
+async def test_sse_events_format_alerts_drops_and_keepalives():
+    broker = DashboardBroker(buffer_size=1)
+    subscription = broker.subscribe("user1")
+    events = sse_events(subscription, keepalive=0.01)
+
+    assert await anext(events) == "retry: 5000\n\n"
+    assert await anext(events) == ": keepalive\n\n"
+
+    broker.publish("user1", 1, {"rule_id": 1})
+    broker.publish("user1", 2, {"rule_id": 2})
+    assert await anext(events) == 'event: dropped\ndata: {"dropped":1}\n\n'
+    event = await anext(events)
+    assert event.startswith("event: alert\n")
+    assert json.loads(event.split("data: ", 1)[1]) == {"rule_id": 2}
+    await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_deliver_publishes_dashboard_alerts():
+    rule = AlertRuleModel(
+        id=7,
+        user_id="user1",
+        metric_type="temperature",
+        condition=Condition.GREATER_THAN,
+        threshold_value=30.0,
+        delivery_channel=DeliveryChannel.DASHBOARD,
+    )
+    subscription = dashboard_broker.subscribe("user1")
+    try:
+        await AlertDeliveryService().deliver(rule, 35.0)
+        messages = await asyncio.wait_for(subscription.get(), 1)
+    finally:
+        dashboard_broker.unsubscribe(subscription)
+
+    assert len(messages) == 1
+    assert messages[0]["rule_id"] == 7
+    assert messages[0]["value"] == 35.0
+    assert messages[0]["condition"] == "GREATER_THAN"
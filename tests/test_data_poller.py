@@ -1,15 +1,23 @@
+import asyncio
+
 import pytest
 from unittest.mock import MagicMock, AsyncMock, patch
 import httpx
-from services.data_poller import fetch_data, poll_data_services, evaluate_condition, process_inverter_data
+from services.data_poller import (
+    PollState, fetch_data, poll_data_services, poll_source, evaluate_condition,
+    evaluate_source_payload, process_inverter_data, supervise_poll_source,
+)
+from services.poll_sources import PollSource
 from models import Condition, AlertRuleModel
+from services.alert_state import AlertStateTable
+from services.rule_index import RuleIndex, CachedRule
 
 @pytest.mark.asyncio
 async def test_fetch_data_success():
     # Mock the client and response
     mock_response = MagicMock()
     mock_response.status_code = 200
-    mock_response.json.return_value = {"key": "value"}
+    mock_response.content = b'{"key": "value"}'
     mock_response.raise_for_status = MagicMock()
 
     mock_client = AsyncMock(spec=httpx.AsyncClient)
@@ -84,6 +92,157 @@ async def test_poll_data_services_runs_cycle():
         # Verify sleep was called
         assert mock_sleep.called
 
+@pytest.mark.asyncio
+async def test_poll_source_uses_adapter_timeout_and_interval():
+    source = PollSource(name="Roof", url="http://roof/data", interval_seconds=5, timeout_seconds=2, adapter="flat")
+
+    with patch("services.data_poller.fetch_data", return_value={"battery_capacity": 70}) as mock_fetch, \
+         patch("services.data_poller.process_inverter_data") as mock_process, \
+         patch("asyncio.sleep", side_effect=Exception("StopLoop")) as mock_sleep:
+        with pytest.raises(Exception, match="StopLoop"):
+            await poll_source(MagicMock(), source)
+
+    mock_fetch.assert_called_once()
+    assert mock_fetch.call_args[0][1:4] == ("http://roof/data", "Roof", 2)
+    assert mock_process.call_args[0][0] == {"realtime_data": {"battery_capacity": {"value": 70}}}
+    assert 4 < mock_sleep.call_args[0][0] <= 5
+
+@pytest.mark.asyncio
+async def test_malformed_payload_does_not_stop_other_sources():
+    bad = PollSource(name="Bad", url="http://bad/data", interval_seconds=0.01, adapter="flat")
+    good = PollSource(name="Good", url="http://good/data", interval_seconds=0.01)
+
+    async def fetch(client, url, service_name, timeout, state):
+        # The flat adapter cannot handle a list
+        return [1, 2] if service_name == "Bad" else {"realtime_data": {"grid_power": {"value": 1.0}}}
+
+    with patch("services.data_poller.load_poll_sources", return_value=[bad, good]), \
+         patch("services.data_poller.fetch_data", side_effect=fetch) as mock_fetch, \
+         patch("services.data_poller.process_inverter_data", new_callable=AsyncMock) as mock_process:
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(poll_data_services(MagicMock()), 0.1)
+
+    polled = [call.args[2] for call in mock_fetch.call_args_list]
+    assert polled.count("Bad") > 1
+    assert polled.count("Good") > 1
+    assert mock_process.await_count == polled.count("Good")
+
+@pytest.mark.asyncio
+async def test_crashed_source_loop_is_restarted():
+    source = PollSource(name="Roof", url="http://roof/data", interval_seconds=0.01)
+
+    with patch("services.data_poller.poll_source", side_effect=[RuntimeError("boom"), asyncio.CancelledError()]) as mock_poll:
+        with pytest.raises(asyncio.CancelledError):
+            await supervise_poll_source(MagicMock(), source)
+
+    assert mock_poll.call_count == 2
+
+def make_response(status_code=200, content=b'{"key": "value"}', etag=None):
+    return httpx.Response(
+        status_code,
+        content=content,
+        headers={"etag": etag} if etag else {},
+        request=httpx.Request("GET", "http://test-url"),
+    )
+
+@pytest.mark.asyncio
+async def test_fetch_data_sends_etag_and_handles_not_modified():
+    state = PollState()
+    mock_client = AsyncMock(spec=httpx.AsyncClient)
+    mock_client.get.return_value = make_response(etag='"v1"')
+
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) == {"key": "value"}
+    assert state.etag == '"v1"'
+
+    mock_client.get.return_value = make_response(status_code=304)
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) is None
+    assert state.not_modified
+    assert mock_client.get.call_args.kwargs["headers"] == {"If-None-Match": '"v1"'}
+
+@pytest.mark.asyncio
+async def test_fetch_data_skips_identical_body():
+    state = PollState()
+    mock_client = AsyncMock(spec=httpx.AsyncClient)
+    mock_client.get.return_value = make_response()
+
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) == {"key": "value"}
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) is None
+    assert state.not_modified
+
+    mock_client.get.return_value = make_response(content=b'{"key": "other"}')
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) == {"key": "other"}
+    assert not state.not_modified
+
+@pytest.mark.asyncio
+async def test_fetch_data_retries_body_that_failed_to_parse():
+    state = PollState()
+    mock_client = AsyncMock(spec=httpx.AsyncClient)
+    mock_client.get.return_value = make_response(content=b'{"key": ', etag='"v1"')
+
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) is None
+    assert state.etag is None and state.content_hash is None
+
+    # The same bad body is parsed (and rejected) again, not reported as unchanged
+    assert await fetch_data(mock_client, "http://test-url", "TestService", state=state) is None
+    assert not state.not_modified
+    assert "headers" not in mock_client.get.call_args.kwargs
+
+@pytest.mark.asyncio
+async def test_only_changed_metrics_are_reevaluated():
+    state = PollState()
+    state.payload = {"realtime_data": {"battery_capacity": {"value": 70}, "grid_power": {"value": 10}}}
+    evaluated = []
+
+    def record_match(metric_type, value, user_id=None):
+        evaluated.append(metric_type)
+        return []
+
+    with patch("services.data_poller.rule_index") as mock_index, \
+         patch("services.data_poller.delivery_queue", AsyncMock()):
+        mock_index.version = 1
+        mock_index.match.side_effect = record_match
+        mock_index.window_groups.return_value = ()
+
+        await evaluate_source_payload(state)
+        assert sorted(evaluated) == ["battery_capacity", "grid_power"]
+
+        evaluated.clear()
+        state.payload["realtime_data"]["grid_power"]["value"] = 11
+        await evaluate_source_payload(state)
+        assert evaluated == ["grid_power"]
+
+        # Unchanged response: nothing to evaluate until a full pass is due
+        evaluated.clear()
+        state.not_modified = True
+        await evaluate_source_payload(state)
+        assert evaluated == []
+
+        # A rule change forces every metric to be evaluated again
+        mock_index.version = 2
+        await evaluate_source_payload(state)
+        assert sorted(evaluated) == ["battery_capacity", "grid_power"]
+
+@pytest.mark.asyncio
+async def test_unchanged_metrics_feed_windowed_rules():
+    state = PollState()
+    state.payload = {"realtime_data": {"grid_power": {"value": 10}}}
+    evaluated = []
+
+    def record_match(metric_type, value, user_id=None):
+        evaluated.append(metric_type)
+        return []
+
+    with patch("services.data_poller.rule_index") as mock_index, \
+         patch("services.data_poller.delivery_queue", AsyncMock()):
+        mock_index.version = 1
+        mock_index.match.side_effect = record_match
+        mock_index.window_groups.return_value = ((60.0, ()),)
+
+        await evaluate_source_payload(state)
+        await evaluate_source_payload(state)
+
+    assert evaluated == ["grid_power", "grid_power"]
+
 def test_evaluate_condition():
     assert evaluate_condition(10, 5, Condition.GREATER_THAN) is True
     assert evaluate_condition(5, 10, Condition.GREATER_THAN) is False
@@ -95,7 +254,7 @@ def test_evaluate_condition():
 @pytest.mark.asyncio
 async def test_process_inverter_data_triggers_alert():
     mock_delivery = AsyncMock()
-    mock_db = MagicMock()
+    index = RuleIndex()
     
     # Setup mock data from inverter
     data = {
@@ -114,17 +273,17 @@ async def test_process_inverter_data_triggers_alert():
         is_active=True
     )
     
-    mock_db.query.return_value.filter.return_value.all.return_value = [mock_rule]
+    index.add(mock_rule)
     
-    with patch("services.data_poller.SessionLocal", return_value=mock_db):
+    with patch("services.data_poller.rule_index", index):
         await process_inverter_data(data, mock_delivery)
     
-    mock_delivery.send_alert.assert_called_once_with(mock_rule, 70.0)
+    mock_delivery.enqueue_many.assert_called_once_with([(CachedRule.from_model(mock_rule), 70.0)])
 
 @pytest.mark.asyncio
 async def test_process_inverter_data_no_alert_if_condition_not_met():
     mock_delivery = AsyncMock()
-    mock_db = MagicMock()
+    index = RuleIndex()
     
     data = {
         "realtime_data": {
@@ -141,9 +300,36 @@ async def test_process_inverter_data_no_alert_if_condition_not_met():
         is_active=True
     )
     
-    mock_db.query.return_value.filter.return_value.all.return_value = [mock_rule]
+    index.add(mock_rule)
     
-    with patch("services.data_poller.SessionLocal", return_value=mock_db):
+    with patch("services.data_poller.rule_index", index):
         await process_inverter_data(data, mock_delivery)
     
-    mock_delivery.send_alert.assert_not_called()
+    mock_delivery.enqueue_many.assert_called_once_with([])
+
+@pytest.mark.asyncio
+async def test_failed_enqueue_does_not_mute_the_rule():
+    index = RuleIndex()
+    rule = AlertRuleModel(
+        id=1, user_id="test@test.com", metric_type="battery_capacity", threshold_value=80.0,
+        condition=Condition.LESS_THAN, delivery_channel="EMAIL", is_active=True,
+    )
+    index.add(rule)
+    queue = AsyncMock()
+    queue.enqueue_many.side_effect = [Exception("database is locked"), None]
+    last_values = {}
+    data = {"realtime_data": {"battery_capacity": {"value": 70}}}
+
+    with patch("services.data_poller.rule_index", index), \
+         patch("services.evaluation.alert_state", AlertStateTable(cooldown=3600)) as state:
+        with pytest.raises(Exception, match="database is locked"):
+            await process_inverter_data(data, queue, last_values)
+        assert not state.is_firing(1)
+        assert last_values == {}
+
+        # The same unchanged value is evaluated and notified again on the next poll
+        await process_inverter_data(data, queue, last_values)
+
+    assert queue.enqueue_many.await_args_list[1].args[0] == [(CachedRule.from_model(rule), 70.0)]
+    assert state.is_firing(1)
+
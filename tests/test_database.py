@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import inspect, text
+
+import models  # noqa: F401  (registers the tables on Base)
+from database import create_storage_engine, migrate, storage_pragmas
+
+
+def test_production_profile_applies_pragmas(tmp_path):
+    engine = create_storage_engine(f"sqlite:///{tmp_path}/tuned.db", profile="production")
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -65536
+    engine.dispose()
+
+
+def test_default_profile_leaves_sqlite_defaults(tmp_path):
+    engine = create_storage_engine(f"sqlite:///{tmp_path}/plain.db", profile="default")
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    engine.dispose()
+
+
+def test_pragma_overrides_and_unknown_profile(monkeypatch):
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT_MS", "250")
+
+    assert storage_pragmas("production")["busy_timeout"] == "250"
+    with pytest.raises(ValueError):
+        storage_pragmas("turbo")
+
+
+def test_migrate_upgrades_an_existing_database(tmp_path):
+    engine = create_storage_engine(f"sqlite:///{tmp_path}/legacy.db", profile="default")
+    with engine.begin() as connection:
+        # alert_rules as created by the first release: no composite indexes, no delivery_channel
+        connection.execute(text(
+            "CREATE TABLE alert_rules (id INTEGER PRIMARY KEY, user_id VARCHAR, metric_type VARCHAR, "
+            "threshold_value FLOAT, condition VARCHAR, is_active BOOLEAN)"
+        ))
+        connection.execute(text("CREATE INDEX ix_alert_rules_user_id ON alert_rules (user_id)"))
+        connection.execute(text(
+            "INSERT INTO alert_rules (user_id, metric_type, threshold_value, condition, is_active) "
+            "VALUES ('user1', 'temperature', 30.0, 'GREATER_THAN', 1)"
+        ))
+
+    migrate(engine)
+    migrate(engine)  # a second run finds nothing to do
+
+    inspector = inspect(engine)
+    assert "delivery_channel" in {column["name"] for column in inspector.get_columns("alert_rules")}
+    indexes = {index["name"] for index in inspector.get_indexes("alert_rules")}
+    assert {"ix_alert_rules_user_metric_active", "ix_alert_rules_metric_active"} <= indexes
+    # Superseded by ix_alert_rules_user_metric_active
+    assert "ix_alert_rules_user_id" not in indexes
+    assert "alert_delivery_jobs" in inspector.get_table_names()
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT user_id, aggregation FROM alert_rules")).one() == ("user1", "VALUE")
+    engine.dispose()
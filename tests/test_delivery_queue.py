@@ -0,0 +1,200 @@
+import asyncio
+import time
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from models import AlertDeliveryJobModel, AlertStateModel, Condition, DeliveryStatus
+from services.alert_delivery import AlertDeliveryService
+from services.alert_history import alert_history
+from services.alert_state import alert_state
+from services.delivery_queue import DeliveryQueue, retry_delay, _claim_due_jobs, _complete_jobs, _next_due_at
+from services.rule_index import CachedRule
+
+RULE = CachedRule(
+    id=1,
+    user_id="test@example.com",
+    metric_type="battery_capacity",
+    threshold_value=20.0,
+    condition=Condition.LESS_THAN.value,
+    delivery_channel="EMAIL",
+)
+
+
+def make_sender():
+    sender = MagicMock()
+    sender.deliver = AsyncMock()
+    sender.deliver_batch = AsyncMock()
+    sender.email_recipient = AlertDeliveryService.email_recipient
+    return sender
+
+
+def make_job(job_id, user_id, channel="EMAIL"):
+    return AlertDeliveryJobModel(id=job_id, user_id=user_id, delivery_channel=channel, actual_value=1.0, attempts=0)
+
+
+async def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if await predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_retry_delay_backs_off_exponentially():
+    assert [retry_delay(n, base=5, maximum=30) for n in range(1, 6)] == [5, 10, 20, 30, 30]
+
+
+@pytest.mark.asyncio
+async def test_enqueue_persists_jobs(session_local, db_session):
+    queue = DeliveryQueue(AsyncMock())
+    await queue.enqueue_many([(RULE, 10.0), (RULE, 12.0)])
+
+    jobs = db_session.query(AlertDeliveryJobModel).order_by(AlertDeliveryJobModel.id).all()
+    assert [job.actual_value for job in jobs] == [10.0, 12.0]
+    assert all(job.status == DeliveryStatus.PENDING for job in jobs)
+    assert jobs[0].rule_id == 1
+    assert jobs[0].condition == "LESS_THAN"
+    assert alert_history.pending() == 2
+
+
+@pytest.mark.asyncio
+async def test_coordinated_workers_share_the_cooldown(session_local, db_session):
+    # Two workers evaluated the same breach; their own alert state let both notify
+    first, second = DeliveryQueue(AsyncMock()), DeliveryQueue(AsyncMock())
+    with patch("services.delivery_queue.coordinator.mode", "sqlite"), \
+         patch("services.delivery_queue.alert_state.cooldown", 600):
+        await first.enqueue_many([(RULE, 10.0)])
+        sent_at = db_session.query(AlertStateModel.last_sent_at).scalar()
+        await second.enqueue_many([(RULE, 11.0)])
+        assert db_session.query(AlertDeliveryJobModel).count() == 1
+        # The suppressed worker's cooldown runs from the first notification
+        assert alert_state._firing[RULE.id][2] == sent_at
+
+        # Once the cooldown has passed, either worker notifies again
+        db_session.query(AlertStateModel).update({AlertStateModel.last_sent_at: time.time() - 601})
+        db_session.commit()
+        await second.enqueue_many([(RULE, 12.0)])
+
+    assert [job.actual_value for job in db_session.query(AlertDeliveryJobModel).order_by(AlertDeliveryJobModel.id)] == [10.0, 12.0]
+    assert alert_history.pending() == 2
+
+
+def test_claim_is_exclusive(session_local, db_session):
+    db_session.add(AlertDeliveryJobModel(rule_id=1, status=DeliveryStatus.PENDING.value, attempts=0, next_attempt_at=0))
+    db_session.commit()
+
+    now = time.time()
+    assert len(_claim_due_jobs(db_session, 10, now, 60)) == 1
+    assert _claim_due_jobs(db_session, 10, now, 60) == []
+    # An expired claim is handed out again
+    assert len(_claim_due_jobs(db_session, 10, now + 61, 60)) == 1
+
+
+def test_emails_wait_for_the_digest_window(session_local, db_session):
+    now = time.time()
+    for channel, created_at in (("EMAIL", now - 1), ("DASHBOARD", now), ("EMAIL", now)):
+        db_session.add(AlertDeliveryJobModel(
+            rule_id=1, delivery_channel=channel, status=DeliveryStatus.PENDING.value,
+            attempts=0, next_attempt_at=created_at, created_at=created_at,
+        ))
+    db_session.commit()
+
+    # Dashboard alerts go out right away; emails wait until the oldest is 2s old
+    assert [job.delivery_channel for job in _claim_due_jobs(db_session, 10, now, 60, 2)] == ["DASHBOARD"]
+    assert _next_due_at(db_session, now, 2) == pytest.approx(now + 1)
+
+    # Then the whole burst is claimed together, however busy the queue was meanwhile
+    jobs = _claim_due_jobs(db_session, 10, now + 1, 60, 2)
+    assert [job.delivery_channel for job in jobs] == ["EMAIL", "EMAIL"]
+
+
+def test_split_units_groups_emails_by_recipient():
+    queue = DeliveryQueue(make_sender())
+    jobs = [make_job(i, f"user{i % 150}@example.com") for i in range(300)]
+    jobs.append(make_job(300, "user1", channel="DASHBOARD"))
+
+    units = queue.split_units(jobs)
+
+    assert [len(unit) for unit in units] == [1, 200, 100]
+    assert units[0][0].id == 300
+    assert len({job.user_id for job in units[1]}) == 100
+    assert len({job.user_id for job in units[2]}) == 50
+
+
+@pytest.mark.asyncio
+async def test_workers_deliver_and_remove_jobs(session_local):
+    sender = make_sender()
+    queue = DeliveryQueue(sender, workers=2, digest_window=0.05)
+    await queue.start()
+    try:
+        await queue.enqueue_many([(RULE, 10.0), (RULE, 11.0), (RULE, 12.0)])
+
+        async def drained():
+            return await queue.pending_count() == 0 and sender.deliver_batch.await_count == 1
+
+        await wait_until(drained)
+    finally:
+        await queue.stop()
+
+    [(alerts,), _] = sender.deliver_batch.await_args
+    assert sorted(value for _, value in alerts) == [10.0, 11.0, 12.0]
+    assert alerts[0][0].user_id == "test@example.com"
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_is_retried_then_dead_lettered(session_local, db_session):
+    sender = make_sender()
+    sender.deliver_batch.side_effect = Exception("Resend down")
+    queue = DeliveryQueue(sender, workers=1, max_attempts=2)
+    await queue.enqueue(RULE, 10.0)
+
+    job = _claim_due_jobs(db_session, 1, time.time(), 60)[0]
+    await queue._deliver([job])
+    db_session.expire_all()
+    job = db_session.query(AlertDeliveryJobModel).one()
+    assert job.status == DeliveryStatus.PENDING
+    assert job.attempts == 1
+    assert job.last_error == "Resend down"
+    assert job.next_attempt_at > time.time()
+
+    job = _claim_due_jobs(db_session, 1, job.next_attempt_at, 60)[0]
+    await queue._deliver([job])
+    db_session.expire_all()
+    job = db_session.query(AlertDeliveryJobModel).one()
+    assert job.status == DeliveryStatus.DEAD
+    assert job.attempts == 2
+
+
+def test_stale_claimant_cannot_complete_reclaimed_job(session_local, db_session):
+    db_session.add(AlertDeliveryJobModel(rule_id=1, status=DeliveryStatus.PENDING.value, attempts=0, next_attempt_at=0))
+    db_session.commit()
+    now = time.time()
+    stale = _claim_due_jobs(db_session, 1, now, 60)[0]
+    stale_token = stale.claimed_by
+    _claim_due_jobs(db_session, 1, now + 61, 60)
+
+    _complete_jobs(db_session, [stale.id], stale_token)
+
+    assert db_session.query(AlertDeliveryJobModel).count() == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_bookkeeping_errors(session_local):
+    sender = make_sender()
+    queue = DeliveryQueue(sender, workers=1, digest_window=0)
+    await queue.start()
+    try:
+        with patch("services.delivery_queue._complete_jobs", side_effect=Exception("database is locked")):
+            await queue.enqueue(RULE, 10.0)
+            await wait_until(lambda: _awaited(sender.deliver_batch, 1))
+        # The claim of the first job has not expired, so only the new job is sent
+        await queue.enqueue(RULE, 11.0)
+        await wait_until(lambda: _awaited(sender.deliver_batch, 2))
+    finally:
+        await queue.stop()
+    assert sender.deliver_batch.await_args[0][0][0][1] == 11.0
+
+
+async def _awaited(mock, count):
+    return mock.await_count >= count
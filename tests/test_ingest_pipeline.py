@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from models import AlertRuleModel
+from services.alert_state import AlertStateTable
+from services.evaluation import evaluate_points
+from services.ingest_pipeline import MicroBatcher
+from services.rule_index import RuleIndex
+from services.windowed_rules import RollingWindows
+
+
+def make_index(user_id):
+    index = RuleIndex()
+    index.add_many([
+        AlertRuleModel(id=1, user_id=user_id, metric_type="temperature", threshold_value=30.0,
+                       condition="GREATER_THAN", delivery_channel="EMAIL", is_active=True),
+        AlertRuleModel(id=2, user_id=user_id, metric_type="grid_power", threshold_value=100.0,
+                       condition="GREATER_THAN", delivery_channel="EMAIL", is_active=True,
+                       aggregation="AVG", window_seconds=60.0),
+    ])
+    return index
+
+
+def test_evaluate_points_keeps_input_order_within_groups():
+    index, state, windows = make_index("user1"), AlertStateTable(cooldown=3600), RollingWindows()
+    points = [
+        ("grid_power", 50.0, 0.0, "user1"),
+        ("temperature", 35.0, 0.0, "user1"),
+        ("grid_power", 200.0, 10.0, "user1"),
+        ("battery_capacity", 5.0, 10.0, "user1"),
+        ("temperature", 20.0, 10.0, "user1"),
+    ]
+
+    alerts = []
+    results = evaluate_points(points, alerts, index, state, windows)
+
+    assert [[rule.id for rule in violated] for violated in results] == [[], [1], [2], [], []]
+    # The average only reaches 125 because the first grid_power point came first
+    assert sorted((rule.id, value) for rule, value in alerts) == [(1, 35.0), (2, 125.0)]
+
+
+@pytest.mark.asyncio
+async def test_stop_evaluates_waiting_points_and_waits_for_running_batches():
+    batcher = MicroBatcher(window_ms=60000, max_size=100, index=make_index("pipeline-stop-user"))
+    release = asyncio.Event()
+
+    async def slow_enqueue(alerts):
+        await release.wait()
+
+    with patch("services.ingest_pipeline.delivery_queue.enqueue_many", side_effect=slow_enqueue), \
+         patch("services.evaluation.alert_state", AlertStateTable(cooldown=3600)):
+        first = asyncio.create_task(batcher.submit(("temperature", 35.0, 0.0, "pipeline-stop-user")))
+        while not batcher._processing:
+            await asyncio.sleep(0)
+        # Waits for the window, since a batch is being processed
+        second = asyncio.create_task(batcher.submit(("temperature", 40.0, 1.0, "pipeline-stop-user")))
+        await asyncio.sleep(0)
+        assert batcher.pending() == 1
+
+        stopping = asyncio.create_task(batcher.stop())
+        await asyncio.sleep(0.01)
+        assert not stopping.done()
+        release.set()
+        await asyncio.wait_for(stopping, 1)
+
+    assert batcher.pending() == 0
+    assert not batcher._tasks
+    assert [rule.id for rule in await first] == [1]
+    assert [rule.id for rule in await second] == [1]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_points_share_one_batch():
+    batcher = MicroBatcher(window_ms=50, max_size=100, index=make_index("pipeline-user1"))
+    with patch("services.ingest_pipeline.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
+        results = await asyncio.gather(
+            batcher.submit(("temperature", 35.0, 0.0, "pipeline-user1")),
+            batcher.submit(("temperature", 10.0, 0.0, "pipeline-user1")),
+            batcher.submit(("temperature", 40.0, 1.0, "pipeline-user2")),
+        )
+
+    assert [[rule.id for rule in violated] for violated in results] == [[1], [], []]
+    mock_enqueue.assert_awaited_once()
+    [(rule, value)] = mock_enqueue.call_args[0][0]
+    assert (rule.id, value) == (1, 35.0)
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_before_the_window_ends():
+    batcher = MicroBatcher(window_ms=60000, max_size=2, index=RuleIndex())
+    with patch("services.ingest_pipeline.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
+        results = await asyncio.wait_for(asyncio.gather(
+            batcher.submit(("temperature", 35.0, 0.0, "pipeline-user3")),
+            batcher.submit(("temperature", 36.0, 0.0, "pipeline-user3")),
+        ), 1)
+
+    assert results == [[], []]
+    assert batcher.pending() == 0
+    mock_enqueue.assert_awaited_once_with([])
+
+
+@pytest.mark.asyncio
+async def test_idle_pipeline_does_not_wait_for_the_window():
+    batcher = MicroBatcher(window_ms=60000, max_size=100, index=make_index("pipeline-user6"))
+    with patch("services.ingest_pipeline.delivery_queue.enqueue_many", new_callable=AsyncMock):
+        violated = await asyncio.wait_for(batcher.submit(("temperature", 35.0, 0.0, "pipeline-user6")), 1)
+
+    assert [rule.id for rule in violated] == [1]
+
+
+@pytest.mark.asyncio
+async def test_queue_failure_is_raised_to_every_submitter():
+    batcher = MicroBatcher(window_ms=10, max_size=100, index=make_index("pipeline-user4"))
+    with patch(
+        "services.ingest_pipeline.delivery_queue.enqueue_many",
+        new_callable=AsyncMock,
+        side_effect=RuntimeError("database is locked"),
+    ):
+        results = await asyncio.gather(
+            batcher.submit(("temperature", 35.0, 0.0, "pipeline-user4")),
+            batcher.submit(("temperature", 36.0, 0.0, "pipeline-user4")),
+            return_exceptions=True,
+        )
+
+    assert [str(result) for result in results] == ["database is locked"] * 2
+
+
+@pytest.mark.asyncio
+async def test_zero_window_evaluates_each_point_on_its_own():
+    batcher = MicroBatcher(window_ms=0, index=make_index("pipeline-user5"))
+    assert not batcher.enabled
+    with patch("services.ingest_pipeline.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
+        violated = await batcher.submit(("temperature", 35.0, 0.0, "pipeline-user5"))
+
+    assert [rule.id for rule in violated] == [1]
+    mock_enqueue.assert_awaited_once()
+    assert batcher.pending() == 0
@@ -1,5 +1,7 @@
+import pytest
 from unittest.mock import patch, AsyncMock
 from models import Condition
+from routers.ingestion import _iter_lines
 
 def test_ingest_data_triggers_alert(client):
     # Create a rule
@@ -14,8 +16,8 @@ def test_ingest_data_triggers_alert(client):
         }
     )
     
-    # We need to patch the method on the instance that is already created in routers.ingestion
-    with patch("routers.ingestion.alert_delivery_service.send_alert", new_callable=AsyncMock) as mock_send_alert:
+    # Patch the queue instance that routers.ingestion enqueues alerts on
+    with patch("routers.ingestion.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
         response = client.post(
             "/alert/api/v1/data/ingest",
             json={
@@ -28,12 +30,11 @@ def test_ingest_data_triggers_alert(client):
         assert response.status_code == 200
         
         # Verify the mock was called
-        mock_send_alert.assert_called_once()
+        mock_enqueue.assert_called_once()
         
         # Verify arguments
-        args, _ = mock_send_alert.call_args
-        rule = args[0]
-        value = args[1]
+        args, _ = mock_enqueue.call_args
+        [(rule, value)] = args[0]
         assert rule.user_id == "user1"
         assert value == 35.0
 
@@ -50,7 +51,7 @@ def test_ingest_data_no_alert(client):
         }
     )
     
-    with patch("routers.ingestion.alert_delivery_service.send_alert", new_callable=AsyncMock) as mock_send_alert:
+    with patch("routers.ingestion.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
         response = client.post(
             "/alert/api/v1/data/ingest",
             json={
@@ -61,4 +62,113 @@ def test_ingest_data_no_alert(client):
             }
         )
         assert response.status_code == 200
-        mock_send_alert.assert_not_called()
+        mock_enqueue.assert_called_once_with([])
+
+def test_ingest_data_rejects_invalid_body(client):
+    response = client.post(
+        "/alert/api/v1/data/ingest",
+        json={"user_id": "user1", "metric_type": "temperature", "timestamp": "2023-10-27T10:00:00"},
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "value"]
+
+    response = client.post("/alert/api/v1/data/ingest", content=b"{not json")
+    assert response.status_code == 422
+
+def test_ingest_batch_json_array_reports_per_item_results(client):
+    rule_id = client.post(
+        "/alert/api/v1/rules",
+        json={
+            "user_id": "user1",
+            "metric_type": "temperature",
+            "threshold_value": 30.0,
+            "condition": "GREATER_THAN",
+            "delivery_channel": "EMAIL"
+        }
+    ).json()["id"]
+
+    with patch("routers.ingestion.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
+        response = client.post(
+            "/alert/api/v1/data/ingest/batch",
+            json=[
+                {"user_id": "user1", "metric_type": "temperature", "value": 35.0, "timestamp": "2023-10-27T10:00:00"},
+                {"user_id": "user1", "metric_type": "temperature", "value": 25.0, "timestamp": "2023-10-27T10:01:00"},
+                {"user_id": "user1", "metric_type": "temperature", "timestamp": "2023-10-27T10:02:00"},
+            ]
+        )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+    assert body["results"][0] == {"index": 0, "status": "accepted", "violated_rule_ids": [rule_id]}
+    assert body["results"][1] == {"index": 1, "status": "accepted", "violated_rule_ids": []}
+    assert body["results"][2]["status"] == "rejected"
+    assert "value" in body["results"][2]["reason"]
+    [(rule, value)] = mock_enqueue.call_args[0][0]
+    assert (rule.id, value) == (rule_id, 35.0)
+
+def test_ingest_batch_ndjson(client):
+    client.post(
+        "/alert/api/v1/rules",
+        json={
+            "user_id": "user1",
+            "metric_type": "temperature",
+            "threshold_value": 30.0,
+            "condition": "GREATER_THAN",
+            "delivery_channel": "EMAIL"
+        }
+    )
+    lines = [
+        '{"user_id": "user1", "metric_type": "temperature", "value": 31.0, "timestamp": "2023-10-27T10:00:00"}',
+        "",
+        "not json",
+        '{"user_id": "user1", "metric_type": "temperature", "value": 32.0, "timestamp": "2023-10-27T10:01:00"}',
+    ]
+
+    with patch("routers.ingestion.delivery_queue.enqueue_many", new_callable=AsyncMock) as mock_enqueue:
+        response = client.post(
+            "/alert/api/v1/data/ingest/batch",
+            content="\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    body = response.json()
+    assert body["accepted"] == 2
+    assert [result["status"] for result in body["results"]] == ["accepted", "rejected", "accepted"]
+    assert body["results"][1]["reason"].startswith("Invalid JSON")
+    assert [len(result.get("violated_rule_ids", [])) for result in body["results"]] == [1, 0, 1]
+    # The second breach of the same rule falls inside the alert cooldown
+    assert [value for _, value in mock_enqueue.call_args[0][0]] == [31.0]
+
+def test_ingest_batch_stops_reading_at_the_item_limit(client):
+    lines = [
+        f'{{"user_id": "user1", "metric_type": "temperature", "value": {value}, "timestamp": "2023-10-27T10:00:00"}}'
+        for value in range(5)
+    ]
+
+    with patch("routers.ingestion.INGEST_BATCH_MAX_ITEMS", 2), \
+         patch("routers.ingestion.delivery_queue.enqueue_many", new_callable=AsyncMock):
+        response = client.post(
+            "/alert/api/v1/data/ingest/batch",
+            content="\n".join(lines),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    body = response.json()
+    assert body["accepted"] == 2
+    assert body["rejected"] == 1
+    assert body["results"][2]["index"] == 2
+    assert body["results"][2]["reason"].startswith("Batch limit of 2 items exceeded")
+
+@pytest.mark.asyncio
+async def test_iter_lines_joins_lines_split_across_chunks():
+    async def chunks():
+        for chunk in (b"ab", b"c\nd", b"", b"e\n\nf", b"gh"):
+            yield chunk
+
+    assert [line async for line in _iter_lines(chunks())] == [b"abc", b"de", b"", b"fgh"]
+
+def test_ingest_batch_rejects_non_array_body(client):
+    response = client.post("/alert/api/v1/data/ingest/batch", json={"user_id": "user1"})
+    assert response.status_code == 400
@@ -0,0 +1,29 @@
+import pytest
+from unittest.mock import patch
+
+from services import json_codec
+from services.json_codec import FastJSONResponse
+
+
+def test_round_trip_with_and_without_orjson():
+    payload = {"metric_type": "grid_power", "value": 1.5, "ids": [1, 2], "label": "Wärme", "window": None}
+    encoded = json_codec.dumps(payload)
+    with patch("services.json_codec.orjson", None):
+        fallback = json_codec.dumps(payload)
+        assert json_codec.loads(encoded) == payload
+
+    assert encoded == fallback
+    assert json_codec.loads(fallback.decode("utf-8")) == payload
+
+
+def test_invalid_json_raises_value_error():
+    for codec in (json_codec.orjson, None):
+        with patch("services.json_codec.orjson", codec):
+            with pytest.raises(ValueError):
+                json_codec.loads(b"{not json")
+
+
+def test_fast_response_renders_compact_json():
+    response = FastJSONResponse([{"id": 1}], headers={"X-Next-After-Id": "1"})
+    assert response.body == b'[{"id":1}]'
+    assert response.headers["X-Next-After-Id"] == "1"
@@ -0,0 +1,99 @@
+import json
+import logging
+import queue
+import threading
+
+import pytest
+
+from services.log_config import (
+    DeferredQueueHandler, JsonFormatter, SamplingFilter, configure_logging, sampled, stop_logging,
+)
+
+
+class CaptureHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def make_record(msg, args=(), extra=None):
+    logger = logging.getLogger("tests.log_config.records")
+    return logger.makeRecord(logger.name, logging.INFO, __file__, 1, msg, args, None, extra=extra)
+
+
+def test_sampling_thins_out_each_template_separately():
+    sampling = SamplingFilter(0.25)
+    kept = [sampling.filter(make_record("Polling %s", ("Kostal",), sampled())) for _ in range(8)]
+    other = [sampling.filter(make_record("%s data unchanged", ("Kostal",), sampled())) for _ in range(4)]
+
+    assert kept == [True, False, False, False] * 2
+    assert other == [True, False, False, False]
+    assert all(sampling.filter(make_record("Rule index loaded")) for _ in range(4))
+    assert not SamplingFilter(0).filter(make_record("Polling %s", ("Kostal",), sampled()))
+
+
+def test_json_formatter_emits_extra_fields():
+    line = JsonFormatter().format(make_record("Fetched %s", ("Kostal",), sampled(source="Kostal", bytes=12)))
+
+    entry = json.loads(line)
+    assert entry["message"] == "Fetched Kostal"
+    assert entry["level"] == "INFO"
+    assert (entry["source"], entry["bytes"]) == ("Kostal", 12)
+    assert "sampled" not in entry
+
+
+def test_async_mode_formats_on_the_listener_thread():
+    name = "tests.log_config.async"
+    logger = logging.getLogger(name)
+    capture = CaptureHandler()
+    logger.addHandler(capture)
+    formatted_on = []
+
+    class Payload:
+        def __str__(self):
+            formatted_on.append(threading.current_thread())
+            return "payload"
+
+    try:
+        configure_logging(mode="async", log_format="text", sample_rate=1, name=name)
+        assert isinstance(logger.handlers[0], DeferredQueueHandler)
+        logger.info("Fetched %s", Payload())
+    finally:
+        stop_logging(name)
+
+    assert capture.lines == ["Fetched payload"]
+    assert formatted_on and formatted_on[0] is not threading.current_thread()
+    # Stopping gives the logger its handlers back
+    assert logger.handlers == [capture]
+    logger.removeHandler(capture)
+
+
+def test_full_queue_drops_records():
+    handler = DeferredQueueHandler(queue.Queue(1))
+    handler.handle(make_record("queued"))
+    handler.handle(make_record("dropped"))
+
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().msg == "queued"
+
+
+def test_stop_waits_for_room_in_a_full_queue():
+    name = "tests.log_config.full"
+    logger = logging.getLogger(name)
+    capture = CaptureHandler()
+    logger.addHandler(capture)
+    configure_logging(mode="async", log_format="text", sample_rate=1, queue_size=1, name=name)
+    for index in range(50):
+        logger.info("line %d", index)
+    stop_logging(name)
+
+    assert capture.lines[0] == "line 0"
+    logger.removeHandler(capture)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        configure_logging(mode="fast", name="tests.log_config.invalid")
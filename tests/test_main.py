@@ -0,0 +1,27 @@
+import pytest
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+
+from main import app
+
+
+def test_ready_only_after_startup(client):
+    response = client.get("/alert/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ready"}
+
+
+def test_invalid_poll_sources_fail_startup():
+    app.state.ready = False
+    with patch.dict("os.environ", {"POLL_SOURCES": '[{"name": "Roof", "url": "http://roof", "adapter": "xml"}]'}):
+        with pytest.raises(ValueError, match="Unknown payload adapter"):
+            with TestClient(app):
+                pass
+    assert not app.state.ready
+
+
+def test_not_ready_before_startup():
+    # Without the context manager the lifespan never runs
+    app.state.ready = False
+    response = TestClient(app).get("/alert/ready")
+    assert response.status_code == 503
@@ -0,0 +1,76 @@
+import pytest
+
+from services.metrics import MetricsRegistry, _Metric
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ["endpoint"])
+    gauge = registry.gauge("depth", "Depth.")
+
+    counter.labels("ingest").inc()
+    counter.labels("ingest").inc(2)
+    counter.labels('we"ird').inc()
+    gauge.set(7)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{endpoint="ingest"} 3' in text
+    assert 'requests_total{endpoint="we\\"ird"} 1' in text
+    assert "depth 7" in text
+
+
+def test_special_float_values_use_prometheus_names():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("level", "Level.", ["kind"])
+
+    gauge.labels("high").set(float("inf"))
+    gauge.labels("low").set(float("-inf"))
+    gauge.labels("unknown").set(float("nan"))
+
+    text = registry.render()
+    assert 'level{kind="high"} +Inf' in text
+    assert 'level{kind="low"} -Inf' in text
+    assert 'level{kind="unknown"} NaN' in text
+
+
+def test_metric_families_must_make_children():
+    with pytest.raises(TypeError):
+        _Metric("base", "Base.")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", ["source"], buckets=(0.1, 1.0))
+    child = histogram.labels("Kostal")
+    for value in (0.05, 0.1, 0.5, 3.0):
+        child.observe(value)
+
+    text = registry.render()
+    assert 'latency_seconds_bucket{source="Kostal",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{source="Kostal",le="1"} 3' in text
+    assert 'latency_seconds_bucket{source="Kostal",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{source="Kostal"} 3.65' in text
+    assert 'latency_seconds_count{source="Kostal"} 4' in text
+
+
+def test_metrics_endpoint_exposes_hot_path_metrics(client):
+    client.post("/alert/api/v1/data/ingest", json={"user_id": "user1"})
+    client.post(
+        "/alert/api/v1/data/ingest",
+        json={
+            "user_id": "user1",
+            "metric_type": "temperature",
+            "value": 25.0,
+            "timestamp": "2023-10-27T10:00:00"
+        }
+    )
+
+    response = client.get("/alert/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'alerting_ingest_requests_total{endpoint="ingest",status="ok"}' in response.text
+    assert 'alerting_ingest_requests_total{endpoint="ingest",status="rejected"}' in response.text
+    assert 'alerting_rule_evaluation_seconds_count{path="ingest"}' in response.text
+    assert "alerting_delivery_queue_depth 0" in response.text
@@ -0,0 +1,48 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+
+from services.poll_sources import PollSource, load_poll_sources
+
+
+def test_defaults_to_kostal_and_fronius():
+    with patch.dict(os.environ, {}, clear=True):
+        sources = load_poll_sources()
+
+    assert [source.name for source in sources] == ["Kostal", "Fronius"]
+    assert all(source.adapter == "realtime_data" for source in sources)
+
+
+def test_reads_sources_from_env():
+    config = [
+        {"name": "Roof", "url": "http://roof/data", "interval_seconds": 5, "timeout_seconds": 2, "adapter": "flat"},
+        {"name": "Garage", "url": "http://garage/data"},
+    ]
+    with patch.dict(os.environ, {"POLL_SOURCES": json.dumps(config)}):
+        roof, garage = load_poll_sources()
+
+    assert (roof.interval_seconds, roof.timeout_seconds, roof.adapter) == (5, 2, "flat")
+    assert garage.url == "http://garage/data"
+
+
+def test_reads_sources_from_file(tmp_path):
+    path = tmp_path / "sources.json"
+    path.write_text(json.dumps([{"name": "Roof", "url": "http://roof/data"}]))
+
+    with patch.dict(os.environ, {"POLL_SOURCES_FILE": str(path)}):
+        [source] = load_poll_sources()
+
+    assert source.name == "Roof"
+
+
+def test_rejects_unknown_adapter():
+    config = [{"name": "Roof", "url": "http://roof/data", "adapter": "missing"}]
+    with patch.dict(os.environ, {"POLL_SOURCES": json.dumps(config)}):
+        with pytest.raises(ValueError):
+            load_poll_sources()
+
+
+def test_flat_adapter_wraps_values():
+    source = PollSource(name="Roof", url="http://roof/data", adapter="flat")
+    assert source.adapt({"battery_capacity": 70}) == {"realtime_data": {"battery_capacity": {"value": 70}}}
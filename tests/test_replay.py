@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from benchmarks.replay import Replay, load_rules_database, load_rules_file, main, replay
+
+RULES = [
+    {"user_id": "u1", "metric_type": "battery_capacity", "threshold_value": 20, "condition": "LESS_THAN", "delivery_channel": "EMAIL"},
+    {"user_id": "u2", "expression": "battery_capacity < 30 AND grid_power > 2000", "delivery_channel": "EMAIL"},
+]
+
+
+def data_point(value, timestamp, user_id="u1"):
+    return json.dumps({"user_id": user_id, "metric_type": "battery_capacity", "value": value, "timestamp": timestamp})
+
+
+def payload(battery, grid, **extra):
+    return json.dumps({"realtime_data": {"battery_capacity": {"value": battery}, "grid_power": {"value": grid}}, **extra})
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES))
+    return str(path)
+
+
+def test_data_points_use_recorded_time_for_cooldowns(rules_file):
+    index, compound = load_rules_file(rules_file)
+    lines = [
+        data_point(10, "2026-01-01T00:00:00Z"),
+        data_point(10, "2026-01-01T00:30:00Z"),
+        data_point(10, "2026-01-01T01:00:00Z"),
+        data_point(10, "2026-01-01T01:00:00Z", user_id="u2"),
+    ]
+
+    report = replay(lines, Replay(index, compound, cooldown=3600))
+
+    assert report["records"] == 4
+    assert report["points"] == 4
+    assert report["notifications"] == 2
+    [rule] = report["rules"]
+    assert rule["rule_id"] == 1
+    assert rule["violations"] == 3
+    assert rule["notifications"] == 2
+    assert rule["last_notified_at"] == "2026-01-01T01:00:00+00:00"
+
+
+def test_payloads_evaluate_threshold_and_compound_rules(rules_file):
+    index, compound = load_rules_file(rules_file)
+    lines = [payload(25, 3000, timestamp=100), payload(25, 1000), "", "not json", "[1, 2]"]
+
+    report = replay(lines, Replay(index, compound, interval=60))
+
+    assert report["records"] == 2
+    assert report["invalid_records"] == 2
+    assert report["points"] == 4
+    [rule] = report["rules"]
+    assert rule["rule_id"] == 2
+    assert rule["metric_type"] == "battery_capacity+grid_power"
+    assert rule["condition"] == "battery_capacity < 30 AND grid_power > 2000"
+    assert rule["notifications"] == 1
+    assert rule["first_notified_at"] == "1970-01-01T00:01:40+00:00"
+
+
+def test_flat_payloads_are_adapted(rules_file):
+    index, compound = load_rules_file(rules_file)
+
+    report = replay([json.dumps({"battery_capacity": 5, "grid_power": 0})], Replay(index, compound, adapter="flat"))
+
+    assert [rule["rule_id"] for rule in report["rules"]] == [1]
+
+
+def test_rules_are_read_from_the_database(client, db_session):
+    client.post("/alert/api/v1/rules", json=RULES[0])
+    client.post("/alert/api/v1/rules/compound", json=RULES[1])
+
+    index, compound = load_rules_database(str(db_session.get_bind().url))
+
+    assert len(index) == 1
+    assert len(compound) == 1
+
+
+def test_main_prints_and_writes_the_report(rules_file, tmp_path, capsys):
+    data = tmp_path / "data.ndjson"
+    data.write_text("\n".join([data_point(10, "2026-01-01T00:00:00Z"), payload(25, 3000)]) + "\n")
+    output = tmp_path / "report.json"
+
+    main([str(data), "--rules", rules_file, "--output", str(output)])
+
+    assert "2 records (0 invalid), 3 points" in capsys.readouterr().out
+    assert json.loads(output.read_text())["notifications"] == 2
@@ -0,0 +1,76 @@
+from conftest import make_rule
+from models import Condition, DeliveryChannel
+from services.rule_index import RuleIndex, rule_index
+
+
+def test_load_indexes_only_active_rules(db_session):
+    db_session.add_all([
+        make_rule(1, row=True), make_rule(2, user_id="user2", row=True), make_rule(3, is_active=False, row=True),
+    ])
+    db_session.commit()
+
+    index = RuleIndex()
+    index.load(db_session)
+
+    assert len(index) == 2
+    assert [rule.id for rule in index.rules_for("temperature", "user1")] == [1]
+    assert sorted(rule.id for rule in index.rules_for_metric("temperature")) == [1, 2]
+    assert index.rules_for("temperature", "user3") == ()
+
+
+def test_cached_rule_stores_plain_strings():
+    index = RuleIndex()
+    index.add(make_rule(1, row=True))
+
+    rule = index.rules_for("temperature", "user1")[0]
+    assert type(rule.condition) is str
+    assert rule.condition == Condition.GREATER_THAN
+    assert rule.delivery_channel == DeliveryChannel.EMAIL
+
+
+def test_add_replaces_and_remove_drops_rule():
+    index = RuleIndex()
+    index.add(make_rule(1, row=True))
+    index.add(make_rule(1, row=True))
+    index.add(make_rule(2, metric_type="humidity", row=True))
+    assert len(index.rules_for("temperature", "user1")) == 1
+
+    index.remove(1)
+    assert index.rules_for("temperature", "user1") == ()
+    assert index.rules_for_metric("temperature") == ()
+    assert len(index.rules_for_metric("humidity")) == 1
+
+    index.add(make_rule(2, metric_type="humidity", is_active=False, row=True))
+    assert len(index) == 0
+
+
+def test_warm_compiles_every_metric_and_user():
+    index = RuleIndex()
+    index.add_many([
+        make_rule(1, row=True), make_rule(2, user_id="user2", row=True), make_rule(3, metric_type="humidity", row=True),
+    ])
+    index.warm()
+
+    assert set(index._matchers) == {
+        "temperature", "humidity", ("temperature", "user1"), ("temperature", "user2"), ("humidity", "user1"),
+    }
+    matcher, _ = index.compiled("temperature", "user1")
+    assert index.compiled("temperature", "user1")[0] is matcher
+
+
+def test_rule_api_keeps_index_in_sync(client):
+    response = client.post(
+        "/alert/api/v1/rules",
+        json={
+            "user_id": "user1",
+            "metric_type": "temperature",
+            "threshold_value": 30.0,
+            "condition": "GREATER_THAN",
+            "delivery_channel": "EMAIL"
+        }
+    )
+    rule_id = response.json()["id"]
+    assert [rule.id for rule in rule_index.rules_for("temperature", "user1")] == [rule_id]
+
+    client.delete(f"/alert/api/v1/rules/{rule_id}")
+    assert rule_index.rules_for("temperature", "user1") == ()
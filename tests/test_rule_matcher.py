@@ -0,0 +1,63 @@
+import random
+
+from conftest import make_rule
+from models import AlertRuleModel, Condition
+from services.data_poller import evaluate_condition
+from services.rule_index import RuleIndex
+from services.rule_matcher import ThresholdMatcher
+
+
+def test_match_finds_violated_rules_per_condition():
+    matcher = ThresholdMatcher([
+        make_rule(1, metric_type="battery_capacity", threshold=20.0, condition=Condition.LESS_THAN),
+        make_rule(2, metric_type="battery_capacity", threshold=50.0, condition=Condition.LESS_THAN),
+        make_rule(3, metric_type="battery_capacity", threshold=40.0, condition=Condition.GREATER_THAN),
+        make_rule(4, metric_type="battery_capacity", threshold=30.0, condition=Condition.EQUALS),
+        make_rule(5, metric_type="battery_capacity", threshold=30.0, condition="UNKNOWN"),
+    ])
+
+    assert sorted(rule.id for rule in matcher.match(30.0)) == [2, 4]
+    assert sorted(rule.id for rule in matcher.match(10.0)) == [1, 2]
+    assert sorted(rule.id for rule in matcher.match(45.0)) == [2, 3]
+    # Thresholds themselves are not violated by strict comparisons
+    assert [rule.id for rule in matcher.match(50.0)] == [3]
+    assert matcher.match(float("nan")) == []
+
+
+def test_match_agrees_with_evaluate_condition():
+    conditions = [Condition.LESS_THAN, Condition.GREATER_THAN, Condition.EQUALS]
+    rng = random.Random(42)
+    rules = [
+        make_rule(i, metric_type="battery_capacity", threshold=float(rng.randint(0, 20)),
+                  condition=rng.choice(conditions))
+        for i in range(200)
+    ]
+    matcher = ThresholdMatcher(rules)
+
+    for value in [-1.0, 0.0, 5.5, 10.0, 20.0, 21.0]:
+        expected = {
+            rule.id for rule in rules
+            if evaluate_condition(value, rule.threshold_value, rule.condition)
+        }
+        assert {rule.id for rule in matcher.match(value)} == expected
+
+
+def test_index_match_is_scoped_by_user_and_tracks_changes():
+    index = RuleIndex()
+    for rule_id, user_id in [(1, "user1"), (2, "user2")]:
+        index.add(AlertRuleModel(
+            id=rule_id,
+            user_id=user_id,
+            metric_type="battery_capacity",
+            threshold_value=20.0,
+            condition=Condition.LESS_THAN,
+            delivery_channel="EMAIL",
+            is_active=True,
+        ))
+
+    assert {rule.id for rule in index.match("battery_capacity", 10.0)} == {1, 2}
+    assert [rule.id for rule in index.match("battery_capacity", 10.0, "user2")] == [2]
+    assert index.match("grid_power", 10.0) == []
+
+    index.remove(1)
+    assert [rule.id for rule in index.match("battery_capacity", 10.0)] == [2]
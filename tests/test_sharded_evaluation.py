@@ -0,0 +1,64 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from conftest import make_rule
+from services.data_poller import process_inverter_data
+from services.rule_index import RuleIndex
+from services.sharded_evaluation import ShardedEvaluator
+
+
+def test_small_payloads_stay_in_process():
+    assert not ShardedEvaluator(processes=0, min_metrics=1).should_shard(1000)
+    assert not ShardedEvaluator(processes=2, min_metrics=500).should_shard(499)
+    assert ShardedEvaluator(processes=2, min_metrics=500).should_shard(500)
+
+
+@pytest.mark.asyncio
+async def test_shards_match_like_the_index_and_reload_rule_changes():
+    index = RuleIndex()
+    index.add_many([
+        make_rule(metric, metric_type=f"metric_{metric}", threshold=float(metric), row=True) for metric in range(1, 21)
+    ])
+    index.add(make_rule(100, metric_type="metric_1", threshold=0.0, user_id="user2", row=True))
+    evaluator = ShardedEvaluator(processes=2, min_metrics=1, index=index)
+    samples = [(f"metric_{metric}", 10.5) for metric in range(1, 21)]
+    try:
+        matched = await evaluator.match(samples)
+        assert [sorted(rule.id for rule in rules) for rules in matched] == [
+            sorted(rule.id for rule in index.match(metric_type, value)) for metric_type, value in samples
+        ]
+        assert sorted(rule.id for rule in matched[0]) == [1, 100]
+        pool = evaluator._pool
+
+        index.remove(100)
+        matched = await evaluator.match(samples)
+        assert [rule.id for rule in matched[0]] == [1]
+        # The workers reload the rules instead of being replaced
+        assert evaluator._pool is pool
+    finally:
+        evaluator.stop()
+
+
+@pytest.mark.asyncio
+async def test_process_inverter_data_merges_shard_results_into_delivery():
+    index = RuleIndex()
+    index.add_many([
+        make_rule(1, metric_type="grid_power", threshold=100.0, row=True),
+        make_rule(2, metric_type="battery_capacity", threshold=20.0, condition="LESS_THAN", row=True),
+    ])
+    evaluator = ShardedEvaluator(processes=2, min_metrics=1, index=index)
+    queue = AsyncMock()
+    data = {"realtime_data": {
+        "grid_power": {"value": 150.0},
+        "battery_capacity": {"value": 50.0},
+        "pv_production": {"value": 10.0},
+    }}
+    try:
+        with patch("services.data_poller.rule_index", index), \
+             patch("services.data_poller.sharded_evaluator", evaluator):
+            assert await process_inverter_data(data, queue) == 2
+    finally:
+        evaluator.stop()
+
+    [(rule, value)] = queue.enqueue_many.call_args[0][0]
+    assert (rule.id, value) == (1, 150.0)
@@ -0,0 +1,130 @@
+import pytest
+
+from conftest import make_rule
+from models import AlertRuleModel
+from services.alert_state import AlertStateTable
+from services.evaluation import evaluate_metric
+from services.rule_index import RuleIndex
+from services.windowed_rules import RollingWindow, RollingWindows
+
+
+def test_rolling_window_aggregates_only_recent_samples():
+    window = RollingWindow(60)
+    for timestamp, value in [(0, 10.0), (30, 50.0), (60, 20.0), (90, 30.0)]:
+        window.add(timestamp, value)
+
+    # The sample at 30 was still current at the window start (90 - 60)
+    assert len(window) == 3
+    assert window.average() == pytest.approx(100.0 / 3)
+    assert window.minimum() == 20.0
+    assert window.maximum() == 50.0
+    assert window.rate_per_minute() == pytest.approx((30.0 - 50.0) / 60 * 60)
+
+
+def test_rolling_window_min_max_follow_evictions():
+    window = RollingWindow(10)
+    window.add(0, 1.0)
+    window.add(5, 9.0)
+    window.add(20, 5.0)
+
+    assert (window.minimum(), window.maximum()) == (5.0, 9.0)
+    window.add(40, 7.0)
+    assert (window.minimum(), window.maximum()) == (5.0, 7.0)
+
+
+def test_sustained_needs_a_covered_window():
+    window = RollingWindow(60)
+    window.add(0, 80.0)
+    window.add(30, 85.0)
+    assert window.sustained_minimum() is None
+
+    window.add(60, 90.0)
+    assert window.sustained_minimum() == 80.0
+
+
+def test_window_is_bounded_and_ignores_clock_going_back():
+    window = RollingWindow(3600, max_samples=3)
+    for timestamp in range(10):
+        window.add(timestamp, float(timestamp))
+    window.add(5, 100.0)
+
+    assert len(window) == 3
+    assert window.maximum() == 100.0
+
+
+def test_evaluate_metric_fires_windowed_rules_with_the_aggregate():
+    index, state, windows = RuleIndex(), AlertStateTable(cooldown=3600), RollingWindows()
+    index.add_many([
+        AlertRuleModel(id=1, user_id="user1", metric_type="grid_power", threshold_value=130.0,
+                       condition="GREATER_THAN", delivery_channel="EMAIL", is_active=True,
+                       aggregation="AVG", window_seconds=60.0),
+        AlertRuleModel(id=2, user_id="user1", metric_type="grid_power", threshold_value=150.0,
+                       condition="GREATER_THAN", delivery_channel="EMAIL", is_active=True),
+    ])
+
+    def evaluate(timestamp, value):
+        alerts = []
+        evaluate_metric("grid_power", value, timestamp, alerts, "user1", index, state, windows)
+        return [(rule.id, alert_value) for rule, alert_value in alerts]
+
+    # A single spike fires the VALUE rule but not the average
+    assert evaluate(0, 50.0) == []
+    assert evaluate(10, 200.0) == [(2, 200.0)]
+    # Rule 2 is still firing within its cooldown
+    assert evaluate(20, 180.0) == [(1, pytest.approx(430.0 / 3))]
+
+
+def test_evaluate_metric_rate_of_change_and_sustained_less_than():
+    index, state, windows = RuleIndex(), AlertStateTable(cooldown=0), RollingWindows()
+    for rule in [
+        make_rule(1, metric_type="grid_power", aggregation="RATE_OF_CHANGE", condition="LESS_THAN", threshold=-100.0,
+                  window_seconds=60.0),
+        make_rule(2, metric_type="grid_power", aggregation="SUSTAINED", condition="LESS_THAN", threshold=20.0,
+                  window_seconds=120.0),
+    ]:
+        index.add_many([AlertRuleModel(**rule._asdict(), is_active=True)])
+
+    fired = []
+    for timestamp, value in [(0, 500.0), (60, 300.0), (120, 10.0), (180, 15.0), (240, 12.0)]:
+        alerts = []
+        evaluate_metric("grid_power", value, timestamp, alerts, "user1", index, state, windows)
+        fired.append(sorted(rule.id for rule, _ in alerts))
+
+    # Falls 200/min, then 290/min; from t=120 the value stays below 20 for the full 120 s
+    assert fired == [[], [1], [1], [], [2]]
+
+
+def test_windows_of_removed_rules_are_dropped():
+    index, state, windows = RuleIndex(), AlertStateTable(cooldown=600), RollingWindows()
+    index.add_many([
+        make_rule(1, metric_type="grid_power", aggregation="AVG", window_seconds=60.0, row=True),
+        make_rule(2, metric_type="grid_power", aggregation="MAX", window_seconds=300.0, row=True),
+    ])
+    evaluate_metric("grid_power", 10.0, 0.0, [], "user1", index, state, windows)
+    evaluate_metric("grid_power", 10.0, 0.0, [], None, index, state, windows)
+    assert set(windows._windows[("user1", "grid_power")]) == {60.0, 300.0}
+
+    index.remove(2)
+    evaluate_metric("temperature", 10.0, 1.0, [], "user1", index, state, windows)
+    assert set(windows._windows[("user1", "grid_power")]) == {60.0}
+    assert set(windows._windows[(None, "grid_power")]) == {60.0}
+
+    index.remove(1)
+    evaluate_metric("temperature", 10.0, 2.0, [], "user1", index, state, windows)
+    assert windows._windows == {}
+
+
+def test_create_rule_requires_window_for_aggregations(client):
+    rule = {
+        "user_id": "user1",
+        "metric_type": "grid_power",
+        "threshold_value": 5000.0,
+        "condition": "GREATER_THAN",
+        "delivery_channel": "EMAIL",
+        "aggregation": "AVG",
+    }
+
+    assert client.post("/alert/api/v1/rules", json=rule).status_code == 422
+    response = client.post("/alert/api/v1/rules", json={**rule, "window_seconds": 300})
+    assert response.status_code == 200
+    assert (response.json()["aggregation"], response.json()["window_seconds"]) == ("AVG", 300.0)